@@ -0,0 +1,52 @@
+"""Benchmark the parsing of CL functions and CL parameter declarations.
+
+This compares the parsing time of a cold cache (first call) with that of a warm cache (all subsequent calls).
+Run as ``python examples/benchmark_cl_parsing.py``.
+"""
+import timeit
+
+from mot.lib.cl_function import SimpleCLFunction, SimpleCLFunctionParameter, _parse_cl_declaration
+from mot.lib.utils import _separate_cl_functions, _split_cl_function, parse_cl_function
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+_function = '''
+    double rosenbrock(local const mot_float_type* const x, void* data, local mot_float_type* objective_list){
+        double sum = 0;
+        for(uint i = 0; i < 9; i++){
+            sum += 100 * pown(x[i + 1] - pown(x[i], 2), 2) + pown(1 - x[i], 2);
+        }
+        return sum;
+    }
+'''
+
+_declarations = ['local const mot_float_type* const x', 'void* data', 'global float4* restrict vectors',
+                 'private double matrix[3][3]', 'uint nmr_parameters']
+
+
+def clear_caches():
+    _parse_cl_declaration.cache_clear()
+    _split_cl_function.cache_clear()
+    _separate_cl_functions.cache_clear()
+
+
+def time_cold_and_warm(name, func, repeats=200):
+    def cold():
+        clear_caches()
+        func()
+
+    cold_time = min(timeit.repeat(cold, number=1, repeat=repeats))
+    warm_time = min(timeit.repeat(func, number=1, repeat=repeats))
+    print('{:<30} cold: {:10.1f} us, warm: {:10.1f} us, speedup: {:8.1f}x'.format(
+        name, cold_time * 1e6, warm_time * 1e6, cold_time / warm_time))
+
+
+if __name__ == '__main__':
+    time_cold_and_warm('SimpleCLFunctionParameter', lambda: [SimpleCLFunctionParameter(d) for d in _declarations])
+    time_cold_and_warm('SimpleCLFunction.from_string', lambda: SimpleCLFunction.from_string(_function))
+    time_cold_and_warm('parse_cl_function', lambda: parse_cl_function(_function + _function.replace('rosen', 'r')))
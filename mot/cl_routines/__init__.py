@@ -111,3 +111,62 @@ def compute_objective_value(objective_func, parameters, data=None, cl_runtime_in
     """
     return objective_func.evaluate({'data': data, 'parameters': Array(parameters, 'mot_float_type', mode='r')},
                                    parameters.shape[0], use_local_reduction=True, cl_runtime_info=cl_runtime_info)
+
+
+def compute_fused(cl_functions, parameters, data=None, cl_runtime_info=None):
+    """Evaluate multiple CL functions over the same parameters and data in a single kernel launch.
+
+    This is typically used after optimization, to compute for example the objective function value, the
+    log likelihood and the log prior for every problem at once. Compared to evaluating every function separately,
+    this uploads the parameters and the data only once and uses one kernel for all functions.
+
+    Args:
+        cl_functions (List[mot.lib.cl_function.CLFunction]): the functions to evaluate. Each function should return
+            a scalar and should have as first and second argument the parameter vector and the data pointer. Any
+            additional arguments, like the ``objective_list`` of an objective function, are set to zero. Example
+            signatures:
+
+            .. code-block:: c
+
+                double <func_name>(local const mot_float_type* const x, void* data);
+                double <func_name>(local const mot_float_type* const x,
+                                   void* data,
+                                   local mot_float_type* objective_list);
+
+        parameters (ndarray): The parameters to use in the evaluation, an (d, p) matrix with d problems
+            and p parameters.
+        data (mot.lib.kernel_data.KernelData): the user provided data for the ``void* data`` pointer.
+        cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information
+
+    Returns:
+        List[ndarray]: per function, in the same order as the input, the vector with per problem the function value
+    """
+    output_names = ['output_{}'.format(ind) for ind in range(len(cl_functions))]
+
+    function_calls = []
+    for cl_function, output_name in zip(cl_functions, output_names):
+        call_args = ['parameters', 'data'] + ['0'] * (len(cl_function.get_parameters()) - 2)
+        function_calls.append('''
+            value = ''' + cl_function.get_cl_function_name() + '(' + ', '.join(call_args) + ''');
+            if(get_local_id(0) == 0){
+                *(''' + output_name + ''') = value;
+            }
+            barrier(CLK_LOCAL_MEM_FENCE);
+        ''')
+
+    compute_func = SimpleCLFunction.from_string('''
+        void compute_fused(local mot_float_type* parameters,
+                           void* data,
+                           ''' + ', '.join('global mot_float_type* ' + name for name in output_names) + '''){
+            double value;
+            ''' + '\n'.join(function_calls) + '''
+        }
+    ''', dependencies=cl_functions)
+
+    kernel_data = {'parameters': Array(parameters, 'mot_float_type', mode='r'),
+                   'data': data}
+    kernel_data.update({name: Zeros((parameters.shape[0],), 'mot_float_type') for name in output_names})
+
+    compute_func.evaluate(kernel_data, parameters.shape[0], use_local_reduction=True, cl_runtime_info=cl_runtime_info)
+
+    return [kernel_data[name].get_data() for name in output_names]
@@ -13,11 +13,15 @@ using :py:func:`config_context`. Example:
 
 """
 import collections.abc
+import threading
 from contextlib import contextmanager
 import numpy as np
 
+from mot.lib.kernel_data import BufferPool, ConversionCache
 from mot.lib.load_balancers import EvenDistribution, FractionalLoad
-from .lib.cl_environments import CLEnvironmentFactory
+from mot.lib.profiling import DeviceProfiler
+from mot.lib.program_cache import ProgramCache
+from .lib.cl_environments import CLEnvironment, CLEnvironmentFactory
 
 __author__ = 'Robbert Harms'
 __date__ = "2015-07-22"
@@ -29,21 +33,36 @@ __email__ = "robbert@xkls.nl"
 
 For any of the AbstractCLRoutines it holds that if no suitable defaults are given we use the ones provided by this
 module. This entire module acts as a singleton containing the current runtime configuration.
+
+The default CL environments are only loaded on first use, see :func:`get_cl_environments`.
 """
 _config = {
-    'cl_environments': CLEnvironmentFactory.smart_device_selection(preferred_device_type='GPU'),
+    'cl_environments': None,
     'compile_flags': ['-cl-denorms-are-zero', '-cl-mad-enable', '-cl-no-signed-zeros'],
     'double_precision': False,
-    'load_balancer': EvenDistribution()
+    'load_balancer': EvenDistribution(),
+    'program_cache': ProgramCache(),
+    'program_binary_cache': None,
+    'buffer_pool': BufferPool(),
+    'max_cached_conversion_size': 256 * 1024 ** 2,
+    'conversion_cache': ConversionCache(),
+    'tracer': None
 }
+_cl_environments_lock = threading.Lock()
 
 
 def get_cl_environments():
     """Get the current CL environment to use during CL calculations.
 
+    If no environments are set, this loads the default environments on first use.
+
     Returns:
         list of CLEnvironment: the current list of CL environments.
     """
+    if _config['cl_environments'] is None:
+        with _cl_environments_lock:
+            if _config['cl_environments'] is None:
+                _config['cl_environments'] = CLEnvironmentFactory.smart_device_selection(preferred_device_type='GPU')
     return _config['cl_environments']
 
 
@@ -147,6 +166,115 @@ def set_load_balancer(load_balancer):
     _config['load_balancer'] = load_balancer
 
 
+def get_program_cache():
+    """Get the process wide in-memory cache of compiled CL programs.
+
+    Returns:
+        mot.lib.program_cache.ProgramCache: the program cache shared by all CL functions
+    """
+    return _config['program_cache']
+
+
+def get_program_binary_cache():
+    """Get the on-disk cache for compiled CL programs.
+
+    The on-disk cache is disabled by default, to enable it set a cache using :func:`set_program_binary_cache`,
+    for example ``set_program_binary_cache(ProgramBinaryCache())`` to use the default cache directory.
+
+    Returns:
+        mot.lib.program_cache.ProgramBinaryCache: the current binary cache, or None if disabled.
+    """
+    return _config['program_binary_cache']
+
+
+def set_program_binary_cache(program_binary_cache):
+    """Set the on-disk cache for compiled CL programs.
+
+    Args:
+        program_binary_cache (mot.lib.program_cache.ProgramBinaryCache): the new binary cache,
+            set to None to disable the on-disk caching of compiled programs.
+    """
+    _config['program_binary_cache'] = program_binary_cache
+
+
+def get_buffer_pool():
+    """Get the pool of device buffers used by the kernel data.
+
+    Returns:
+        mot.lib.kernel_data.BufferPool: the current buffer pool, or None if the pooling is disabled.
+    """
+    return _config['buffer_pool']
+
+
+def set_buffer_pool(buffer_pool):
+    """Set the pool of device buffers used by the kernel data.
+
+    Args:
+        buffer_pool (mot.lib.kernel_data.BufferPool): the new buffer pool, set to None to disable pooling
+            and allocate a new buffer for every kernel data.
+    """
+    _config['buffer_pool'] = buffer_pool
+
+
+def get_max_cached_conversion_size():
+    """Get the maximum size of the data conversions cached by the kernel data, see :class:`mot.lib.kernel_data.Array`.
+
+    Returns:
+        int: the maximum size in bytes of a single cached conversion, 0 disables the caching.
+    """
+    return _config['max_cached_conversion_size']
+
+
+def set_max_cached_conversion_size(max_size):
+    """Set the maximum size of the data conversions cached by the kernel data.
+
+    Args:
+        max_size (int): the maximum size in bytes of a single cached conversion, set to 0 to disable the caching.
+    """
+    _config['max_cached_conversion_size'] = max_size
+
+
+def get_conversion_cache():
+    """Get the cache limiting the total size of the data conversions cached by the kernel data.
+
+    Use its ``clear()`` method to release all the cached conversions.
+
+    Returns:
+        mot.lib.kernel_data.ConversionCache: the current conversion cache, or None if the caching is disabled.
+    """
+    return _config['conversion_cache']
+
+
+def set_conversion_cache(conversion_cache):
+    """Set the cache limiting the total size of the data conversions cached by the kernel data.
+
+    Args:
+        conversion_cache (mot.lib.kernel_data.ConversionCache): the new conversion cache, set to None to disable
+            the caching of conversions.
+    """
+    _config['conversion_cache'] = conversion_cache
+
+
+def get_tracer():
+    """Get the tracer receiving the host-side timings of the evaluation phases.
+
+    Returns:
+        mot.lib.tracing.Tracer: the current tracer, or None if tracing is disabled.
+    """
+    return _config['tracer']
+
+
+def set_tracer(tracer):
+    """Set the tracer receiving the host-side timings of the evaluation phases.
+
+    For temporary tracing, consider using the context manager :func:`mot.lib.tracing.tracing` instead.
+
+    Args:
+        tracer (mot.lib.tracing.Tracer): the new tracer, set to None to disable tracing.
+    """
+    _config['tracer'] = tracer
+
+
 @contextmanager
 def config_context(config_action):
     """Creates a context in which the config action is applied and unapplies the configuration after execution.
@@ -263,7 +391,8 @@ class VoidConfigurationAction(ConfigAction):
 
 class CLRuntimeInfo:
 
-    def __init__(self, cl_environments=None, compile_flags=None, double_precision=None, load_balancer=None):
+    def __init__(self, cl_environments=None, compile_flags=None, double_precision=None, load_balancer=None,
+                 profiling=False):
         """All information necessary for applying operations using OpenCL.
 
         Args:
@@ -277,12 +406,26 @@ class CLRuntimeInfo:
                 By default we go for single float precision.
             load_balancer (mot.lib.load_balancers.LoadBalancer or Tuple[float]): the load balancer to use
                 for the computations. Can either be a load balancer or a tuple with fractional loads per device.
+                If the load balancer requires the kernel timings, we use environments with profiling-enabled queues,
+                see :meth:`mot.lib.cl_environments.CLEnvironment.get_profiling_environment`.
+            profiling (boolean): if set, the computations use environments with profiling-enabled queues, recording
+                the device timings of the kernel launches and the data transfers in the :attr:`profiler`.
+                See :mod:`mot.lib.profiling`.
         """
         self._cl_environments = self._load_environments(cl_environments)
+        self._profiler = None
+        if profiling:
+            self._profiler = DeviceProfiler()
+            self._cl_environments = [CLEnvironment(env.platform, env.context, env.device, nmr_queues=env.nmr_queues,
+                                                   profiler=self._profiler) for env in self._cl_environments]
         self._compile_flags = tuple(compile_flags or get_compile_flags())
         self._double_precision = double_precision
         self._load_balancer = self._prepare_load_balancer(load_balancer)
 
+        if self._load_balancer.requires_timings():
+            # the kernel timings are read from the profiling timestamps of the kernel events
+            self._cl_environments = [env.get_profiling_environment() for env in self._cl_environments]
+
         if self._double_precision is None:
             self._double_precision = use_double_precision()
 
@@ -337,3 +480,12 @@ class CLRuntimeInfo:
     @property
     def load_balancer(self):
         return self._load_balancer
+
+    @property
+    def profiler(self):
+        """Get the profiler recording the device timings, if profiling is enabled.
+
+        Returns:
+            mot.lib.profiling.DeviceProfiler: the profiler, or None if profiling is not enabled
+        """
+        return self._profiler
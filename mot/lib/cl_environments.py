@@ -1,3 +1,4 @@
+import threading
 import pyopencl as cl
 from mot.lib.utils import device_supports_double, device_type_from_string
 
@@ -10,18 +11,32 @@ __email__ = "robbert@xkls.nl"
 
 class CLEnvironment:
 
-    def __init__(self, platform, context, device):
+    def __init__(self, platform, context, device, profiling=False, nmr_queues=3, profiler=None):
         """Storage unit for an OpenCL environment.
 
+        Next to the default queue, every environment holds a small pool of command queues, see :meth:`get_queue`.
+        This allows, for example, enqueueing the data transfers on other queues than the kernels, with the
+        ordering between them given by explicit event dependencies.
+
         Args:
             platform (cl.Platform): An PyOpenCL platform.
             context (cl.Context): The CL context
             device (cl.Device): The CL device
+            profiling (boolean): if set, the queues are created with profiling enabled, such that the events
+                carry the device timestamps of the commands.
+            nmr_queues (int): the number of queues in the pool of this environment, the default queue included
+            profiler (mot.lib.profiling.DeviceProfiler): if given, the events of the kernel launches and data
+                transfers enqueued through this environment are recorded in this profiler. This implies profiling.
         """
         self._platform = platform
         self._context = context
         self._device = device
-        self._queue = cl.CommandQueue(self._context, device=device)
+        self._profiling = profiling or profiler is not None
+        self._profiler = profiler
+        self._nmr_queues = max(1, nmr_queues)
+        self._queues = {}
+        self._queue_lock = threading.Lock()
+        self._profiling_environment = None
 
     @property
     def context(self):
@@ -36,10 +51,117 @@ class CLEnvironment:
     def queue(self):
         """Get a CL queue for this device and context.
 
+        The queue is created on first use.
+
+        This is the first, in-order, queue of the pool of queues of this environment.
+
+        Returns:
+            cl.Queue: a PyOpenCL queue
+        """
+        return self.get_queue()
+
+    def get_queue(self, index=0, out_of_order=False):
+        """Get a queue from the pool of queues of this environment.
+
+        The queues are created on first use. Indices beyond the number of queues in the pool wrap around.
+        Per index, the pool holds an in-order queue and, if the device supports it, an out-of-order queue.
+        On an out-of-order queue, the commands are only ordered by the events they wait on.
+
+        Args:
+            index (int): the index of the queue in the pool, the default queue has index 0
+            out_of_order (boolean): if we want an out-of-order queue. If the device does not support out-of-order
+                execution, we return the in-order queue at the given index.
+
         Returns:
             cl.Queue: a PyOpenCL queue
         """
-        return self._queue
+        key = (index % self._nmr_queues, out_of_order and self.supports_out_of_order)
+
+        if key not in self._queues:
+            with self._queue_lock:
+                if key not in self._queues:
+                    properties = 0
+                    if self._profiling:
+                        properties |= cl.command_queue_properties.PROFILING_ENABLE
+                    if key[1]:
+                        properties |= cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE
+                    self._queues[key] = cl.CommandQueue(self._context, device=self._device,
+                                                        properties=properties or None)
+        return self._queues[key]
+
+    def get_profiling_environment(self):
+        """Get an environment for the same device with profiling enabled on its queues.
+
+        The environment is created at the first call and reused afterwards, such that its queues are reused.
+
+        Returns:
+            CLEnvironment: this environment if profiling is already enabled, else an environment with its own pool
+                of profiling-enabled queues
+        """
+        if self._profiling:
+            return self
+
+        with self._queue_lock:
+            if self._profiling_environment is None:
+                self._profiling_environment = CLEnvironment(self._platform, self._context, self._device,
+                                                            profiling=True, nmr_queues=self._nmr_queues)
+        return self._profiling_environment
+
+    def get_queue_environment(self, index=0, out_of_order=False):
+        """Get a view on this environment using one of the other queues of the pool as its default queue.
+
+        This can be used to direct the operations taking an environment, like the data transfers of the kernel data,
+        to another queue. The returned environment shares the context, the device and the pool of queues with
+        this environment.
+
+        Args:
+            index (int): the index of the queue in the pool, see :meth:`get_queue`
+            out_of_order (boolean): if we want an out-of-order queue, see :meth:`get_queue`
+
+        Returns:
+            CLEnvironment: an environment with the indicated queue as its default queue
+        """
+        return _QueueEnvironment(self, index, out_of_order)
+
+    @property
+    def supports_out_of_order(self):
+        """Check if the device of this environment supports out-of-order execution of the queues.
+
+        Returns:
+            boolean: if we can create out-of-order queues for this device
+        """
+        try:
+            properties = self._device.get_info(cl.device_info.QUEUE_PROPERTIES)
+        except cl.Error:
+            return False
+        return bool(properties & cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE)
+
+    @property
+    def nmr_queues(self):
+        """Get the number of queues in the pool of this environment.
+
+        Returns:
+            int: the number of queues in the pool, the default queue included
+        """
+        return self._nmr_queues
+
+    @property
+    def profiling(self):
+        """Check if the queues of this environment have profiling enabled.
+
+        Returns:
+            boolean: if the events of the queues carry the device timestamps
+        """
+        return self._profiling
+
+    @property
+    def profiler(self):
+        """Get the profiler recording the events of the commands enqueued through this environment.
+
+        Returns:
+            mot.lib.profiling.DeviceProfiler: the profiler, or None if the events are not recorded
+        """
+        return self._profiler
 
     @property
     def supports_double(self):
@@ -145,7 +267,32 @@ class CLEnvironment:
         return s
 
     def __hash__(self):
-        return hash(self._platform) + hash(self._context) + hash(self._device) + hash(self._queue)
+        return hash(self._platform) + hash(self._context) + hash(self._device)
+
+
+class _QueueEnvironment(CLEnvironment):
+
+    def __init__(self, cl_environment, index, out_of_order):
+        """View on a CL environment using another queue of its pool as the default queue.
+
+        Args:
+            cl_environment (CLEnvironment): the environment of which we use the pool of queues
+            index (int): the index of the default queue of this view
+            out_of_order (boolean): if the default queue of this view is an out-of-order queue
+        """
+        super().__init__(cl_environment.platform, cl_environment.context, cl_environment.device,
+                         profiling=cl_environment.profiling, nmr_queues=cl_environment.nmr_queues,
+                         profiler=cl_environment.profiler)
+        self._cl_environment = cl_environment
+        self._index = index
+        self._out_of_order = out_of_order
+
+    @property
+    def queue(self):
+        return self._cl_environment.get_queue(self._index, self._out_of_order)
+
+    def get_queue(self, index=0, out_of_order=False):
+        return self._cl_environment.get_queue(index, out_of_order)
 
 
 def _initialize_cl_environment_cache():
@@ -177,7 +324,25 @@ def _initialize_cl_environment_cache():
     return cache
 
 
-_cl_environment_cache = _initialize_cl_environment_cache()
+_cl_environment_cache = None
+_cl_environment_cache_lock = threading.Lock()
+
+
+def _get_cl_environment_cache():
+    """Get the cache of CL environments, initializing it on first use.
+
+    The platform discovery is deferred until first use to keep the import of MOT cheap.
+    This function is thread safe, the cache is initialized only once.
+
+    Returns:
+        dict: a dictionary mapping platforms to CLEnvironment
+    """
+    global _cl_environment_cache
+    if _cl_environment_cache is None:
+        with _cl_environment_cache_lock:
+            if _cl_environment_cache is None:
+                _cl_environment_cache = _initialize_cl_environment_cache()
+    return _cl_environment_cache
 
 
 class CLEnvironmentFactory:
@@ -227,14 +392,15 @@ class CLEnvironmentFactory:
             cl_device_type = device_type_from_string(cl_device_type)
 
         cl_environments = []
+        environment_cache = _get_cl_environment_cache()
 
         if platform is None:
-            platforms = _cl_environment_cache.keys()
+            platforms = environment_cache.keys()
         else:
             platforms = [platform]
 
         for platform in platforms:
-            cached_envs = _cl_environment_cache[platform]
+            cached_envs = environment_cache[platform]
 
             if cl_device_type:
                 for env in cached_envs:
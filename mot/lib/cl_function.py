@@ -1,11 +1,18 @@
+import asyncio
+import re
+import threading
 from collections.abc import Iterable
+from concurrent.futures import Future
 from copy import copy
+from functools import lru_cache
+import pyopencl as cl
 import tatsu
 from textwrap import dedent, indent
-import pyopencl as cl
-from mot.configuration import CLRuntimeInfo
+from mot.configuration import CLRuntimeInfo, get_program_cache, get_program_binary_cache
 from mot.lib.cl_processors import MultiDeviceProcessor
 from mot.lib.kernel_data import Zeros
+from mot.lib.memory_planner import plan_constant_memory
+from mot.lib.tracing import trace_phase
 from mot.lib.utils import split_cl_function, convert_inputs_to_kernel_data, get_cl_utility_definitions
 
 __author__ = 'Robbert Harms'
@@ -136,7 +143,7 @@ class CLFunction(CLCodeObject):
         raise NotImplementedError()
 
     def evaluate(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
-                 do_data_transfers=True, is_blocking=True, return_events=False, wait_for=None):
+                 do_data_transfers=True, is_blocking=True, return_events=False, wait_for=None, max_chunk_size=None):
         """Evaluate this function for each set of given parameters.
 
         Given a set of input parameters, this model will be evaluated for every parameter set.
@@ -162,6 +169,10 @@ class CLFunction(CLCodeObject):
                 after enqueueing the function
             return_events (boolean): if set we also return the last queued events
             wait_for (Dict[CLEnvironment: cl.Event]): per CL environment an event to wait on
+            max_chunk_size (int or str): if set, process the instances in chunks of at most this many instances per
+                launch, overlapping the data transfers with the computations. This allows processing more instances
+                than fit in the device memory at once, see :class:`mot.lib.cl_processors.ProcessKernelInChunks`.
+                Set to 'auto' to choose the chunk size based on the memory of the devices.
 
         Returns:
             ndarray: the return values of the function, which can be None if this function has a void return type.
@@ -169,6 +180,99 @@ class CLFunction(CLCodeObject):
         """
         raise NotImplementedError()
 
+    def evaluate_async(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
+                       do_data_transfers=True, wait_for=None, max_chunk_size=None):
+        """Evaluate this function without waiting on the results.
+
+        This prepares and enqueues the evaluation like :meth:`evaluate` and returns directly with a future.
+        The future resolves to the return values when the device events of the evaluation complete, at which point
+        the data of the writable kernel data is also up to date. This allows keeping multiple evaluations in flight,
+        and preparing the next evaluation on the host while the device computes.
+
+        Args:
+            inputs (Iterable[Union(ndarray, mot.lib.utils.KernelData)]
+                    or Mapping[str: Union(ndarray, mot.lib.utils.KernelData)]): for each CL function parameter
+                the input data, see :meth:`evaluate`.
+            nmr_instances (int): the number of parallel processes to run.
+            use_local_reduction (boolean): if we want to use local memory reduction, see :meth:`evaluate`.
+            local_size (int): can be used to specify the exact local size (workgroup size) the kernel must use.
+            cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information for execution
+            do_data_transfers (boolean): if we should do data transfers from host to device and back.
+            wait_for (Dict[CLEnvironment: cl.Event]): per CL environment an event to wait on
+            max_chunk_size (int or str): if set, process the instances in chunks, see :meth:`evaluate`.
+
+        Returns:
+            concurrent.futures.Future: the future for the return values of the function, see :meth:`evaluate`.
+        """
+        raise NotImplementedError()
+
+    async def evaluate_asyncio(self, inputs, nmr_instances, **kwargs):
+        """Evaluate this function in an asyncio event loop.
+
+        This is a coroutine wrapping :meth:`evaluate_async`. The evaluation is prepared and enqueued in the
+        calling thread, after which the coroutine waits on the results without blocking the event loop.
+
+        Args:
+            inputs (Iterable[Union(ndarray, mot.lib.utils.KernelData)]
+                    or Mapping[str: Union(ndarray, mot.lib.utils.KernelData)]): for each CL function parameter
+                the input data, see :meth:`evaluate`.
+            nmr_instances (int): the number of parallel processes to run.
+            **kwargs: the other keyword arguments of :meth:`evaluate_async`
+
+        Returns:
+            ndarray: the return values of the function, which can be None if this function has a void return type.
+        """
+        return await asyncio.wrap_future(self.evaluate_async(inputs, nmr_instances, **kwargs))
+
+    def bind(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
+             do_data_transfers=True, max_chunk_size=None):
+        """Bind this function to the given inputs, for repeated evaluation with a low overhead per call.
+
+        This performs all the preparations of :meth:`evaluate` once, that is, it compiles the kernel, creates the
+        buffers and binds the kernel arguments. The returned :class:`BoundKernel` can then be launched repeatedly.
+
+        To evaluate with new input values, update the contents of the bound kernel data in place (for example
+        using ``bound_kernel.kernel_data['x'].get_data()[:] = ...``). The shapes and types of the data can
+        not change after binding.
+
+        Args:
+            inputs (Iterable[Union(ndarray, mot.lib.utils.KernelData)]
+                    or Mapping[str: Union(ndarray, mot.lib.utils.KernelData)]): for each CL function parameter
+                the input data, see :meth:`evaluate`.
+            nmr_instances (int): the number of parallel processes to run.
+            use_local_reduction (boolean): if we want to use local memory reduction, see :meth:`evaluate`.
+            local_size (int): can be used to specify the exact local size (workgroup size) the kernel must use.
+            cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information for execution
+            do_data_transfers (boolean): if we should do data transfers from host to device and back at every launch.
+            max_chunk_size (int): if set, process the instances in chunks, see :meth:`evaluate`.
+
+        Returns:
+            BoundKernel: the launch object for this function and inputs
+        """
+        raise NotImplementedError()
+
+    def prepare(self, inputs, nmr_instances, cl_runtime_info=None, is_blocking=True):
+        """Compile the kernels for evaluating this function with the given inputs, without evaluating the function.
+
+        This allows paying the compilation costs ahead of time. Since the kernel source depends on the types and
+        shapes of the inputs, the inputs should be equal in type and shape to the inputs used for the evaluation.
+        Only the programs are built, no data is transferred and no kernels are launched.
+
+        Args:
+            inputs (Iterable[Union(ndarray, mot.lib.utils.KernelData)]
+                    or Mapping[str: Union(ndarray, mot.lib.utils.KernelData)]): for each CL function parameter
+                the input data, see :meth:`evaluate`.
+            nmr_instances (int): the number of parallel processes to run.
+            cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information for execution
+            is_blocking (boolean): if set, we return after all the programs are built. If not set, the programs are
+                built in the background.
+
+        Returns:
+            None or Dict[CLEnvironment: concurrent.futures.Future]: if not blocking, per CL environment a future
+                for the built program.
+        """
+        raise NotImplementedError()
+
     def get_dependencies(self):
         """Get the list of dependencies this function depends on.
 
@@ -178,6 +282,107 @@ class CLFunction(CLCodeObject):
         raise NotImplementedError()
 
 
+class BoundKernel:
+
+    def __init__(self, processor, kernel_data, return_type, mot_float_dtype):
+        """A CL function bound to its kernel and kernel data, for repeated launches with a low overhead.
+
+        Instances of this class are created by :meth:`CLFunction.bind`. All the preparations, like compiling the
+        kernel, creating the buffers and setting the kernel arguments, are done once such that a launch only
+        transfers the data and enqueues the kernel.
+
+        In between launches, the contents of the data can be updated in place and the values of non-inlined scalars
+        can be changed using :meth:`mot.lib.kernel_data.Scalar.set_value`. The kernel arguments which changed
+        are set again at the next launch. Since the kernel is compiled for the ``mot_float_type`` at binding,
+        the kernel data is converted back to that precision at every launch, in case it was used with another
+        precision in between.
+
+        Args:
+            processor (mot.lib.cl_processors.Processor): the processor running the kernel
+            kernel_data (Dict[str, mot.lib.kernel_data.KernelData]): the kernel data bound to the kernel
+            return_type (str): the return type of the bound CL function
+            mot_float_dtype (np.dtype): the dtype of the ``mot_float_type`` the kernel was compiled with
+        """
+        self._processor = processor
+        self._kernel_data = kernel_data
+        self._return_type = return_type
+        self._mot_float_dtype = mot_float_dtype
+
+    @property
+    def kernel_data(self):
+        """Get the kernel data bound to the kernel.
+
+        The contents of the data can be updated in place between launches.
+
+        Returns:
+            Dict[str, mot.lib.kernel_data.KernelData]: the kernel data, mapping parameter names to kernel data.
+        """
+        return self._kernel_data
+
+    def get_problem_ranges(self):
+        """Get the problem instances processed per CL environment by the last launch.
+
+        When launching without data transfers, pass these to :class:`mot.lib.cl_processors.HostAccess` to only
+        transfer back the results of every device.
+
+        Returns:
+            Dict[CLEnvironment: List[Tuple[int, int]]]: per CL environment the ranges (start and end exclusive) of
+                the problem instances
+        """
+        return self._processor.get_problem_ranges()
+
+    def launch(self, is_blocking=True, return_events=False, wait_for=None):
+        """Launch the bound kernel.
+
+        Args:
+            is_blocking (boolean): if this is a blocking call, i.e. if we should call finish on all the queues
+                after enqueueing the function
+            return_events (boolean): if set we also return the last queued events
+            wait_for (Dict[CLEnvironment: cl.Event]): per CL environment an event to wait on
+
+        Returns:
+            ndarray: the return values of the function, which can be None if this function has a void return type.
+                If return_events is set, we return a tuple instead with the results and the last event.
+        """
+        self._set_mot_float_dtype()
+        events = self._processor.process(wait_for=wait_for)
+
+        return_data = None
+        if is_blocking:
+            with trace_phase('finish'):
+                self._processor.finish()
+            return_data = self._get_return_data()
+
+        if return_events:
+            return return_data, events
+        return return_data
+
+    def launch_async(self, wait_for=None):
+        """Launch the bound kernel without waiting on the results.
+
+        Args:
+            wait_for (Dict[CLEnvironment: cl.Event]): per CL environment an event to wait on
+
+        Returns:
+            concurrent.futures.Future: the future for the return values of the function, resolved when the
+                last queued events complete.
+        """
+        self._set_mot_float_dtype()
+        events = self._processor.process(wait_for=wait_for)
+        self._processor.flush()
+        return _get_events_future(list(events.values()), self._get_return_data)
+
+    def _set_mot_float_dtype(self):
+        """Make sure all the kernel data is in the precision the kernel was compiled with."""
+        for data in self._kernel_data.values():
+            data.set_mot_float_dtype(self._mot_float_dtype)
+
+    def _get_return_data(self):
+        if self._return_type == 'void':
+            return None
+        return self._kernel_data['__return_values'].get_data()
+
+
 class SimpleCLCodeObject(CLCodeObject):
 
     def __init__(self, cl_code):
@@ -204,7 +409,8 @@ class SimpleCLFunction(CLFunction):
                 :class:`CLFunctionParameter` or strings from which to form the function parameters.
             cl_body (str): the body of the CL code for this function.
             dependencies (Iterable[CLCodeObject]): The CL code objects this function depends on,
-                these will be prepended to the CL code generated by this function.
+                these will be prepended to the CL code generated by this function. The CL code is linked once,
+                as such, the dependencies should not be changed afterwards.
             is_kernel_func (boolean): if this function should be a kernel function
         """
         super().__init__()
@@ -214,7 +420,7 @@ class SimpleCLFunction(CLFunction):
         self._cl_body = cl_body
         self._dependencies = dependencies or []
         self._is_kernel_func = is_kernel_func
-        self._compilation_cache = {}
+        self._cl_code = None
 
     @classmethod
     def from_string(cls, cl_function, dependencies=()):
@@ -294,86 +500,118 @@ class SimpleCLFunction(CLFunction):
             parameters=', '.join(self._get_parameter_signatures())))
 
     def get_cl_code(self):
-        cl_code = dedent('''
-            {kernel} {return_type} {cl_function_name}({parameters}){{
-            {body}
-            }}
-        '''.format(kernel='kernel' if self.is_kernel_func() else '',
-                   return_type=self.get_return_type(),
-                   cl_function_name=self.get_cl_function_name(),
-                   parameters=', '.join(self._get_parameter_signatures()),
-                   body=indent(dedent(self._cl_body), ' '*4*4)))
-
-        dependencies = self._get_cl_dependency_code()
-        return dependencies + dedent('''
-            #ifndef {inclusion_guard_name}
-            #define {inclusion_guard_name}
-            {code}
-            #endif // {inclusion_guard_name}
-        '''.format(inclusion_guard_name='INCLUDE_GUARD_{}'.format(self.get_cl_function_name()),
-                   code=indent('\n' + cl_code + '\n', ' ' * 4 * 3)))
+        # the dependencies are fixed at construction, as such, the dependency graph is only linked once
+        if self._cl_code is None:
+            self._cl_code = _get_linked_code(_get_linked_objects([self], roots=[self]), roots=[self])
+        return self._cl_code
 
     def get_cl_body(self):
         return self._cl_body
 
     def evaluate(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
-                 do_data_transfers=True, is_blocking=True, return_events=False, wait_for=None):
-
+                 do_data_transfers=True, is_blocking=True, return_events=False, wait_for=None, max_chunk_size=None):
+
+        with trace_phase('evaluate', function=self.get_cl_function_name(), nmr_instances=nmr_instances):
+            bound_kernel = self.bind(inputs, nmr_instances, use_local_reduction=use_local_reduction,
+                                     local_size=local_size, cl_runtime_info=cl_runtime_info,
+                                     do_data_transfers=do_data_transfers, max_chunk_size=max_chunk_size)
+            return bound_kernel.launch(is_blocking=is_blocking, return_events=return_events, wait_for=wait_for)
+
+    def evaluate_async(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
+                       do_data_transfers=True, wait_for=None, max_chunk_size=None):
+        with trace_phase('evaluate', function=self.get_cl_function_name(), nmr_instances=nmr_instances):
+            bound_kernel = self.bind(inputs, nmr_instances, use_local_reduction=use_local_reduction,
+                                     local_size=local_size, cl_runtime_info=cl_runtime_info,
+                                     do_data_transfers=do_data_transfers, max_chunk_size=max_chunk_size)
+            return bound_kernel.launch_async(wait_for=wait_for)
+
+    def bind(self, inputs, nmr_instances, use_local_reduction=False, local_size=None, cl_runtime_info=None,
+             do_data_transfers=True, max_chunk_size=None):
         cl_runtime_info = cl_runtime_info or CLRuntimeInfo()
 
-        def resolve_cl_function_and_kernel_data():
-            kernel_data = convert_inputs_to_kernel_data(inputs, self.get_parameters(), nmr_instances)
-            for data in kernel_data.values():
-                data.set_mot_float_dtype(cl_runtime_info.mot_float_dtype)
+        cl_function, kernel_data = self._resolve_cl_function_and_kernel_data(inputs, nmr_instances, cl_runtime_info)
 
-            cl_function = self
-            if not self.is_kernel_func():
-                cl_function, extra_data = self.get_kernel_wrapped(kernel_data, nmr_instances)
-                kernel_data.update(extra_data)
+        with trace_phase('generate_source') as metadata:
+            kernel_source = self._get_kernel_source(cl_function, kernel_data, cl_runtime_info)
+            metadata['source_length'] = len(kernel_source)
+
+        with trace_phase('get_programs'):
+            programs = get_program_cache().get_programs(
+                kernel_source, cl_runtime_info.cl_environments,
+                cl_runtime_info.compile_flags, binary_cache=get_program_binary_cache())
 
-            return cl_function, kernel_data
-
-        def get_kernel_source(cl_function, kernel_data):
-            kernel_source = ''
-            kernel_source += get_cl_utility_definitions(cl_runtime_info.double_precision)
-            kernel_source += '\n'.join(data.get_type_definitions() for data in kernel_data.values())
-            kernel_source += cl_function.get_cl_code()
-            return kernel_source
-
-        def get_kernels(kernel_source, function_name):
-            hashed_source = hash(kernel_source)
-            kernels = {}
-            for env in cl_runtime_info.cl_environments:
-                key = (hashed_source, env.context, cl_runtime_info.compile_flags)
-                if key not in self._compilation_cache:
-                    self._compilation_cache[key] = cl.Program(
-                        env.context, kernel_source).build(' '.join(cl_runtime_info.compile_flags))
-                kernels[env] = getattr(self._compilation_cache[key], function_name)
-            return kernels
-
-        cl_function, kernel_data = resolve_cl_function_and_kernel_data()
-        kernel_source = get_kernel_source(cl_function, kernel_data)
-        kernels = get_kernels(kernel_source, cl_function.get_cl_function_name())
+            # every bound kernel gets its own kernel object since the kernel arguments are bound to the kernel
+            kernels = {env: cl.Kernel(program, cl_function.get_cl_function_name())
+                       for env, program in programs.items()}
 
         processor = MultiDeviceProcessor(kernels, kernel_data, cl_runtime_info.cl_environments,
                                          cl_runtime_info.load_balancer, nmr_instances,
                                          use_local_reduction=use_local_reduction,
-                                         local_size=local_size, do_data_transfers=do_data_transfers)
-        events = processor.process(wait_for=wait_for)
+                                         local_size=local_size, do_data_transfers=do_data_transfers,
+                                         max_chunk_size=max_chunk_size)
+        return BoundKernel(processor, kernel_data, self.get_return_type(), cl_runtime_info.mot_float_dtype)
 
-        return_data = None
-        if is_blocking:
-            processor.finish()
-            if self.get_return_type() != 'void':
-                return_data = kernel_data['__return_values'].get_data()
+    def prepare(self, inputs, nmr_instances, cl_runtime_info=None, is_blocking=True):
+        cl_runtime_info = cl_runtime_info or CLRuntimeInfo()
 
-        if return_events:
-            return return_data, events
-        return return_data
+        cl_function, kernel_data = self._resolve_cl_function_and_kernel_data(inputs, nmr_instances, cl_runtime_info)
+        programs = get_program_cache().get_programs(
+            self._get_kernel_source(cl_function, kernel_data, cl_runtime_info), cl_runtime_info.cl_environments,
+            cl_runtime_info.compile_flags, binary_cache=get_program_binary_cache(), is_blocking=is_blocking)
+
+        if not is_blocking:
+            return programs
 
     def get_dependencies(self):
         return self._dependencies
 
+    def _resolve_cl_function_and_kernel_data(self, inputs, nmr_instances, cl_runtime_info):
+        """Get the kernel function and the kernel data for evaluating this function.
+
+        Args:
+            inputs (Iterable or Mapping): the inputs as given to :meth:`evaluate`
+            nmr_instances (int): the number of parallel processes to run.
+            cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information for execution
+
+        Returns:
+            tuple: the kernel function and the dictionary with the kernel data
+        """
+        with trace_phase('convert_inputs'):
+            kernel_data = convert_inputs_to_kernel_data(inputs, self.get_parameters(), nmr_instances)
+            for data in kernel_data.values():
+                data.set_mot_float_dtype(cl_runtime_info.mot_float_dtype)
+
+        cl_function = self
+        if not self.is_kernel_func():
+            # arrays passed as global pointers to the function must remain in global memory
+            candidate_names = [param.name.replace('.', '_') for param in self.get_parameters()
+                               if param.address_space != 'global']
+            constant_arrays = plan_constant_memory([kernel_data[name] for name in candidate_names],
+                                                   cl_runtime_info.cl_environments)
+            if constant_arrays:
+                # the arrays are placed in constant memory in copies, leaving the provided kernel data unchanged
+                for name in candidate_names:
+                    kernel_data[name] = kernel_data[name].with_constant_memory(constant_arrays)
+
+            with trace_phase('wrap_kernel'):
+                cl_function, extra_data = self.get_kernel_wrapped(kernel_data, nmr_instances)
+                kernel_data.update(extra_data)
+
+        return cl_function, kernel_data
+
+    @staticmethod
+    def _get_kernel_source(cl_function, kernel_data, cl_runtime_info):
+        """Get the complete kernel source for the given kernel function and kernel data.
+
+        Returns:
+            str: the kernel source
+        """
+        kernel_source = ''
+        kernel_source += get_cl_utility_definitions(cl_runtime_info.double_precision)
+        kernel_source += '\n'.join(data.get_type_definitions() for data in kernel_data.values())
+        kernel_source += cl_function.get_cl_code()
+        return kernel_source
+
     def _get_parameter_signatures(self):
         """Get the signature of the parameters for the CL function declaration.
 
@@ -394,10 +632,31 @@ class SimpleCLFunction(CLFunction):
         Returns:
             str: The CL code with the actual code.
         """
-        code = ''
-        for d in self._dependencies:
-            code += d.get_cl_code() + "\n"
-        return code
+        return link_cl_code(self._dependencies)
+
+    def _get_cl_function_code(self):
+        """Get the CL code of only this function, without the dependencies, with include guards.
+
+        Returns:
+            str: The CL code of this function
+        """
+        cl_code = dedent('''
+            {kernel} {return_type} {cl_function_name}({parameters}){{
+            {body}
+            }}
+        '''.format(kernel='kernel' if self.is_kernel_func() else '',
+                   return_type=self.get_return_type(),
+                   cl_function_name=self.get_cl_function_name(),
+                   parameters=', '.join(self._get_parameter_signatures()),
+                   body=indent(dedent(self._cl_body), ' '*4*4)))
+
+        return dedent('''
+            #ifndef {inclusion_guard_name}
+            #define {inclusion_guard_name}
+            {code}
+            #endif // {inclusion_guard_name}
+        '''.format(inclusion_guard_name='INCLUDE_GUARD_{}'.format(self.get_cl_function_name()),
+                   code=indent('\n' + cl_code + '\n', ' ' * 4 * 3)))
 
     @staticmethod
     def _resolve_parameters(parameter_list):
@@ -432,6 +691,134 @@ class SimpleCLFunction(CLFunction):
         return self.evaluate(*args, **kwargs)
 
 
+def link_cl_code(cl_code_objects):
+    """Link the given code objects and all their dependencies into a single piece of CL code.
+
+    This walks the dependency graph of the given code objects once and emits the code of every unique function
+    exactly once, in topological order, that is, every function comes after its dependencies.
+
+    Only the dependencies of :class:`SimpleCLFunction` objects using the default ``get_cl_code()`` are traversed,
+    for any other code object, including subclasses overriding ``get_cl_code()``, we include the code returned by its
+    ``get_cl_code()`` method.
+
+    Args:
+        cl_code_objects (Iterable[CLCodeObject]): the code objects to link
+
+    Returns:
+        str: the CL code of all the code objects and their dependencies
+    """
+    return _get_linked_code(_get_linked_objects(cl_code_objects))
+
+
+def _get_linked_code(linked_objects, roots=()):
+    """Get the CL code of the given, topologically ordered, code objects.
+
+    Args:
+        linked_objects (List[CLCodeObject]): the code objects, as returned by :func:`_get_linked_objects`
+        roots (Iterable[SimpleCLFunction]): functions of which we always emit the function code, also if they
+            override ``get_cl_code()``. This allows the linking from within their ``get_cl_code()``.
+
+    Returns:
+        str: the CL code of the code objects
+    """
+    roots = {id(root) for root in roots}
+    emitted = set()
+    code = []
+
+    for code_object in linked_objects:
+        if _is_linkable(code_object) or id(code_object) in roots:
+            object_code = code_object._get_cl_function_code()
+        else:
+            object_code = code_object.get_cl_code()
+
+        if object_code not in emitted:
+            emitted.add(object_code)
+            code.append(object_code)
+
+    return ''.join(object_code + '\n' for object_code in code)
+
+
+def _get_linked_objects(cl_code_objects, roots=()):
+    """Get the given code objects and all their dependencies in topological order.
+
+    Args:
+        cl_code_objects (Iterable[CLCodeObject]): the code objects to link
+        roots (Iterable[SimpleCLFunction]): functions of which we always traverse the dependencies
+
+    Returns:
+        List[CLCodeObject]: every unique code object once, after its dependencies
+    """
+    roots = {id(root) for root in roots}
+    visited = set()
+    linked_objects = []
+
+    def visit(code_object):
+        if id(code_object) in visited:
+            return
+        visited.add(id(code_object))
+
+        if _is_linkable(code_object) or id(code_object) in roots:
+            for dependency in code_object.get_dependencies():
+                visit(dependency)
+        linked_objects.append(code_object)
+
+    for cl_code_object in cl_code_objects:
+        visit(cl_code_object)
+
+    return linked_objects
+
+
+def _is_linkable(code_object):
+    """Check if we can link the dependencies of the given code object ourselves.
+
+    This is the case for :class:`SimpleCLFunction` objects not overriding ``get_cl_code()``.
+    """
+    return isinstance(code_object, SimpleCLFunction) and \
+        type(code_object).get_cl_code is SimpleCLFunction.get_cl_code
+
+
+def _get_events_future(events, get_result):
+    """Get a future resolving when all the given events have completed.
+
+    The future is resolved from the callback thread of the OpenCL runtime.
+
+    Args:
+        events (List[cl.Event]): the events to wait on
+        get_result (Callable[[], object]): called when the events completed to get the result of the future
+
+    Returns:
+        concurrent.futures.Future: the future resolving to the result of ``get_result``
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    nmr_pending = [len(events)]
+    lock = threading.Lock()
+
+    def resolve():
+        try:
+            future.set_result(get_result())
+        except Exception as exc:
+            future.set_exception(exc)
+
+    def event_completed(status):
+        with lock:
+            if future.done():
+                return
+            if status < 0:
+                future.set_exception(RuntimeError('An OpenCL command failed with status {}.'.format(status)))
+                return
+            nmr_pending[0] -= 1
+            if nmr_pending[0]:
+                return
+        resolve()
+
+    if not events:
+        resolve()
+    for event in events:
+        event.set_callback(cl.command_execution_status.COMPLETE, event_completed)
+    return future
+
+
 class CLFunctionParameter:
 
     @property
@@ -552,22 +939,186 @@ class CLFunctionParameter:
         raise NotImplementedError()
 
 
-_cl_data_type_parser = tatsu.compile(r'''
-    result = [address_space] {type_qualifiers}* ctype {pointer_star}* {pointer_qualifiers}* name {array_size}*;
+@lru_cache(maxsize=None)
+def _get_cl_data_type_parser():
+    """Get the PEG parser for CL parameter declarations, the grammar is compiled on first use."""
+    return tatsu.compile(r'''
+        result = [address_space] {type_qualifiers}* ctype {pointer_star}* {pointer_qualifiers}* name {array_size}*;
+
+        address_space = ['__'] ('local' | 'global' | 'constant' | 'private');
+        type_qualifiers = 'const' | 'volatile';
 
-    address_space = ['__'] ('local' | 'global' | 'constant' | 'private');
-    type_qualifiers = 'const' | 'volatile';
+        basic_ctype = ['unsigned '] /(\w[\w]*[a-zA-Z])/;
+        vector_type_length = '2' | '3' | '4' | '8' | '16';
+        ctype = basic_ctype [vector_type_length];
+        pointer_star = '*';
 
-    basic_ctype = ['unsigned '] /(\w[\w]*[a-zA-Z])/;
-    vector_type_length = '2' | '3' | '4' | '8' | '16';
-    ctype = basic_ctype [vector_type_length];
-    pointer_star = '*';
+        pointer_qualifiers = 'const' | 'restrict';
 
-    pointer_qualifiers = 'const' | 'restrict';
+        name = /[\w\_\-\.]+/;
+        array_size = /\[\d+\]/;
+    ''')
 
-    name = /[\w\_\-\.]+/;
-    array_size = /\[\d+\]/;
-''')
+
+_cl_declaration_tokens = re.compile(r'\*|\[\d+\]|[\w\-\.]+|\S')
+_cl_declaration_ctype = re.compile(r'(\w+[a-zA-Z])(2|3|4|8|16)?$')
+_cl_declaration_name = re.compile(r'[\w\-\.]+$')
+_cl_declaration_array_size = re.compile(r'\[\d+\]$')
+_cl_address_spaces = [prefix + address_space for prefix in ('', '__')
+                      for address_space in ('local', 'global', 'constant', 'private')]
+
+
+@lru_cache(maxsize=4096)
+def _parse_cl_declaration(declaration):
+    """Parse the given CL parameter declaration into its components.
+
+    This first tries a fast tokenizer based parser for the common declaration grammar. If that parser does not accept
+    the declaration, we fall back on the complete PEG parser. The results are memoized on the declaration string.
+
+    Args:
+        declaration (str): the declaration of a parameter, for example ``global int foo``.
+
+    Returns:
+        tuple: the address space, type qualifiers, basic ctype, vector length, number of pointer stars,
+            pointer qualifiers, name and array sizes of the declared parameter.
+    """
+    result = _parse_cl_declaration_fast(declaration)
+    if result is None:
+        result = _parse_cl_declaration_peg(declaration)
+    return result
+
+
+def _parse_cl_declaration_fast(declaration):
+    """Parse the common declaration grammar without the PEG parser.
+
+    Args:
+        declaration (str): the declaration of a parameter
+
+    Returns:
+        Optional[tuple]: see :func:`_parse_cl_declaration`, or None if the declaration is not supported by this parser.
+    """
+    tokens = _cl_declaration_tokens.findall(declaration)
+    if 'unsigned' in tokens:
+        return None
+
+    def add_qualifier(qualifiers, qualifier):
+        if qualifier in qualifiers:
+            raise ValueError('The pre-type qualifier "{}" is present multiple times.'.format(qualifier))
+        qualifiers.append(qualifier)
+
+    tokens.append(None)
+    ind = 0
+
+    address_space = None
+    if tokens[ind] in _cl_address_spaces:
+        address_space = tokens[ind]
+        ind += 1
+
+    type_qualifiers = []
+    while tokens[ind] in ('const', 'volatile'):
+        add_qualifier(type_qualifiers, tokens[ind])
+        ind += 1
+
+    ctype_match = _cl_declaration_ctype.match(tokens[ind] or '')
+    if not ctype_match:
+        return None
+    basic_ctype = ctype_match.group(1)
+    vector_length = int(ctype_match.group(2)) if ctype_match.group(2) else None
+    ind += 1
+
+    nmr_pointer_stars = 0
+    while tokens[ind] == '*':
+        nmr_pointer_stars += 1
+        ind += 1
+
+    pointer_qualifiers = []
+    while tokens[ind] in ('const', 'restrict'):
+        add_qualifier(pointer_qualifiers, tokens[ind])
+        ind += 1
+
+    if not _cl_declaration_name.match(tokens[ind] or ''):
+        return None
+    name = tokens[ind]
+    ind += 1
+
+    array_sizes = []
+    while tokens[ind] is not None and _cl_declaration_array_size.match(tokens[ind]):
+        array_sizes.append(int(tokens[ind][1:-1]))
+        ind += 1
+
+    if tokens[ind] is not None:
+        return None
+
+    return (address_space, tuple(type_qualifiers), basic_ctype, vector_length,
+            nmr_pointer_stars, tuple(pointer_qualifiers), name, tuple(array_sizes))
+
+
+def _parse_cl_declaration_peg(declaration):
+    """Parse the given declaration using the PEG parser.
+
+    Args:
+        declaration (str): the declaration of a parameter
+
+    Returns:
+        tuple: see :func:`_parse_cl_declaration`
+    """
+    class Semantics:
+
+        def __init__(self):
+            self._address_space = None
+            self._type_qualifiers = []
+            self._basic_ctype = ''
+            self._vector_type_length = None
+            self._nmr_pointer_stars = 0
+            self._pointer_qualifiers = []
+            self._name = ''
+            self._array_sizes = []
+
+        def result(self, ast):
+            return (self._address_space, tuple(self._type_qualifiers), self._basic_ctype,
+                    self._vector_type_length, self._nmr_pointer_stars, tuple(self._pointer_qualifiers),
+                    self._name, tuple(self._array_sizes))
+
+        def type_qualifiers(self, ast):
+            if ast in self._type_qualifiers:
+                raise ValueError('The pre-type qualifier "{}" is present multiple times.'.format(ast))
+            self._type_qualifiers.append(ast)
+            return ast
+
+        def address_space(self, ast):
+            self._address_space = ''.join(ast)
+            return ''.join(ast)
+
+        def basic_ctype(self, ast):
+            if isinstance(ast, tuple):
+                self._basic_ctype = ' '.join(ast)
+            else:
+                self._basic_ctype = ast
+            return ast
+
+        def vector_type_length(self, ast):
+            self._vector_type_length = int(ast)
+            return ast
+
+        def pointer_star(self, ast):
+            self._nmr_pointer_stars += 1
+            return ast
+
+        def pointer_qualifiers(self, ast):
+            if ast in self._pointer_qualifiers:
+                raise ValueError('The pre-type qualifier "{}" is present multiple times.'.format(ast))
+            self._pointer_qualifiers.append(ast)
+            return ast
+
+        def name(self, ast):
+            self._name = ast
+            return ast
+
+        def array_size(self, ast):
+            self._array_sizes.append(int(ast[1:-1]))
+            return ast
+
+    return _get_cl_data_type_parser().parse(declaration, semantics=Semantics())
 
 
 class SimpleCLFunctionParameter(CLFunctionParameter):
@@ -578,59 +1129,12 @@ class SimpleCLFunctionParameter(CLFunctionParameter):
         Args:
             declaration (str): the declaration of this parameter. For example ``global int foo``.
         """
-        self._address_space = None
-        self._type_qualifiers = []
-        self._basic_ctype = ''
-        self._vector_type_length = None
-        self._nmr_pointer_stars = 0
-        self._pointer_qualifiers = []
-        self._name = ''
-        self._array_sizes = []
-
-        param = self
-
-        class Semantics:
-
-            def type_qualifiers(self, ast):
-                if ast in param._type_qualifiers:
-                    raise ValueError('The pre-type qualifier "{}" is present multiple times.'.format(ast))
-                param._type_qualifiers.append(ast)
-                return ast
-
-            def address_space(self, ast):
-                param._address_space = ''.join(ast)
-                return ''.join(ast)
-
-            def basic_ctype(self, ast):
-                if isinstance(ast, tuple):
-                    param._basic_ctype = ' '.join(ast)
-                else:
-                    param._basic_ctype = ast
-                return ast
-
-            def vector_type_length(self, ast):
-                param._vector_type_length = int(ast)
-                return ast
-
-            def pointer_star(self, ast):
-                param._nmr_pointer_stars += 1
-                return ast
-
-            def pointer_qualifiers(self, ast):
-                if ast in param._pointer_qualifiers:
-                    raise ValueError('The pre-type qualifier "{}" is present multiple times.'.format(ast))
-                param._pointer_qualifiers.append(ast)
-                return ast
-
-            def name(self, ast):
-                param._name = ast
-                return ast
-
-            def array_size(self, ast):
-                param._array_sizes.append(int(ast[1:-1]))
-                return ast
-
-        _cl_data_type_parser.parse(declaration, semantics=Semantics())
+        (self._address_space, type_qualifiers, self._basic_ctype, self._vector_type_length,
+         self._nmr_pointer_stars, pointer_qualifiers, self._name, array_sizes) = _parse_cl_declaration(declaration)
+
+        self._type_qualifiers = list(type_qualifiers)
+        self._pointer_qualifiers = list(pointer_qualifiers)
+        self._array_sizes = list(array_sizes)
 
     @property
     def name(self):
@@ -4,8 +4,24 @@ __maintainer__ = 'Robbert Harms'
 __email__ = 'robbert@xkls.nl'
 __licence__ = 'LGPL v3'
 
+import queue
+import threading
+from collections import deque
+
+import numpy as np
 import pyopencl as cl
 
+from mot.lib.kernel_data import Array, Zeros, add_buffer_events
+from mot.lib.memory_planner import get_batch_size, get_workgroup_size, check_local_memory, \
+    get_memory_requirements
+from mot.lib.profiling import profile_event
+from mot.lib.tracing import trace_phase
+from mot.lib.utils import split_in_batches
+
+
+_UPLOAD_QUEUE_INDEX = 1
+_DOWNLOAD_QUEUE_INDEX = 2
+
 
 class Processor:
 
@@ -32,11 +48,25 @@ class Processor:
         """Enqueues a finish operation to all the queues."""
         raise NotImplementedError()
 
+    def get_problem_ranges(self):
+        """Get the problem instances processed per CL environment by the last call to :meth:`process`.
+
+        These are used to only transfer back the results of the problem instances processed by a device, such that
+        devices with a different context do not overwrite each other's results,
+        see :meth:`mot.lib.kernel_data.KernelData.enqueue_host_access`.
+
+        Returns:
+            Dict[CLEnvironment: List[Tuple[int, int]]]: per CL environment the ranges (start and end exclusive) of
+                the problem instances, None if not applicable.
+        """
+        return None
+
 
 class MultiDeviceProcessor(Processor):
 
     def __init__(self, kernels, kernel_data, cl_environments, load_balancer,
-                 nmr_instances, use_local_reduction=False, local_size=None, do_data_transfers=True):
+                 nmr_instances, use_local_reduction=False, local_size=None, do_data_transfers=True,
+                 max_chunk_size=None):
         """Create a processor for the given function and inputs.
 
         Args:
@@ -53,37 +83,100 @@ class MultiDeviceProcessor(Processor):
             do_data_transfers (boolean): if we should do data transfers from host to device and back for evaluating
                 this function. For better control set this to False and use the method
                 ``enqueue_device_access()`` and ``enqueue_host_access`` of the KernelData to set the data.
+            max_chunk_size (int or str): if set, the instances of every device are processed in chunks of at most
+                this many instances, with the transfers of the chunks overlapping the computations,
+                see :class:`ProcessKernelInChunks`. This requires data transfers to be enabled. If set to 'auto',
+                the chunk size is chosen per device to fit the device memory, see :mod:`mot.lib.memory_planner`.
         """
+        if max_chunk_size and not do_data_transfers:
+            raise ValueError('Processing in chunks requires the data transfers to be enabled.')
+
         self._subprocessors = []
-        self._do_data_transfers = do_data_transfers
+        self._do_data_transfers = do_data_transfers and not max_chunk_size
         self._kernel_data = kernel_data
         self._cl_environments = cl_environments
+        self._last_events = None
+        self._profilers = {env.profiler for env in cl_environments if env.profiler is not None}
+
+        # with a single context, all the devices write to the same buffers, which can be transferred completely
+        self._has_multiple_contexts = len({id(env.context) for env in cl_environments}) > 1
+
+        dynamic_chunks = load_balancer.get_chunks(cl_environments, nmr_instances)
+        if dynamic_chunks is not None and max_chunk_size:
+            raise ValueError('Processing in chunks can not be combined with a dynamic load balancer.')
+        workgroup_sizes = {}
+
+        kernel_name = None
+        if kernels:
+            kernel_name = next(iter(kernels.values())).function_name
+        self._kernel_name = kernel_name
+
+        self._kernel_timer = None
+        if load_balancer.requires_timings():
+            self._kernel_timer = KernelTimer(load_balancer, kernel_name)
+
+        batches = load_balancer.get_division(cl_environments, nmr_instances, kernel_name=kernel_name)
+
+        # the local memory only needs to be checked against the devices if the kernel data uses local memory
+        uses_local_memory = get_memory_requirements(kernel_data.values(), local_size or 1).local_bytes > 0
 
-        batches = load_balancer.get_division(cl_environments, nmr_instances)
         for ind, cl_environment in enumerate(cl_environments):
             kernel = kernels[cl_environment]
 
             if use_local_reduction:
                 if local_size:
                     workgroup_size = local_size
+                    if uses_local_memory:
+                        check_local_memory(kernel_data.values(), cl_environment, workgroup_size)
                 else:
-                    workgroup_size = kernel.get_work_group_info(
+                    preferred_size = kernel.get_work_group_info(
                         cl.kernel_work_group_info.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, cl_environment.device)
+                    workgroup_size = get_workgroup_size(kernel_data.values(), cl_environment, preferred_size)
             else:
                 workgroup_size = 1
+                if uses_local_memory:
+                    check_local_memory(kernel_data.values(), cl_environment, workgroup_size)
+
+            if dynamic_chunks is not None:
+                workgroup_sizes[cl_environment] = workgroup_size
+                continue
 
             batch_start, batch_end = batches[ind]
             if batch_end - batch_start > 0:
-                processor = ProcessKernel(kernel, kernel_data.values(), cl_environment,
-                                          batch_end - batch_start, workgroup_size,
-                                          instance_offset=batch_start)
+                if max_chunk_size:
+                    chunk_size = max_chunk_size
+                    if max_chunk_size == 'auto':
+                        chunk_size = get_batch_size(kernel_data.values(), cl_environment, workgroup_size,
+                                                    nmr_batches_in_memory=3) or batch_end - batch_start
+
+                    processor = ProcessKernelInChunks(kernel, kernel_data.values(), cl_environment,
+                                                      (batch_start, batch_end), workgroup_size, chunk_size,
+                                                      max_chunks_in_flight=3)
+                else:
+                    processor = ProcessKernel(kernel, kernel_data.values(), cl_environment,
+                                              batch_end - batch_start, workgroup_size,
+                                              instance_offset=batch_start, kernel_timer=self._kernel_timer)
                 self._subprocessors.append(processor)
 
+        if dynamic_chunks:
+            self._subprocessors.append(ProcessKernelDynamically(kernels, kernel_data.values(), cl_environments,
+                                                                dynamic_chunks, workgroup_sizes,
+                                                                kernel_timer=self._kernel_timer))
+
     def process(self, is_blocking=False, wait_for=None):
+        for profiler in self._profilers:
+            profiler.start_call(self._kernel_name)
+
+        if self._kernel_timer:
+            self._kernel_timer.report()
+
         if self._do_data_transfers:
-            for ind, kernel_data in enumerate(self._kernel_data.values()):
-                wait_for = kernel_data.enqueue_device_access(self._cl_environments, is_blocking=False,
-                                                             wait_for=wait_for)
+            with trace_phase('device_access'):
+                # the uploads may not overwrite the buffers before the previous launch is done with them
+                wait_for = _join_events(self._cl_environments, _UPLOAD_QUEUE_INDEX,
+                                        list((wait_for or {}).items()) + list((self._last_events or {}).items()))
+                wait_for = _enqueue_transfers(self._kernel_data.values(), self._cl_environments,
+                                              _UPLOAD_QUEUE_INDEX, 'enqueue_device_access', wait_for)
 
         events = {}
         for worker in self._subprocessors:
@@ -91,25 +184,56 @@ class MultiDeviceProcessor(Processor):
             worker.flush()
 
         if self._do_data_transfers:
-            for ind, kernel_data in enumerate(self._kernel_data.values()):
-                events = kernel_data.enqueue_host_access(self._cl_environments, is_blocking=False, wait_for=events)
+            problem_ranges = None
+            if self._has_multiple_contexts:
+                problem_ranges = self.get_problem_ranges()
+
+            with trace_phase('host_access'):
+                events = _enqueue_transfers(self._kernel_data.values(), self._cl_environments,
+                                            _DOWNLOAD_QUEUE_INDEX, 'enqueue_host_access', events,
+                                            problem_ranges=problem_ranges)
+            self._last_events = events
+
+        if is_blocking:
+            self.finish()
 
         return events
 
     def flush(self):
         for worker in self._subprocessors:
             worker.flush()
+        if self._do_data_transfers:
+            for env in self._cl_environments:
+                for index in [_UPLOAD_QUEUE_INDEX, _DOWNLOAD_QUEUE_INDEX]:
+                    env.get_queue(index, out_of_order=True).flush()
 
     def finish(self):
         for worker in self._subprocessors:
             worker.finish()
+        if self._do_data_transfers:
+            for env in self._cl_environments:
+                env.get_queue(_DOWNLOAD_QUEUE_INDEX, out_of_order=True).finish()
+        if self._kernel_timer:
+            self._kernel_timer.report()
+
+    def get_problem_ranges(self):
+        problem_ranges = {env: [] for env in self._cl_environments}
+        for worker in self._subprocessors:
+            for env, ranges in worker.get_problem_ranges().items():
+                problem_ranges[env].extend(ranges)
+        return problem_ranges
 
 
 class ProcessKernel(Processor):
 
-    def __init__(self, kernel, kernel_data, cl_environment, global_nmr_instances, workgroup_size, instance_offset=None):
+    def __init__(self, kernel, kernel_data, cl_environment, global_nmr_instances, workgroup_size, instance_offset=None,
+                 kernel_timer=None):
         """Simple processor which can execute the provided (compiled) kernel with the provided data.
 
+        The kernel arguments are set at the first call to :meth:`process`. At subsequent calls, only the arguments
+        whose inputs changed, like the value of a non-inlined scalar or a buffer replaced after a precision change,
+        are set again. As such, every processor should have its own kernel object.
+
         Args:
             kernel: a pyopencl compiled kernel program
             kernel_data (List[mot.lib.utils.KernelData]): the kernel data to load as input to the kernel
@@ -118,30 +242,40 @@ class ProcessKernel(Processor):
                 local workgroup size.
             workgroup_size (int): the local size (workgroup size) the kernel must use
             instance_offset (int): the offset for the global id, this will be multiplied with the local workgroup size.
+            kernel_timer (KernelTimer): if given, the kernel events are added to this timer
         """
         self._kernel = kernel
+        self._kernel_timer = kernel_timer
         self._kernel_data = kernel_data
         self._cl_environment = cl_environment
         self._global_nmr_instances = global_nmr_instances
         self._instance_offset = instance_offset or 0
-        self._kernel.set_scalar_arg_dtypes(self._flatten_list([d.get_scalar_arg_dtypes() for d in self._kernel_data]))
+        self._scalar_arg_dtypes = self._flatten_list([d.get_scalar_arg_dtypes() for d in self._kernel_data])
+        self._kernel.set_scalar_arg_dtypes(self._scalar_arg_dtypes)
         self._workgroup_size = workgroup_size
+        self._kernel_inputs = None
 
     def process(self, is_blocking=False, wait_for=None):
-        wait_for = wait_for or {}
-        if self._cl_environment in wait_for:
-            wait_for = [wait_for[self._cl_environment]]
-        else:
-            wait_for = None
-
-        event = self._kernel(
-            self._cl_environment.queue,
-            (int(self._global_nmr_instances * self._workgroup_size),),
-            (int(self._workgroup_size),),
-            *self._flatten_list([data.get_kernel_inputs(self._cl_environment, self._workgroup_size)
-                                 for data in self._kernel_data]),
-            global_offset=(int(self._instance_offset * self._workgroup_size),),
-            wait_for=wait_for)
+        wait_for = _get_wait_list(wait_for, self._cl_environment) or None
+
+        with trace_phase('launch', device=self._cl_environment.device.name,
+                         nmr_instances=self._global_nmr_instances, workgroup_size=self._workgroup_size):
+            self._kernel_inputs = _update_kernel_args(
+                self._kernel, self._scalar_arg_dtypes, self._kernel_inputs,
+                self._flatten_list([data.get_kernel_inputs(self._cl_environment, self._workgroup_size)
+                                    for data in self._kernel_data]))
+
+            event = cl.enqueue_nd_range_kernel(
+                self._cl_environment.queue, self._kernel,
+                (int(self._global_nmr_instances * self._workgroup_size),),
+                (int(self._workgroup_size),),
+                global_work_offset=(int(self._instance_offset * self._workgroup_size),),
+                wait_for=wait_for)
+        profile_event(self._cl_environment, event, 'kernel', self._kernel.function_name)
+        add_buffer_events(self._kernel_inputs, [event])
+
+        if self._kernel_timer:
+            self._kernel_timer.add_event(event, self._cl_environment, self._global_nmr_instances)
 
         if is_blocking:
             event.wait()
@@ -154,6 +288,9 @@ class ProcessKernel(Processor):
     def finish(self):
         self._cl_environment.queue.finish()
 
+    def get_problem_ranges(self):
+        return {self._cl_environment: [(self._instance_offset, self._instance_offset + self._global_nmr_instances)]}
+
     def _flatten_list(self, l):
         return_l = []
         for e in l:
@@ -161,6 +298,347 @@ class ProcessKernel(Processor):
         return return_l
 
 
+class ProcessKernelDynamically(Processor):
+
+    def __init__(self, kernels, kernel_data, cl_environments, chunks, workgroup_sizes, max_chunks_in_flight=2,
+                 kernel_timer=None):
+        """Processor handing out chunks of problem instances to the devices which finish first.
+
+        Every device starts with ``max_chunks_in_flight`` chunks. When a chunk finishes, signalled by an event
+        callback, a dispatcher thread enqueues the next chunk on the same device. As such, the faster devices
+        process more chunks. Having more than one chunk in flight per device keeps the devices busy while the next
+        chunk is enqueued. Since the chunks of a device are only known after all the chunks have been handed out,
+        :meth:`get_problem_ranges` waits for the dispatcher thread.
+
+        All the chunks operate on the complete kernel data, using a global work offset, like :class:`ProcessKernel`.
+        The call to :meth:`process` returns directly after enqueueing the first chunks. The returned events are
+        user events, completed when all the chunks of their device are completed. If a chunk fails, no further
+        chunks are dispatched, the returned events are set to the error status and :meth:`finish` raises an error.
+
+        Args:
+            kernels (dict): for each CL environment the kernel to use, owned by this processor
+            kernel_data (List[mot.lib.utils.KernelData]): the kernel data to load as input to the kernel
+            cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the CL environments to use
+            chunks (List[Tuple[int, int]]): the start and end (exclusive) of the chunks of problem instances
+            workgroup_sizes (dict): for each CL environment the local size (workgroup size) the kernel must use
+            max_chunks_in_flight (int): the maximum number of chunks enqueued per device at the same time
+            kernel_timer (KernelTimer): if given, the events of the chunks are added to this timer
+        """
+        self._kernels = kernels
+        self._kernel_timer = kernel_timer
+        self._kernel_data = list(kernel_data)
+        self._cl_environments = cl_environments
+        self._chunks = chunks
+        self._workgroup_sizes = workgroup_sizes
+        self._max_chunks_in_flight = max_chunks_in_flight
+        self._kernel_inputs = {}
+        self._dispatcher = None
+        self._error = None
+        self._problem_ranges = {env: [] for env in self._cl_environments}
+
+        self._scalar_arg_dtypes = self._flatten_list([d.get_scalar_arg_dtypes() for d in self._kernel_data])
+        for env in self._cl_environments:
+            self._kernels[env].set_scalar_arg_dtypes(self._scalar_arg_dtypes)
+
+    def process(self, is_blocking=False, wait_for=None):
+        # the chunks of the previous call must all be enqueued before we change the kernel arguments
+        self._join_dispatcher()
+        self._error = None
+
+        for env in self._cl_environments:
+            self._kernel_inputs[env] = _update_kernel_args(
+                self._kernels[env], self._scalar_arg_dtypes, self._kernel_inputs.get(env),
+                self._flatten_list([data.get_kernel_inputs(env, self._workgroup_sizes[env])
+                                    for data in self._kernel_data]))
+
+        self._problem_ranges = {env: [] for env in self._cl_environments}
+        pending_chunks = deque(self._chunks)
+        finished_chunks = queue.Queue()
+        chunks_in_flight = {env: 0 for env in self._cl_environments}
+        started_environments = set()
+        completion_events = {env: cl.UserEvent(env.context) for env in self._cl_environments}
+
+        def enqueue_chunk(env):
+            chunk_start, chunk_end = pending_chunks.popleft()
+            workgroup_size = self._workgroup_sizes[env]
+
+            wait_list = None
+            if env not in started_environments:
+                wait_list = _get_wait_list(wait_for, env) or None
+                started_environments.add(env)
+
+            with trace_phase('launch', device=env.device.name, nmr_instances=chunk_end - chunk_start,
+                             workgroup_size=workgroup_size):
+                event = cl.enqueue_nd_range_kernel(
+                    env.queue, self._kernels[env],
+                    (int((chunk_end - chunk_start) * workgroup_size),), (int(workgroup_size),),
+                    global_work_offset=(int(chunk_start * workgroup_size),), wait_for=wait_list)
+            profile_event(env, event, 'kernel', self._kernels[env].function_name)
+            add_buffer_events(self._kernel_inputs[env], [event])
+            event.set_callback(cl.command_execution_status.COMPLETE,
+                               lambda status: finished_chunks.put((env, status)))
+            if self._kernel_timer:
+                self._kernel_timer.add_event(event, env, chunk_end - chunk_start)
+            env.queue.flush()
+            chunks_in_flight[env] += 1
+            self._problem_ranges[env].append((chunk_start, chunk_end))
+
+        for _ in range(self._max_chunks_in_flight):
+            for env in self._cl_environments:
+                if pending_chunks:
+                    enqueue_chunk(env)
+
+        profiler_calls = {env.profiler: env.profiler.get_current_call()
+                          for env in self._cl_environments if env.profiler is not None}
+
+        def dispatch_chunks():
+            for profiler, call_index in profiler_calls.items():
+                profiler.set_current_call(call_index)
+
+            error_status = None
+            try:
+                while any(chunks_in_flight.values()):
+                    env, status = finished_chunks.get()
+                    chunks_in_flight[env] -= 1
+
+                    if status < 0:
+                        if error_status is None:
+                            error_status = status
+                            self._error = RuntimeError('A chunk of the kernel "{}" failed on device "{}" with the '
+                                                       'status {}.'.format(self._kernels[env].function_name,
+                                                                           env.device.name, status))
+                    elif pending_chunks and error_status is None:
+                        try:
+                            with trace_phase('dispatch_chunk', device=env.device.name):
+                                enqueue_chunk(env)
+                        except Exception as exc:
+                            error_status = cl.status_code.INVALID_OPERATION
+                            self._error = exc
+
+                    if not chunks_in_flight[env] and (not pending_chunks or error_status is not None):
+                        _complete_user_event(completion_events[env], error_status)
+            finally:
+                for event in completion_events.values():
+                    _complete_user_event(event, error_status)
+
+        self._dispatcher = threading.Thread(target=dispatch_chunks, name='mot_chunk_dispatcher', daemon=True)
+        self._dispatcher.start()
+
+        if is_blocking:
+            self.finish()
+
+        # the queues are in order, as such the user events mark the completion of all the chunks of a device
+        return completion_events
+
+    def flush(self):
+        for env in self._cl_environments:
+            env.queue.flush()
+
+    def finish(self):
+        self._join_dispatcher()
+        for env in self._cl_environments:
+            env.queue.finish()
+        if self._error is not None:
+            raise self._error
+
+    def get_problem_ranges(self):
+        self._join_dispatcher()
+        return self._problem_ranges
+
+    def _join_dispatcher(self):
+        """Wait until the dispatcher thread of the last call to :meth:`process` has handed out all the chunks."""
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def _flatten_list(self, l):
+        return_l = []
+        for e in l:
+            return_l.extend(e)
+        return return_l
+
+
+class ProcessKernelInChunks(Processor):
+
+    def __init__(self, kernel, kernel_data, cl_environment, batch_range, workgroup_size, max_chunk_size,
+                 max_chunks_in_flight=3):
+        """Processor executing the kernel in chunks of problem instances, overlapping transfers and computations.
+
+        The given batch of problem instances is split into chunks of at most ``max_chunk_size`` instances. For every
+        chunk we take a subset of the kernel data (see :meth:`mot.lib.kernel_data.KernelData.get_subset`), upload it,
+        run the kernel on it and download the results. Uploads, kernels and downloads are enqueued on three
+        separate queues of the environment (see :meth:`mot.lib.cl_environments.CLEnvironment.get_queue`),
+        synchronized using events, such that uploading the next chunk and downloading the previous chunk can overlap
+        with computing the current chunk. Where the device supports it, the transfers use out-of-order queues.
+
+        Only the data of at most ``max_chunks_in_flight`` chunks is held on the device at any time, allowing the
+        processing of more problem instances than would fit in the device memory at once. Combined with lazily
+        loaded arrays (see :class:`mot.lib.kernel_data.Array`), only the chunks in flight are held in host memory.
+
+        Since every chunk is processed as a separate kernel launch on a subset of the data, the global ids in the
+        kernel are relative to the chunk, and the kernel should address the data of a problem instance only through
+        the kernel data. Data shared by all problem instances is uploaded in full with every chunk, as such, writable
+        shared data is not supported, since every chunk would write to and download its own copy.
+
+        Args:
+            kernel: a pyopencl compiled kernel program, owned by this processor
+            kernel_data (List[mot.lib.utils.KernelData]): the kernel data to load as input to the kernel
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the CL environment to use for executing the kernel
+            batch_range (Tuple[int, int]): the start and end (exclusive) of the problem instances to process
+            workgroup_size (int): the local size (workgroup size) the kernel must use
+            max_chunk_size (int): the maximum number of problem instances per chunk
+            max_chunks_in_flight (int): the maximum number of chunks enqueued at the same time
+
+        Raises:
+            ValueError: if the kernel data contains writable data shared by all problem instances
+        """
+        self._kernel = kernel
+        self._kernel_data = list(kernel_data)
+        _check_chunkable(self._kernel_data)
+        self._cl_environment = cl_environment
+        self._batch_range = batch_range
+        self._workgroup_size = workgroup_size
+        self._max_chunk_size = max_chunk_size
+        self._max_chunks_in_flight = max_chunks_in_flight
+        self._kernel.set_scalar_arg_dtypes(self._flatten_list([d.get_scalar_arg_dtypes() for d in self._kernel_data]))
+
+        self._upload_environment = cl_environment.get_queue_environment(_UPLOAD_QUEUE_INDEX, out_of_order=True)
+        self._download_environment = cl_environment.get_queue_environment(_DOWNLOAD_QUEUE_INDEX, out_of_order=True)
+
+    def process(self, is_blocking=False, wait_for=None):
+        wait_for = wait_for or {}
+        chunks_in_flight = deque()
+
+        batch_start, batch_end = self._batch_range
+        for chunk_start, chunk_end in split_in_batches(batch_end - batch_start, max_batch_size=self._max_chunk_size):
+            if len(chunks_in_flight) >= self._max_chunks_in_flight:
+                with trace_phase('wait_for_chunk'):
+                    cl.wait_for_events(chunks_in_flight.popleft()[1])
+
+            chunk_range = (batch_start + chunk_start, batch_start + chunk_end)
+            with trace_phase('process_chunk', device=self._cl_environment.device.name,
+                             nmr_instances=chunk_end - chunk_start):
+                chunks_in_flight.append(self._process_chunk(chunk_range, wait_for))
+
+        marker = cl.enqueue_marker(self._download_environment.queue,
+                                   wait_for=[event for _, events in chunks_in_flight for event in events] or None)
+        if is_blocking:
+            marker.wait()
+        return {self._cl_environment: marker}
+
+    def flush(self):
+        for env in self._get_environments():
+            env.queue.flush()
+
+    def finish(self):
+        for env in self._get_environments():
+            env.queue.finish()
+
+    def get_problem_ranges(self):
+        return {self._cl_environment: [self._batch_range]}
+
+    def _process_chunk(self, chunk_range, wait_for):
+        """Enqueue the upload, the kernel and the download of the given chunk.
+
+        Args:
+            chunk_range (Tuple[int, int]): the start and end (exclusive) of the problem instances in this chunk
+            wait_for (Dict[CLEnvironment: cl.Event]): events to wait on before uploading the chunk
+
+        Returns:
+            tuple: the kernel data of the chunk, which must be kept alive until the chunk is processed,
+                and the list of download events
+        """
+        chunk_data = [data.get_subset(batch_range=chunk_range) for data in self._kernel_data]
+
+        upload_events = []
+        for data in chunk_data:
+            upload_events.extend(data.enqueue_device_access(self._upload_environment, is_blocking=False,
+                                                            wait_for=wait_for).values())
+        self._upload_environment.queue.flush()
+
+        kernel_inputs = self._flatten_list([data.get_kernel_inputs(self._cl_environment, self._workgroup_size)
+                                            for data in chunk_data])
+        self._kernel.set_args(*kernel_inputs)
+        nmr_instances = chunk_range[1] - chunk_range[0]
+        kernel_event = cl.enqueue_nd_range_kernel(
+            self._cl_environment.queue, self._kernel,
+            (int(nmr_instances * self._workgroup_size),), (int(self._workgroup_size),),
+            wait_for=upload_events or None)
+        profile_event(self._cl_environment, kernel_event, 'kernel', self._kernel.function_name)
+        add_buffer_events(kernel_inputs, [kernel_event])
+        self._cl_environment.queue.flush()
+
+        download_events = []
+        for data in chunk_data:
+            download_events.extend(data.enqueue_host_access(self._download_environment, is_blocking=False,
+                                                            wait_for={self._cl_environment: kernel_event}).values())
+        self._download_environment.queue.flush()
+
+        return chunk_data, download_events or [kernel_event]
+
+    def _get_environments(self):
+        return [self._upload_environment, self._cl_environment, self._download_environment]
+
+    def _flatten_list(self, l):
+        return_l = []
+        for e in l:
+            return_l.extend(e)
+        return return_l
+
+
+class KernelTimer:
+
+    def __init__(self, load_balancer, kernel_name):
+        """Reports the execution times of the kernel launches to a load balancer.
+
+        The execution times are read from the profiling timestamps of the kernel events. As such, only the kernels
+        launched on environments with profiling enabled are timed, since the host time would include the time the
+        kernels waited in the queues. The timings are reported by :meth:`report`, in the calling thread.
+
+        Args:
+            load_balancer (mot.lib.load_balancers.LoadBalancer): the load balancer receiving the timings,
+                see :meth:`mot.lib.load_balancers.LoadBalancer.add_timing`
+            kernel_name (str): the name of the timed kernel
+        """
+        self._load_balancer = load_balancer
+        self._kernel_name = kernel_name
+        self._events = []
+        self._lock = threading.Lock()
+
+    def add_event(self, event, cl_environment, nmr_instances):
+        """Add the event of a kernel launch, ignored if the environment does not have profiling enabled.
+
+        Args:
+            event (cl.Event): the event of the enqueued kernel
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment executing the kernel
+            nmr_instances (int): the number of instances processed by the kernel
+        """
+        if cl_environment.profiling:
+            with self._lock:
+                self._events.append((event, cl_environment, nmr_instances))
+
+    def report(self):
+        """Report the timings of the completed kernels to the load balancer.
+
+        The events of the kernels which are not yet completed are kept for the next report, the events of failed
+        kernels are dropped.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+
+        pending = []
+        for event, cl_environment, nmr_instances in events:
+            status = event.command_execution_status
+            if status == cl.command_execution_status.COMPLETE:
+                self._load_balancer.add_timing(cl_environment, self._kernel_name, nmr_instances,
+                                               (event.profile.end - event.profile.start) * 1e-9)
+            elif status > cl.command_execution_status.COMPLETE:
+                pending.append((event, cl_environment, nmr_instances))
+
+        with self._lock:
+            self._events = pending + self._events
+
+
 class DeviceAccess(Processor):
 
     def __init__(self, kernel_data, cl_environments):
@@ -191,21 +669,25 @@ class DeviceAccess(Processor):
 
 class HostAccess(Processor):
 
-    def __init__(self, kernel_data, cl_environments):
-        """A processor to enqueue device access for all the provided kernel data.
+    def __init__(self, kernel_data, cl_environments, problem_ranges=None):
+        """A processor to enqueue host access for all the provided kernel data.
 
         Args:
             kernel_data (List[mot.lib.utils.KernelData]): the input data for the kernels
             cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the list of CL environment to use
                 for executing the kernel
+            problem_ranges (Dict[CLEnvironment: List[Tuple[int, int]]]): if given, per CL environment the
+                problem instances to transfer back, see :meth:`Processor.get_problem_ranges`.
         """
         self._kernel_data = kernel_data
         self._cl_environments = cl_environments
+        self._problem_ranges = problem_ranges
 
     def process(self, is_blocking=False, wait_for=None):
         events = None
         for ind, kernel_data in enumerate(self._kernel_data):
-            events = kernel_data.enqueue_host_access(self._cl_environments, is_blocking=False, wait_for=wait_for)
+            events = kernel_data.enqueue_host_access(self._cl_environments, is_blocking=False, wait_for=wait_for,
+                                                     problem_ranges=self._problem_ranges)
         return events
 
     def flush(self):
@@ -215,3 +697,144 @@ class HostAccess(Processor):
     def finish(self):
         for env in self._cl_environments:
             env.queue.finish()
+
+
+def _enqueue_transfers(kernel_data, cl_environments, queue_index, method_name, wait_for, **kwargs):
+    """Enqueue the transfers of the given kernel data on a separate queue of every environment.
+
+    The transfers of the different kernel data only wait on the given events, not on each other, such that on an
+    out-of-order queue they may execute concurrently. Per environment, the completion of the transfers and of the
+    given events is marked by a single marker event.
+
+    Args:
+        kernel_data (List[mot.lib.kernel_data.KernelData]): the kernel data of which to enqueue the transfers
+        cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments for the transfers
+        queue_index (int): the index of the queue of the environments to use for the transfers
+        method_name (str): the transfer method of the kernel data, ``enqueue_device_access`` or
+            ``enqueue_host_access``
+        wait_for (Dict[CLEnvironment: cl.Event]): events the transfers should wait on
+        **kwargs: additional keyword arguments for the transfer method, like the ``problem_ranges`` of
+            ``enqueue_host_access``
+
+    Returns:
+        Dict[CLEnvironment: cl.Event]: per (given) environment the event marking the end of the transfers
+    """
+    transfer_environments = [env.get_queue_environment(queue_index, out_of_order=True) for env in cl_environments]
+
+    transfer_events = []
+    for data in kernel_data:
+        transfer_events.extend(getattr(data, method_name)(transfer_environments, is_blocking=False,
+                                                          wait_for=wait_for, **kwargs).items())
+
+    events = _join_events(cl_environments, queue_index, list((wait_for or {}).items()) + transfer_events)
+    for env in cl_environments:
+        env.get_queue(queue_index, out_of_order=True).flush()
+    return events
+
+
+def _join_events(cl_environments, queue_index, events):
+    """Join, per environment, the events of the same context into a single marker event.
+
+    Args:
+        cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments for which to join the events
+        queue_index (int): the index of the queue of the environments on which to enqueue the markers
+        events (List[Tuple[CLEnvironment, cl.Event]]): the events to join
+
+    Returns:
+        Dict[CLEnvironment: cl.Event]: per environment the marker event
+    """
+    markers = {}
+    for env in cl_environments:
+        wait_list = [event for event_env, event in events if event_env.context is env.context]
+        markers[env] = cl.enqueue_marker(env.get_queue(queue_index, out_of_order=True), wait_for=wait_list or None)
+    return markers
+
+
+def _get_wait_list(wait_for, cl_environment):
+    """Get the events to wait on before enqueueing work for the given environment.
+
+    Since the buffers are shared between all the devices in a context, we wait on all the events of the same context.
+
+    Args:
+        wait_for (Dict[CLEnvironment: cl.Event]): mapping environments to events, can be None
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment to enqueue work for
+
+    Returns:
+        List[cl.Event]: the events to wait on
+    """
+    return [event for env, event in (wait_for or {}).items() if env.context is cl_environment.context]
+
+
+def _check_chunkable(kernel_data):
+    """Check if the given kernel data can be processed in chunks, see :class:`ProcessKernelInChunks`.
+
+    Args:
+        kernel_data (List[mot.lib.utils.KernelData]): the kernel data to check, including the nested elements
+
+    Raises:
+        ValueError: if the kernel data contains writable data shared by all problem instances, or writable
+            interleaved data
+    """
+    elements = list(kernel_data)
+    while elements:
+        element = elements.pop()
+        elements.extend(element.get_children())
+
+        if isinstance(element, (Array, Zeros)) and 'w' in element.mode:
+            if not element.parallelize_over_first_dimension:
+                raise ValueError('Processing in chunks does not support writable data shared by all problem '
+                                 'instances, since every chunk would write to its own copy of the data.')
+            if isinstance(element, Array) and element.interleaved:
+                raise ValueError('Processing in chunks does not support writable interleaved arrays, since the '
+                                 'chunks of an interleaved array are copies of the data. Either set the array '
+                                 'as read only, disable "interleaved" or disable the chunking.')
+
+
+def _update_kernel_args(kernel, scalar_arg_dtypes, bound_inputs, inputs):
+    """Set the arguments of the kernel which changed since they were last set.
+
+    At the first call, all the arguments are set. Afterwards, only the arguments whose input changed are set again.
+    Buffers are compared by identity, local memory by size and scalars by value.
+
+    Args:
+        kernel (cl.Kernel): the kernel to set the arguments of
+        scalar_arg_dtypes (List[Union[np.dtype, None]]): per argument the scalar dtype, None for non-scalars
+        bound_inputs (list or None): the inputs currently set as the kernel arguments, None if not set yet
+        inputs (list): the new kernel inputs
+
+    Returns:
+        list: the inputs now set as the kernel arguments
+    """
+    if bound_inputs is None:
+        kernel.set_args(*inputs)
+        return inputs
+
+    for ind, (bound_input, kernel_input) in enumerate(zip(bound_inputs, inputs)):
+        if not _is_same_kernel_input(bound_input, kernel_input):
+            if scalar_arg_dtypes[ind] is not None:
+                kernel.set_arg(ind, np.dtype(scalar_arg_dtypes[ind]).type(kernel_input))
+            else:
+                kernel.set_arg(ind, kernel_input)
+    return inputs
+
+
+def _is_same_kernel_input(bound_input, kernel_input):
+    """Check if the given kernel input equals the input currently set as the kernel argument."""
+    if bound_input is kernel_input:
+        return True
+    if isinstance(bound_input, cl.LocalMemory) and isinstance(kernel_input, cl.LocalMemory):
+        return bound_input.size == kernel_input.size
+    if isinstance(bound_input, cl.MemoryObjectHolder) or isinstance(kernel_input, cl.MemoryObjectHolder):
+        return False
+    return bound_input == kernel_input
+
+
+def _complete_user_event(event, error_status=None):
+    """Set the status of the given user event to complete, or to the given error status, if not yet set.
+
+    Args:
+        event (cl.UserEvent): the user event to complete
+        error_status (int): if given, the negative error status to set instead of the complete status
+    """
+    if event.command_execution_status == cl.command_execution_status.SUBMITTED:
+        event.set_status(cl.command_execution_status.COMPLETE if error_status is None else error_status)
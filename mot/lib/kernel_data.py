@@ -1,11 +1,16 @@
 import numbers
+import threading
+import weakref
 from collections import OrderedDict
+from copy import copy
 from collections.abc import Mapping
 
 import numpy as np
 import pyopencl as cl
 
 from mot.lib.cl_environments import CLEnvironment
+from mot.lib.profiling import profile_event
+from mot.lib.tracing import trace_phase
 from mot.lib.utils import dtype_to_ctype, ctype_to_dtype, convert_data_to_dtype, is_vector_ctype, split_vector_ctype
 
 __author__ = 'Robbert Harms'
@@ -66,6 +71,21 @@ class KernelData:
         """
         raise NotImplementedError()
 
+    def with_constant_memory(self, arrays):
+        """Get this kernel data with the given arrays placed in the ``constant`` address space.
+
+        This does not change this kernel data. If any of the given arrays is this kernel data, or one of its
+        children, we return a shallow copy with those arrays placed in constant memory.
+
+        Args:
+            arrays (List[Array]): the arrays to place in constant memory,
+                see :func:`mot.lib.memory_planner.plan_constant_memory`.
+
+        Returns:
+            KernelData: this kernel data if none of the arrays is part of it, else a copy.
+        """
+        return self
+
     def get_children(self):
         """Get a list of children kernel data elements.
 
@@ -183,7 +203,7 @@ class KernelData:
         """
         raise NotImplementedError()
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         """Enqueue either a map or write operation for this kernel input data object.
 
         This should add non-blocking maps or write operations to the given queue.
@@ -194,6 +214,10 @@ class KernelData:
             is_blocking (boolean): if the enqueuing should be blocking calls or not
                 This first enqueues all the work to all the contexts and then waits for completion on them.
             wait_for (Dict[CLEnvironment: cl.Event]): per CL environment an event to wait on
+            problem_ranges (Dict[CLEnvironment: List[Tuple[int, int]]]): per CL environment the ranges (start and
+                end exclusive) of the problem instances processed by that environment. If given, the data
+                parallelized over the problem instances only transfers back these problem instances, such that the
+                results of the other environments are not overwritten. If None, all the data is transferred.
 
         Returns:
             Dict[CLEnvironment: cl.Event]: per CLEnvironment an event for waiting on
@@ -241,6 +265,20 @@ class KernelData:
         """
         raise NotImplementedError()
 
+    def get_memory_requirements(self, workgroup_size):
+        """Get the device memory needed to load this kernel data into a kernel.
+
+        This is meant for planning the batch and workgroup sizes prior to launching a kernel, see
+        :mod:`mot.lib.memory_planner`. The sizes are based on the ``mot_float_type`` set at the time of calling.
+
+        Args:
+            workgroup_size (int): the workgroup size the kernel will use
+
+        Returns:
+            MemoryRequirements: the global, local and private memory requirements of this kernel data
+        """
+        raise NotImplementedError()
+
 
 class Struct(KernelData):
 
@@ -277,6 +315,14 @@ class Struct(KernelData):
                                     for k, v in self._elements.items()])
         return Struct(sub_elements, self._ctype, anonymous=self._anonymous)
 
+    def with_constant_memory(self, arrays):
+        elements = OrderedDict([(k, v.with_constant_memory(arrays)) for k, v in self._elements.items()])
+        if all(elements[k] is v for k, v in self._elements.items()):
+            return self
+        struct = copy(self)
+        struct._elements = elements
+        return struct
+
     def set_mot_float_dtype(self, mot_float_dtype):
         for element in self._elements.values():
             element.set_mot_float_dtype(mot_float_dtype)
@@ -342,7 +388,10 @@ class Struct(KernelData):
         return '&' + variable_name
 
     def post_function_callback(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
-        return ''
+        return ''.join(data.post_function_callback('{}_{}'.format(variable_name, name),
+                                                   '{}_{}'.format(kernel_param_name, name),
+                                                   problem_id_substitute, 'global')
+                       for name, data in self._elements.items())
 
     def get_struct_declaration(self, name):
         if self._anonymous:
@@ -366,10 +415,11 @@ class Struct(KernelData):
             parameters.extend(d.get_kernel_parameters('{}_{}'.format(kernel_param_name, name)))
         return parameters
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         events = {}
         for d in self._elements.values():
-            events.update(d.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for))
+            events.update(d.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for,
+                                                problem_ranges=problem_ranges))
         return events
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
@@ -396,6 +446,12 @@ class Struct(KernelData):
     def __len__(self):
         return len(self._elements)
 
+    def get_memory_requirements(self, workgroup_size):
+        requirements = MemoryRequirements()
+        for element in self._elements.values():
+            requirements += element.get_memory_requirements(workgroup_size)
+        return requirements
+
 
 class Scalar(KernelData):
 
@@ -411,12 +467,8 @@ class Scalar(KernelData):
             inline (bool): if set to True, we inline the value in the generated kernel code,
                 else we set it as an argument.
         """
-        if isinstance(value, str) and value == 'INFINITY':
-            self._value = np.inf
-        elif isinstance(value, str) and value == '-INFINITY':
-            self._value = -np.inf
-        else:
-            self._value = np.array(value)
+        self._value = None
+        self.set_value(value)
         self._ctype = ctype or dtype_to_ctype(self._value.dtype)
         self._mot_float_dtype = None
         self._inline = inline
@@ -425,13 +477,30 @@ class Scalar(KernelData):
     def ctype(self):
         return self._ctype
 
+    def set_value(self, value):
+        """Set the value of this scalar.
+
+        Non-inlined scalars are kernel arguments, as such, their value can be updated in between the launches of a
+        bound kernel (see :meth:`mot.lib.cl_function.CLFunction.bind`). The value of inlined scalars is part of the
+        kernel source, changing it after the kernel is compiled has no effect.
+
+        Args:
+            value (number): the new value
+        """
+        if isinstance(value, str) and value == 'INFINITY':
+            self._value = np.array(np.inf)
+        elif isinstance(value, str) and value == '-INFINITY':
+            self._value = np.array(-np.inf)
+        else:
+            self._value = np.array(value)
+
     def get_subset(self, problem_indices=None, batch_range=None):
         return self
 
     def get_data(self):
         if self._ctype.startswith('mot_float_type'):
-            return np.asscalar(self._value.astype(self._mot_float_dtype))
-        return np.asscalar(self._value)
+            return self._value.astype(self._mot_float_dtype).item()
+        return self._value.item()
 
     def get_children(self):
         return []
@@ -473,7 +542,7 @@ class Scalar(KernelData):
     def initialize_variable(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
         return ''
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         return {}
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
@@ -503,6 +572,9 @@ class Scalar(KernelData):
     def post_function_callback(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
         return ''
 
+    def get_memory_requirements(self, workgroup_size):
+        return MemoryRequirements()
+
 
 class PrivateMemory(KernelData):
 
@@ -561,7 +633,7 @@ class PrivateMemory(KernelData):
     def get_kernel_parameters(self, kernel_param_name):
         return []
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         return {}
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
@@ -573,6 +645,9 @@ class PrivateMemory(KernelData):
     def get_nmr_kernel_inputs(self):
         return 0
 
+    def get_memory_requirements(self, workgroup_size):
+        return MemoryRequirements(private_bytes=self._nmr_items * _get_itemsize(self._ctype, self._mot_float_dtype))
+
 
 class LocalMemory(KernelData):
 
@@ -637,7 +712,7 @@ class LocalMemory(KernelData):
     def get_kernel_parameters(self, kernel_param_name):
         return ['local {}* restrict {}'.format(self._ctype, kernel_param_name)]
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         return {}
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
@@ -654,11 +729,16 @@ class LocalMemory(KernelData):
     def get_nmr_kernel_inputs(self):
         return 1
 
+    def get_memory_requirements(self, workgroup_size):
+        return MemoryRequirements(
+            local_bytes=self._size_func(workgroup_size) * _get_itemsize(self._ctype, self._mot_float_dtype))
+
 
 class Array(KernelData):
 
     def __init__(self, data, ctype=None, as_scalar=False, parallelize_over_first_dimension=True,
-                 mode='rw', use_host_ptr=True):
+                 mode='rw', use_host_ptr=True, allow_constant_memory=False, interleaved=False,
+                 storage=None, storage_tolerance=None, runtime_stride=False):
         """Loads the given array as a buffer into one or more OpenCL contexts.
 
         By default, this expects multi-dimensional arrays (n, m, k, ...) which holds a (m, k, ...) for every data
@@ -669,8 +749,39 @@ class Array(KernelData):
         data's dtype does not match the ctype, we will convert the data to the righ dtype. If the ctype is set
         to mot_float_type and the mot_float_type changes, then a new Array data class is returned.
 
+        The data can also be a lazily loaded source, like a memory mapped array (``np.load(..., mmap_mode='r')``)
+        or a HDF5 dataset. These are only read and converted when the data is needed in a kernel. Subsets taken
+        using :meth:`get_subset` are views on the source, such that processing the problems in batches only
+        loads one batch at the time in host memory.
+
+        Read only arrays which are shared by all problem instances (mode 'r' and not parallelized over the first
+        dimension) can, if allowed using ``allow_constant_memory``, be placed in the ``constant`` address space instead
+        of in global memory. This is decided prior to compiling the kernel, based on the ``MAX_CONSTANT_BUFFER_SIZE``
+        of the devices, see :func:`mot.lib.memory_planner.plan_constant_memory`. The kernel then uses a copy of the
+        array placed in constant memory, this array itself is not changed.
+
+        By default, the data of every problem instance is stored contiguously, that is, element ``i`` of problem ``p``
+        is at position ``p * data_length + i``. When adjacent work items process adjacent problems, the interleaved
+        layout (``i * nmr_problems + p``) allows coalesced memory access instead. The interleaved data is copied
+        to private memory (or local memory) prior to calling the function, such that the functions need not change.
+        The only restriction is that interleaved arrays can not be passed as a ``global`` pointer. Since the
+        interleaved layout is a copy of the data, :meth:`get_data` should be used to get the written results.
+
+        For large read only data sets, like observations, the data can be stored on the device in reduced precision,
+        as ``half`` or as ``char`` or ``short`` integers scaled linearly over the range of the data. This halves
+        or quarters the device memory and the data transfers. The data is converted back to the ctype when loaded in
+        the kernel, as such, like interleaved arrays, these arrays can not be passed as a ``global`` pointer.
+
+        Subsets taken using :meth:`get_subset` with non-consecutive problem indices share the data and the device
+        buffers with this array. Instead of copying the data, the kernel looks up the problem instances through an
+        index buffer. As such, the results written to such a subset are written to the data of this array.
+
+        With ``runtime_stride``, the number of elements per problem instance is passed as a kernel argument instead
+        of being written in the kernel code. Arrays used as a ``global`` pointer then do not change the kernel when
+        their shape changes, for example for outputs whose size depends on an argument of the computation.
+
         Args:
-            data (ndarray): the data to load in the kernel
+            data (ndarray or array-like): the data to load in the kernel, an ndarray or a lazily loaded source
             ctype (str): the desired c-type for in use in the kernel, like ``int``, ``float`` or ``mot_float_type``.
                 If None it is implied from the provided data. If not matching the data, we convert the data.
             as_scalar (boolean): if given and if the data is only a 1d, we will load the value as a scalar in the
@@ -684,19 +795,60 @@ class Array(KernelData):
                 data back after applying a kernel (if 'w' is included we will write data back, else, not).
             use_host_ptr (boolean): if set, we will use the USE_HOST_PTR flag and use map/unmap for data transfers
                 if not set, we create a device side buffer and use explicit read and write commands to transfer the data
+            allow_constant_memory (boolean): if set, we allow placing this array in constant memory if it is read only,
+                shared by all problem instances and if it fits the devices. Disabled by default, since not all
+                devices benefit from constant memory.
+            interleaved (boolean): if set, store the data interleaved over the problem instances, only applicable
+                if ``parallelize_over_first_dimension`` is set.
+            storage (str): the reduced precision data type to store the data in on the device, one of ``half``,
+                ``char`` or ``short``. If None, the data is stored in the ctype. Only available for read only data.
+            storage_tolerance (float): if set, the maximum absolute difference allowed between the data and the data
+                stored in reduced precision.
+            runtime_stride (boolean): if set, the offset between the problem instances is a kernel argument,
+                only applicable if ``parallelize_over_first_dimension`` is set and the data is not interleaved.
         """
         if isinstance(data, (list, tuple)):
             data = np.array(data)
 
+        if interleaved and not parallelize_over_first_dimension:
+            raise ValueError('The option "interleaved" requires "parallelize_over_first_dimension" to be set.')
+        if runtime_stride and (interleaved or not parallelize_over_first_dimension):
+            raise ValueError('The option "runtime_stride" requires "parallelize_over_first_dimension" to be set '
+                             'and can not be combined with "interleaved".')
+
+        if storage not in (None, 'half', 'char', 'short'):
+            raise ValueError('The storage type "{}" is not supported, use one of "half", "char" '
+                             'or "short".'.format(storage))
+        if storage and 'w' in mode:
+            raise ValueError('Reduced precision storage is only available for read only data.')
+
+        self._interleaved = interleaved
+        self._interleaved_data = None
+        self._runtime_stride = runtime_stride
+        self._storage = storage
+        self._storage_tolerance = storage_tolerance
+        self._storage_data = None
+        self._storage_scale = 1
+        self._storage_offset = 0
         self._mode = mode
         self._is_readable = 'r' in mode
         self._is_writable = 'w' in mode
 
-        self._data = np.ascontiguousarray(data)  # array must be contiguous to be converted to ctype
-        if ctype and not ctype.startswith('mot_float_type'):
-            self._data = convert_data_to_dtype(self._data, ctype)
+        # lazily loaded sources are only read and converted when the data is needed, see _load_data()
+        self._source = None
+        if _is_lazy_source(data):
+            self._source = data
+            self._data = None
+        else:
+            self._data = np.ascontiguousarray(data)  # array must be contiguous to be converted to ctype
+            if ctype and not ctype.startswith('mot_float_type'):
+                self._data = convert_data_to_dtype(self._data, ctype)
+            self._update_buffer_data()
+
+        self._ctype = ctype or dtype_to_ctype(self._get_unloaded_data().dtype)
+        if self._storage and is_vector_ctype(self._ctype):
+            raise ValueError('Reduced precision storage is not available for vector types.')
 
-        self._ctype = ctype or dtype_to_ctype(self._data.dtype)
         self._mot_float_dtype = None
         self._backup_data_reference = None
         self._as_scalar = as_scalar
@@ -704,14 +856,21 @@ class Array(KernelData):
 
         self._use_host_ptr = use_host_ptr
         self._buffer_cache = {}  # caching the buffers per context
+        self._conversion_cache = {}  # caching the data and the buffers per mot_float_type, see set_mot_float_dtype()
 
-        self._data_length = 1
-        if len(self._data.shape):
-            self._data_length = self._data.strides[0] // self._data.itemsize
-        if not self._parallelize_over_first_dimension:
-            self._data_length = self._data.size
+        self._allow_constant_memory = allow_constant_memory
+        self._in_constant_memory = False
+
+        # for subsets gathering the problem instances from the data, see get_subset()
+        self._problem_indices = None
+        self._index_buffers = {}
+
+        # for shared copies of an array, the array owning the data and the device buffers, see _get_shared_copy()
+        self._buffer_owner = None
+
+        self._data_length = self._get_data_length()
 
-        if self._as_scalar and len(np.squeeze(self._data).shape) > 1:
+        if self._as_scalar and len([d for d in self._get_unloaded_data().shape if d != 1]) > 1:
             raise ValueError('The option "as_scalar" was set, but the data has more than one dimension.')
 
     @property
@@ -727,100 +886,197 @@ class Array(KernelData):
         """
         return self._mode
 
+    @property
+    def parallelize_over_first_dimension(self):
+        """Check if this array is split over the problem instances, or shared by all problem instances.
+
+        Returns:
+            boolean: if every problem instance receives its own part of the data
+        """
+        return self._parallelize_over_first_dimension
+
+    @property
+    def interleaved(self):
+        """Check if this array is stored interleaved over the problem instances.
+
+        Returns:
+            boolean: if the data is stored with the problem instances as last dimension
+        """
+        return self._interleaved
+
+    @property
+    def in_constant_memory(self):
+        """Check if this array is loaded in the ``constant`` address space instead of in global memory.
+
+        Returns:
+            boolean: if this array is placed in constant memory
+        """
+        return self._in_constant_memory
+
+    def is_constant_memory_candidate(self):
+        """Check if this array may be placed in constant memory.
+
+        This is the case for read only arrays shared by all problem instances, if allowed at construction.
+
+        Returns:
+            boolean: if this array can be placed in constant memory
+        """
+        return self._allow_constant_memory and self._mode == 'r' and not self._parallelize_over_first_dimension
+
+    def with_constant_memory(self, arrays):
+        if not any(array is self for array in arrays):
+            return self
+        array = self._get_shared_copy()
+        array.set_in_constant_memory(True)
+        return array
+
+    def set_in_constant_memory(self, in_constant_memory):
+        """Set if this array is to be loaded in the ``constant`` address space.
+
+        This changes the generated kernel code and should be set prior to generating the kernel.
+
+        Args:
+            in_constant_memory (boolean): if we place this array in constant memory
+
+        Raises:
+            ValueError: if this array is not a candidate for constant memory, see :meth:`is_constant_memory_candidate`
+        """
+        if in_constant_memory and not self.is_constant_memory_candidate():
+            raise ValueError('Only read only arrays shared by all problem instances can be placed in constant memory.')
+        self._in_constant_memory = in_constant_memory
+
     def get_subset(self, problem_indices=None, batch_range=None):
         if problem_indices is None and batch_range is None:
             return self
         if not self._parallelize_over_first_dimension:
             return self
 
-        if problem_indices is None:
-            return Array(self._data[batch_range[0]:batch_range[1]], ctype=self._ctype,
-                         mode=self._mode, as_scalar=self._as_scalar,
-                         parallelize_over_first_dimension=self._parallelize_over_first_dimension,
-                         use_host_ptr=self._use_host_ptr)
-
         def is_consecutive(l):
             return np.sum(np.diff(np.sort(l)) == 1) >= (len(l) - 1)
 
-        if is_consecutive(problem_indices):
-            return Array(self._data[problem_indices[0]:(problem_indices[-1] + 1)], ctype=self._ctype,
-                         mode=self._mode, as_scalar=self._as_scalar,
-                         parallelize_over_first_dimension=self._parallelize_over_first_dimension,
-                         use_host_ptr=self._use_host_ptr)
+        if self._problem_indices is not None:
+            if problem_indices is None:
+                return self._get_gathered_subset(self._problem_indices[batch_range[0]:batch_range[1]])
+            return self._get_gathered_subset(self._problem_indices[np.asarray(problem_indices)])
+        if problem_indices is not None and self._data is not None and not is_consecutive(problem_indices):
+            return self._get_gathered_subset(problem_indices)
 
-        return Array(self._data[problem_indices], ctype=self._ctype,
-                     mode=self._mode, as_scalar=self._as_scalar,
-                     parallelize_over_first_dimension=self._parallelize_over_first_dimension,
-                     use_host_ptr=self._use_host_ptr)
+        if self._interleaved and self._is_writable:
+            raise ValueError('Can not take a subset of a writable interleaved array, since the subset is a copy.')
+
+        data = self._get_unloaded_data()
+
+        if problem_indices is None:
+            subset_data = data[batch_range[0]:batch_range[1]]
+        elif is_consecutive(problem_indices):
+            subset_data = data[problem_indices[0]:(problem_indices[-1] + 1)]
+        else:
+            subset_data = data[problem_indices]
+
+        subset = Array(subset_data, ctype=self._ctype,
+                       mode=self._mode, as_scalar=self._as_scalar,
+                       parallelize_over_first_dimension=self._parallelize_over_first_dimension,
+                       use_host_ptr=self._use_host_ptr, allow_constant_memory=self._allow_constant_memory,
+                       interleaved=self._interleaved, storage=self._storage,
+                       storage_tolerance=self._storage_tolerance, runtime_stride=self._runtime_stride)
+        if self._mot_float_dtype is not None:
+            subset.set_mot_float_dtype(self._mot_float_dtype)
+        return subset
 
     def set_mot_float_dtype(self, mot_float_dtype):
-        self._mot_float_dtype = mot_float_dtype
+        if self._buffer_owner is not None:
+            self._buffer_owner.set_mot_float_dtype(mot_float_dtype)
+            self._update_from_owner()
+            return
 
-        if self._ctype.startswith('mot_float_type'):
-            if self._backup_data_reference is not None:
-                self._data = self._backup_data_reference
-                self._backup_data_reference = None
+        self._mot_float_dtype = mot_float_dtype
 
-            new_data = convert_data_to_dtype(self._data, self._ctype,
-                                             mot_float_type=dtype_to_ctype(mot_float_dtype))
+        if self._ctype.startswith('mot_float_type') and self._data is not None:
+            dtype = np.dtype(ctype_to_dtype(self._ctype, dtype_to_ctype(mot_float_dtype)))
+
+            if self._data.dtype != dtype:
+                self._cache_conversion()
+
+                if dtype in self._conversion_cache:
+                    (self._data, self._interleaved_data, self._storage_data, self._storage_scale,
+                     self._storage_offset, self._buffer_cache) = self._uncache_conversion(dtype)
+                elif self._source is not None:
+                    # lazily loaded sources are read again when needed, instead of keeping an unconverted copy
+                    self._data = None
+                    self._interleaved_data = None
+                    self._storage_data = None
+                    self._buffer_cache = {}
+                else:
+                    if self._backup_data_reference is None:
+                        self._backup_data_reference = self._data
 
-            if new_data is not self._data:
-                self._backup_data_reference = self._data
-                self._data = new_data
-                self._buffer_cache = {}  # cache is invalidated
+                    self._data = convert_data_to_dtype(self._backup_data_reference, self._ctype,
+                                                       mot_float_type=dtype_to_ctype(mot_float_dtype))
+                    self._update_buffer_data()
+                    self._buffer_cache = {}  # cache is invalidated
 
         # data length may change when an CL vector type is converted from (n, 3) shape to (n,)
-        self._data_length = 1
-        if len(self._data.shape):
-            self._data_length = self._data.strides[0] // self._data.itemsize
-        if not self._parallelize_over_first_dimension:
-            self._data_length = self._data.size
+        self._data_length = self._get_data_length()
 
     def get_data(self):
+        self._load_data()
+        if self._problem_indices is not None:
+            return self._data[self._problem_indices]
         return self._data
 
     def get_children(self):
         return []
 
     def get_scalar_arg_dtypes(self):
-        return [None]
+        dtypes = [None]
+        if self._interleaved or self._runtime_stride:
+            dtypes.append(np.uint64)
+        if self._storage in ('char', 'short'):
+            dtypes.extend([np.float32, np.float32])
+        if self._problem_indices is not None:
+            dtypes.append(None)
+        return dtypes
 
     def get_type_definitions(self):
         return ''
 
     def initialize_variable(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
         if not self._as_scalar:
-            if address_space == 'private':
+            # arrays which can not be addressed directly are, in a struct (initialized with a global address space),
+            # copied to private memory
+            if address_space == 'private' or (address_space == 'global' and not self._is_directly_addressable()):
                 return '''
                     private {ctype} {v_name}[{nmr_elements}];
 
                     for(uint i = 0; i < {nmr_elements}; i++){{
-                        {v_name}[i] = {k_name}[{offset} + i];
+                        {v_name}[i] = {value};
                     }}
-                '''.format(ctype=self._ctype, v_name=variable_name, k_name=kernel_param_name,
-                           nmr_elements=self._data_length,
-                           offset=self._get_offset_str(problem_id_substitute))
+                '''.format(ctype=self._ctype, v_name=variable_name, nmr_elements=self._data_length,
+                           value=self._get_load_str(kernel_param_name, problem_id_substitute, 'i'))
             elif address_space == 'local':
                 return '''
                     local {ctype} {v_name}[{nmr_elements}];
 
                     if(get_local_id(0) == 0){{
                         for(uint i = 0; i < {nmr_elements}; i++){{
-                            {v_name}[i] = {k_name}[{offset} + i];
+                            {v_name}[i] = {value};
                         }}
                     }}
                     barrier(CLK_LOCAL_MEM_FENCE);
-                '''.format(ctype=self._ctype, v_name=variable_name, k_name=kernel_param_name,
-                           nmr_elements=self._data_length,
-                           offset=self._get_offset_str(problem_id_substitute))
+                '''.format(ctype=self._ctype, v_name=variable_name, nmr_elements=self._data_length,
+                           value=self._get_load_str(kernel_param_name, problem_id_substitute, 'i'))
         return ''
 
     def get_function_call_input(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
         if self._as_scalar:
-            return '{}[{}]'.format(kernel_param_name, self._get_offset_str(problem_id_substitute))
+            return self._get_load_str(kernel_param_name, problem_id_substitute, '0')
         else:
-            if address_space == 'global':
-                return '{} + {}'.format(kernel_param_name, self._get_offset_str(problem_id_substitute))
+            if address_space in ('global', 'constant'):
+                if not self._is_directly_addressable():
+                    raise ValueError('Interleaved arrays and arrays with reduced precision storage can not be used '
+                                     'as a global pointer, use the private or local address space instead.')
+                return '{} + {}'.format(kernel_param_name, self._get_offset_str(
+                    self._get_problem_id_str(kernel_param_name, problem_id_substitute), kernel_param_name))
             elif address_space == 'private':
                 return variable_name
             elif address_space == 'local':
@@ -829,37 +1085,52 @@ class Array(KernelData):
     def post_function_callback(self, variable_name, kernel_param_name, problem_id_substitute, address_space):
         if self._is_writable:
             if not self._as_scalar:
-                if address_space == 'private':
+                if address_space == 'private' or (address_space == 'global' and self._interleaved):
                     return '''
                         for(uint i = 0; i < {nmr_elements}; i++){{
-                            {k_name}[{offset} + i] = {v_name}[i];
+                            {k_name}[{index}] = {v_name}[i];
                         }}
                     '''.format(v_name=variable_name, k_name=kernel_param_name,
-                               nmr_elements=self._data_length, offset=self._get_offset_str(problem_id_substitute))
+                               nmr_elements=self._data_length,
+                               index=self._get_index_str(kernel_param_name, problem_id_substitute, 'i'))
                 elif address_space == 'local':
                     return '''
                         if(get_local_id(0) == 0){{
                             for(uint i = 0; i < {nmr_elements}; i++){{
-                                {k_name}[{offset} + i] = {v_name}[i];
+                                {k_name}[{index}] = {v_name}[i];
                             }}
                         }}
                     '''.format(v_name=variable_name, k_name=kernel_param_name,
                                nmr_elements=self._data_length,
-                               offset=self._get_offset_str(problem_id_substitute))
+                               index=self._get_index_str(kernel_param_name, problem_id_substitute, 'i'))
         return ''
 
     def get_struct_declaration(self, name):
         if self._as_scalar:
             return '{} {};'.format(self._ctype, name)
-        return 'global {}* restrict {};'.format(self._ctype, name)
+        if not self._is_directly_addressable():
+            return 'private {}* {};'.format(self._ctype, name)
+        return '{} {}* restrict {};'.format(self._get_buffer_address_space(), self._ctype, name)
 
     def get_struct_initialization(self, variable_name, kernel_param_name, problem_id_substitute):
-        return self.get_function_call_input(variable_name, kernel_param_name, problem_id_substitute, 'global')
+        if not self._as_scalar and not self._is_directly_addressable():
+            return variable_name
+        return self.get_function_call_input(variable_name, kernel_param_name, problem_id_substitute,
+                                            self._get_buffer_address_space())
 
     def get_kernel_parameters(self, kernel_param_name):
-        return ['global {}* restrict {}'.format(self._ctype, kernel_param_name)]
+        parameters = ['{} {}* restrict {}'.format(self._get_buffer_address_space(), self._storage or self._ctype,
+                                                  kernel_param_name)]
+        if self._interleaved or self._runtime_stride:
+            parameters.append('ulong {}_stride'.format(kernel_param_name))
+        if self._storage in ('char', 'short'):
+            parameters.extend(['float {}_scale'.format(kernel_param_name),
+                               'float {}_offset'.format(kernel_param_name)])
+        if self._problem_indices is not None:
+            parameters.append('global ulong* restrict {}_indices'.format(kernel_param_name))
+        return parameters
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         if isinstance(cl_environments, CLEnvironment):
             cl_environments = [cl_environments]
 
@@ -879,16 +1150,28 @@ class Array(KernelData):
                         wait_list.append(wait_event)
 
                 if not any(e.context is env.context for e in events.keys()):
-                    if self._use_host_ptr:
-                        _, event = cl.enqueue_map_buffer(
-                            env.queue, self._buffer_cache[context],
-                            cl.map_flags.READ, 0, self._data.shape, self._data.dtype,
-                            order="C", wait_for=wait_list, is_blocking=False)
-                    else:
-                        event = cl.enqueue_copy(env.queue, self._data, self._buffer_cache[context],
-                                                is_blocking=False, wait_for=wait_list)
-
-                    events[env] = event
+                    buffer = self._buffer_cache[context]
+
+                    region_events = []
+                    for offset, region in self._get_host_regions(_get_context_ranges(problem_ranges, context)):
+                        if self._use_host_ptr:
+                            with trace_phase('map_to_host', device=env.device.name, bytes=region.nbytes):
+                                _, event = cl.enqueue_map_buffer(
+                                    env.queue, buffer, cl.map_flags.READ, offset, region.shape, region.dtype,
+                                    order="C", wait_for=wait_list, is_blocking=False)
+                            profile_event(env, event, 'transfer', 'map_to_host', nmr_bytes=region.nbytes)
+                        else:
+                            with trace_phase('transfer_to_host', device=env.device.name, bytes=region.nbytes):
+                                event = cl.enqueue_copy(env.queue, region, buffer, device_offset=offset,
+                                                        is_blocking=False, wait_for=wait_list)
+                            profile_event(env, event, 'transfer', 'transfer_to_host', nmr_bytes=region.nbytes)
+                            add_buffer_events([buffer], [event])
+                        region_events.append(event)
+
+                    if len(region_events) == 1:
+                        events[env] = region_events[0]
+                    elif region_events:
+                        events[env] = cl.enqueue_marker(env.queue, wait_for=region_events)
 
         if is_blocking:
             for env in cl_environments:
@@ -916,8 +1199,12 @@ class Array(KernelData):
                         wait_list.append(wait_event)
 
                 if not any(e.context is env.context for e in events.keys()):
-                    event = cl.enqueue_copy(env.queue, self._buffer_cache[context], self._data,
-                                            is_blocking=False, wait_for=wait_list)
+                    buffer_data = self._get_buffer_data()
+                    with trace_phase('transfer_to_device', device=env.device.name, bytes=buffer_data.nbytes):
+                        event = cl.enqueue_copy(env.queue, self._buffer_cache[context], buffer_data,
+                                                is_blocking=False, wait_for=wait_list)
+                    profile_event(env, event, 'transfer', 'transfer_to_device', nmr_bytes=buffer_data.nbytes)
+                    add_buffer_events([self._buffer_cache[context]], [event])
                     events[env] = event
 
         if is_blocking:
@@ -927,6 +1214,8 @@ class Array(KernelData):
         return events
 
     def get_kernel_inputs(self, cl_environment, workgroup_size):
+        self._load_data()
+
         def get_mem_flags():
             if self._is_writable:
                 if self._is_readable:
@@ -937,31 +1226,370 @@ class Array(KernelData):
                 return cl.mem_flags.READ_ONLY
 
         cl_context = cl_environment.context
+        buffer_data = self._get_buffer_data()
 
         if cl_context not in self._buffer_cache:
-            if self._use_host_ptr:
-                self._buffer_cache[cl_context] = cl.Buffer(cl_context,
-                                                           get_mem_flags() | cl.mem_flags.USE_HOST_PTR,
-                                                           hostbuf=self._data)
-            else:
-                self._buffer_cache[cl_context] = cl.Buffer(cl_context, get_mem_flags(), size=self._data.nbytes)
-
-        return [self._buffer_cache[cl_context]]
+            with trace_phase('create_buffer', bytes=buffer_data.nbytes, use_host_ptr=self._use_host_ptr):
+                if self._use_host_ptr:
+                    self._buffer_cache[cl_context] = cl.Buffer(cl_context,
+                                                               get_mem_flags() | cl.mem_flags.USE_HOST_PTR,
+                                                               hostbuf=buffer_data)
+                else:
+                    # the buffers of shared copies, like gathered subsets, are owned by the original array
+                    self._buffer_cache[cl_context] = _get_device_buffer(
+                        self._buffer_owner or self, cl_context, get_mem_flags(), buffer_data.nbytes)
+
+        inputs = [self._buffer_cache[cl_context]]
+        if self._interleaved:
+            inputs.append(np.uint64(self._data.shape[0]))
+        elif self._runtime_stride:
+            inputs.append(np.uint64(self._data_length))
+        if self._storage in ('char', 'short'):
+            inputs.extend([np.float32(self._storage_scale), np.float32(self._storage_offset)])
+        if self._problem_indices is not None:
+            if cl_context not in self._index_buffers:
+                self._index_buffers[cl_context] = cl.Buffer(
+                    cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=self._problem_indices)
+            inputs.append(self._index_buffers[cl_context])
+        return inputs
 
     def get_nmr_kernel_inputs(self):
-        return 1
+        return len(self.get_scalar_arg_dtypes())
 
-    def _get_offset_str(self, problem_id_substitute):
+    def _get_offset_str(self, problem_id_substitute, kernel_param_name=None):
+        if self._runtime_stride:
+            return '{}_stride * {}'.format(kernel_param_name, problem_id_substitute)
         if self._parallelize_over_first_dimension:
             offset_str = str(self._data_length) + ' * {problem_id}'
         else:
             offset_str = '0'
         return offset_str.replace('{problem_id}', problem_id_substitute)
 
+    def _get_index_str(self, kernel_param_name, problem_id_substitute, element_index):
+        """Get the index in the kernel buffer of the given element of a problem instance.
+
+        Args:
+            kernel_param_name (str): the kernel parameter name, used for the stride of interleaved arrays
+            problem_id_substitute (str): the substitute for the problem instance index
+            element_index (str): the index of the element within the data of the problem instance
+
+        Returns:
+            str: the index of the element in the buffer
+        """
+        problem_id_substitute = self._get_problem_id_str(kernel_param_name, problem_id_substitute)
+        if self._interleaved:
+            return '({}) * {}_stride + {}'.format(element_index, kernel_param_name, problem_id_substitute)
+        return '{} + {}'.format(self._get_offset_str(problem_id_substitute, kernel_param_name), element_index)
+
+    def _cache_conversion(self):
+        """Cache the current data, converted for a ``mot_float_type``, and its device buffers.
+
+        This allows switching between the single and double precision without converting and uploading the data
+        again. Only read only data is cached, since the cached data would otherwise not reflect the writes done
+        in another precision. Data larger than :func:`mot.configuration.get_max_cached_conversion_size` is not cached.
+        The total size of the cached conversions of all arrays is limited by the :class:`ConversionCache`.
+        """
+        from mot.configuration import get_conversion_cache, get_max_cached_conversion_size
+
+        conversion_cache = get_conversion_cache()
+        if conversion_cache is None or self._is_writable or self._data.nbytes > get_max_cached_conversion_size():
+            return
+
+        host_data = self._interleaved_data if self._interleaved else self._data
+        nmr_bytes = host_data.nbytes + sum(buffer.size for buffer in self._buffer_cache.values())
+        if self._storage_data is not None:
+            nmr_bytes += self._storage_data.nbytes
+
+        if conversion_cache.add(self, self._data.dtype, nmr_bytes):
+            self._conversion_cache[self._data.dtype] = (self._data, self._interleaved_data, self._storage_data,
+                                                        self._storage_scale, self._storage_offset,
+                                                        self._buffer_cache)
+
+    def _uncache_conversion(self, dtype):
+        """Take the cached conversion for the given dtype out of the cache, to use it again.
+
+        Args:
+            dtype (np.dtype): the dtype of the cached conversion
+
+        Returns:
+            tuple: the data, interleaved data, storage data, storage scale, storage offset and device buffers
+        """
+        from mot.configuration import get_conversion_cache
+
+        conversion_cache = get_conversion_cache()
+        if conversion_cache is not None:
+            conversion_cache.remove(self, dtype)
+        return self._conversion_cache.pop(dtype)
+
+    def _release_conversion(self, dtype):
+        """Release the cached conversion for the given dtype, returning its pooled device buffers to the pool.
+
+        This is called by the :class:`ConversionCache` when evicting the conversion.
+
+        Args:
+            dtype (np.dtype): the dtype of the cached conversion
+        """
+        conversion = self._conversion_cache.pop(dtype, None)
+        if conversion is not None:
+            _release_device_buffers(conversion[-1].values())
+
+    def _get_problem_id_str(self, kernel_param_name, problem_id_substitute):
+        """Get the index of the problem instance in the data, looked up in the index buffer for gathered subsets.
+
+        Args:
+            kernel_param_name (str): the kernel parameter name
+            problem_id_substitute (str): the substitute for the problem instance index
+
+        Returns:
+            str: the index of the problem instance in the data
+        """
+        if self._problem_indices is not None:
+            return '{}_indices[{}]'.format(kernel_param_name, problem_id_substitute)
+        return problem_id_substitute
+
+    def _get_gathered_subset(self, problem_indices):
+        """Get a subset of this array which gathers the given problem instances from the data of this array.
+
+        The subset shares the data and the device buffers with this array, only the problem indices are uploaded.
+
+        Args:
+            problem_indices (Iterable[int]): the indices of the problem instances in the data of this array
+
+        Returns:
+            Array: the subset
+        """
+        subset = self._get_shared_copy()
+        subset._problem_indices = np.ascontiguousarray(problem_indices, dtype=np.uint64)
+        subset._index_buffers = {}
+        return subset
+
+    def _get_shared_copy(self):
+        """Get a shallow copy of this array, sharing the data and the device buffers with this array.
+
+        The data, its conversions and the device buffers remain owned by this array (or by the owner of this array).
+        The copy only owns its problem indices, index buffers and address space. Changes of the ``mot_float_type``
+        and the loading of the data are delegated to the owner, after which the copy takes over the state of the
+        owner, see :meth:`_update_from_owner`. As such, the writes done using the copy always reach the owner, and
+        the pooled device buffers are not returned to the pool while the owner is still using them.
+
+        Returns:
+            Array: the shallow copy
+        """
+        array = copy(self)
+        array._buffer_owner = self._buffer_owner or self
+        return array
+
+    def _update_from_owner(self):
+        """Take over the data, the conversions and the device buffers of the array owning the data of this copy."""
+        for name in ('_source', '_data', '_interleaved_data', '_storage_data', '_storage_scale', '_storage_offset',
+                     '_backup_data_reference', '_buffer_cache', '_conversion_cache', '_mot_float_dtype',
+                     '_data_length'):
+            setattr(self, name, getattr(self._buffer_owner, name))
+
+    def _get_host_regions(self, problem_ranges=None):
+        """Get the regions of the host data backing the device buffer, for transferring the given problem instances.
+
+        Only arrays parallelized over the problem instances can be transferred partially. Interleaved arrays and
+        gathered subsets do not store the problem instances contiguously, these can only be transferred completely.
+
+        Args:
+            problem_ranges (List[Tuple[int, int]]): the ranges of the problem instances to transfer,
+                if None, we transfer all the data
+
+        Returns:
+            List[Tuple[int, ndarray]]: per region the offset in bytes in the device buffer and the view on the
+                host data of that region
+
+        Raises:
+            ValueError: if the given ranges do not cover all the problem instances of an array which can only be
+                transferred completely
+        """
+        buffer_data = self._get_buffer_data()
+        if problem_ranges is None or not self._parallelize_over_first_dimension or not buffer_data.ndim:
+            return [(0, buffer_data)]
+
+        if self._problem_indices is not None:
+            nmr_problems = len(self._problem_indices)
+        else:
+            nmr_problems = self._data.shape[0]
+        problem_ranges = _merge_ranges(problem_ranges, nmr_problems)
+
+        if self._interleaved or self._problem_indices is not None:
+            if problem_ranges != [(0, nmr_problems)]:
+                raise ValueError('Writable interleaved arrays and writable gathered subsets can only be transferred '
+                                 'completely, as such, these can not be written by multiple devices.')
+            return [(0, buffer_data)]
+
+        return [(start * buffer_data.strides[0], buffer_data[start:end]) for start, end in problem_ranges]
+
+    def _get_load_str(self, kernel_param_name, problem_id_substitute, element_index):
+        """Get the CL expression loading the given element of a problem instance from the kernel buffer.
+
+        For reduced precision storage this converts the stored value back to the ctype of this array.
+
+        Args:
+            kernel_param_name (str): the kernel parameter name
+            problem_id_substitute (str): the substitute for the problem instance index
+            element_index (str): the index of the element within the data of the problem instance
+
+        Returns:
+            str: the CL expression for the value of the element
+        """
+        index = self._get_index_str(kernel_param_name, problem_id_substitute, element_index)
+        if self._storage == 'half':
+            return '(({}) vload_half({}, {}))'.format(self._ctype, index, kernel_param_name)
+        elif self._storage:
+            return '(({ctype}) ({k}[{index}] * {k}_scale + {k}_offset))'.format(
+                ctype=self._ctype, k=kernel_param_name, index=index)
+        return '{}[{}]'.format(kernel_param_name, index)
+
+    def _is_directly_addressable(self):
+        """Check if the buffer of this array can be used as a pointer to the data of a problem instance.
+
+        Returns:
+            boolean: False for interleaved arrays and for arrays with reduced precision storage, True otherwise
+        """
+        return not self._interleaved and not self._storage
+
+    def _get_buffer_data(self):
+        """Get the host data backing the device buffer.
+
+        Returns:
+            ndarray: the contiguous data, in the interleaved layout and in the storage type if applicable
+        """
+        if self._storage:
+            return self._storage_data
+        if self._interleaved:
+            return self._interleaved_data
+        return self._data
+
+    def _update_buffer_data(self):
+        """Prepare the host data backing the device buffer, after the data has been set or converted.
+
+        For interleaved arrays, this stores the data in the interleaved layout, with the problem instances as last
+        dimension. Afterwards, the data is a view on the interleaved data with the problem instances as first
+        dimension, such that :meth:`get_data` reflects the results written by the kernel. This does not copy
+        data which is already such a view.
+
+        For reduced precision storage, this converts the data to the storage type.
+        """
+        if self._data is None:
+            return
+
+        if self._interleaved:
+            if self._data.ndim:
+                self._interleaved_data = np.ascontiguousarray(np.moveaxis(self._data, 0, -1))
+                self._data = np.moveaxis(self._interleaved_data, -1, 0)
+            else:
+                self._interleaved_data = self._data
+
+        if self._storage:
+            self._storage_data, self._storage_scale, self._storage_offset = _convert_to_reduced_precision(
+                self._interleaved_data if self._interleaved else self._data, self._storage, self._storage_tolerance)
+
+    def _get_buffer_address_space(self):
+        """Get the address space of the buffer of this array in the kernel.
+
+        Returns:
+            str: either ``constant`` or ``global``
+        """
+        if self._in_constant_memory:
+            return 'constant'
+        return 'global'
+
+    def _get_unloaded_data(self):
+        """Get the data without loading it, this returns the lazily loaded source if the data is not yet loaded.
+
+        Returns:
+            ndarray or array-like: the loaded data or the lazily loaded source, usable for slicing and for
+                inspecting the shape and dtype.
+        """
+        if self._data is None:
+            return self._source
+        return self._data
+
+    def _load_data(self):
+        """Load the data from the lazily loaded source, if not yet loaded.
+
+        This reads the source into a contiguous array and converts it to the ctype, and, if known, to the
+        ``mot_float_type``. No unconverted copy is kept, when the ``mot_float_type`` changes, the source is read again.
+        """
+        if self._buffer_owner is not None:
+            self._buffer_owner._load_data()
+            self._update_from_owner()
+            return
+
+        if self._data is not None:
+            return
+
+        self._data = self._convert_data(np.ascontiguousarray(self._source))
+        self._update_buffer_data()
+
+    def _convert_data(self, data):
+        """Convert the given contiguous data to the ctype of this array.
+
+        Args:
+            data (ndarray): the data to convert
+
+        Returns:
+            ndarray: the converted data, can be the same as the input
+        """
+        if not self._ctype.startswith('mot_float_type'):
+            return convert_data_to_dtype(data, self._ctype)
+        if self._mot_float_dtype is not None:
+            return convert_data_to_dtype(data, self._ctype, mot_float_type=dtype_to_ctype(self._mot_float_dtype))
+        return data
+
+    def _get_data_length(self):
+        """Get the number of data elements per problem instance, or in total if not parallelized over problems.
+
+        For lazily loaded sources which are not yet loaded, this converts only the first problem instance.
+
+        Returns:
+            int: the number of elements
+        """
+        if self._data is not None:
+            data = self._data
+            nmr_instances = 1
+        else:
+            if not len(self._source.shape) or not self._source.shape[0]:
+                return 1
+            data = self._convert_data(np.ascontiguousarray(self._source[:1]))
+            nmr_instances = self._source.shape[0]
+
+        data_length = 1
+        if self._interleaved:
+            data_length = int(np.prod(data.shape[1:]))
+        elif len(data.shape):
+            data_length = data.strides[0] // data.itemsize
+        if not self._parallelize_over_first_dimension:
+            data_length = data.size * nmr_instances
+        return data_length
+
+    def get_memory_requirements(self, workgroup_size):
+        if self._storage:
+            itemsize = np.dtype(ctype_to_dtype(self._storage)).itemsize
+        elif self._data is not None:
+            itemsize = self._data.itemsize
+        elif self._ctype.startswith('mot_float_type') and self._mot_float_dtype is None:
+            itemsize = self._source.dtype.itemsize
+        else:
+            # the lazily loaded source is converted to this dtype when loaded, see _convert_data()
+            itemsize = _get_itemsize(self._ctype, self._mot_float_dtype)
+
+        if self._problem_indices is not None:
+            nmr_instances = self._get_unloaded_data().shape[0]
+            return MemoryRequirements(buffers=[(0, int(self._data_length * itemsize * nmr_instances)),
+                                               (self._problem_indices.itemsize, 0)])
+        if self._parallelize_over_first_dimension:
+            return MemoryRequirements(buffers=[(int(self._data_length * itemsize), 0)])
+        return MemoryRequirements(buffers=[(0, int(self._data_length * itemsize))])
+
 
 class Zeros(KernelData):
 
-    def __init__(self, shape, ctype, parallelize_over_first_dimension=True, host_accessible=True, mode='rw'):
+    def __init__(self, shape, ctype, parallelize_over_first_dimension=True, host_accessible=True, mode='rw',
+                 use_host_ptr=True, runtime_stride=False):
         """Allocate an output buffer of the given shape.
 
         This is meant to quickly allocate a buffer large enough to hold the data requested. After running an OpenCL
@@ -971,6 +1599,10 @@ class Zeros(KernelData):
         be split over multiple buffers and there is no single continuous buffer with all the values. Therefore,
         this flag is not usable if you intend to share a :class:`Zeros` with multiple CLEnvironments.
 
+        Device side buffers, that is, if host accessible is False or if ``use_host_ptr`` is False, are taken from
+        the buffer pool (see :class:`BufferPool`). These are only initialized to zero if the kernel reads the data,
+        as such, with mode 'w' the kernel should write all the elements.
+
         Args:
             shape (int or tuple): the shape of the output array
             ctype (str): the desired C-type for this zero's array
@@ -982,11 +1614,16 @@ class Zeros(KernelData):
                 the buffer on the device, saving time on memory copies.
             mode (str): one of 'r', 'w' or 'rw', for respectively read, write or read and write. This sets the
                 mode of how the data is loaded into the compute device's memory.
+            use_host_ptr (boolean): only applicable if host accessible. If set, the buffer uses the memory of the
+                host array. If not set, we use a device side buffer and transfer the results after the kernel.
+            runtime_stride (boolean): only applicable if host accessible. If set, the offset between the problem
+                instances is a kernel argument, see :class:`Array`.
         """
         self._shape = shape
         if isinstance(self._shape, numbers.Number):
             self._shape = (self._shape,)
         self._host_accessible = host_accessible
+        self._use_host_ptr = use_host_ptr
         self._ctype = ctype
 
         self._mode = mode
@@ -1007,7 +1644,7 @@ class Zeros(KernelData):
         if host_accessible:
             self._array = Array(np.zeros(shape, dtype=ctype_to_dtype(ctype)), ctype,
                                 parallelize_over_first_dimension=parallelize_over_first_dimension,
-                                mode=mode, as_scalar=False)
+                                mode=mode, as_scalar=False, use_host_ptr=use_host_ptr, runtime_stride=runtime_stride)
 
     @property
     def ctype(self):
@@ -1017,6 +1654,10 @@ class Zeros(KernelData):
     def mode(self):
         return self._mode
 
+    @property
+    def parallelize_over_first_dimension(self):
+        return self._parallelize_over_first_dimension
+
     def get_subset(self, problem_indices=None, batch_range=None):
         if self._host_accessible:
             return self._array.get_subset(problem_indices, batch_range)
@@ -1024,9 +1665,11 @@ class Zeros(KernelData):
             shape = (len(problem_indices),) + self._shape[1:]
         else:
             shape = (batch_range[1] - batch_range[0],) + self._shape[1:]
-        return Zeros(shape, self._ctype, mode=self._mode,
-                     parallelize_over_first_dimension=self._parallelize_over_first_dimension,
-                     host_accessible=False)
+        subset = Zeros(shape, self._ctype, mode=self._mode,
+                       parallelize_over_first_dimension=self._parallelize_over_first_dimension,
+                       host_accessible=False)
+        subset.set_mot_float_dtype(self._mot_float_dtype)
+        return subset
 
     def set_mot_float_dtype(self, mot_float_dtype):
         if self._host_accessible:
@@ -1127,12 +1770,15 @@ class Zeros(KernelData):
     def get_kernel_parameters(self, kernel_param_name):
         return ['global {}* restrict {}'.format(self._ctype, kernel_param_name)]
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         if self._host_accessible:
-            return self._array.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for)
+            return self._array.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for,
+                                                   problem_ranges=problem_ranges)
         return {}
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
+        if self._host_accessible and not self._use_host_ptr and self._is_readable:
+            return self._array.enqueue_device_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for)
         return {}
 
     def get_kernel_inputs(self, cl_environment, workgroup_size):
@@ -1156,10 +1802,15 @@ class Zeros(KernelData):
             else:
                 flags = cl.mem_flags.READ_ONLY
 
-            buffer = cl.Buffer(cl_context, flags, size=np.prod(self._shape) * itemsize)
+            nmr_bytes = int(np.prod(self._shape) * itemsize)
+            with trace_phase('create_buffer', bytes=nmr_bytes, use_host_ptr=False):
+                buffer = _get_device_buffer(self, cl_context, flags, nmr_bytes)
 
-            cl.enqueue_fill_buffer(cl_environment.queue, buffer,
-                                   np.zeros(1, dtype=dtype), 0, np.prod(self._shape) * itemsize)
+            # write only data is not read by the kernel, as such, it does not need to be initialized
+            if self._is_readable:
+                event = cl.enqueue_fill_buffer(cl_environment.queue, buffer, np.zeros(1, dtype=dtype), 0, nmr_bytes)
+                profile_event(cl_environment, event, 'transfer', 'fill_buffer', nmr_bytes=nmr_bytes)
+                add_buffer_events([buffer], [event])
 
             self._buffer_cache[cl_context] = buffer
 
@@ -1175,6 +1826,15 @@ class Zeros(KernelData):
             offset_str = '0'
         return offset_str.replace('{problem_id}', problem_id_substitute)
 
+    def get_memory_requirements(self, workgroup_size):
+        if self._host_accessible:
+            return self._array.get_memory_requirements(workgroup_size)
+
+        itemsize = _get_itemsize(self._ctype, self._mot_float_dtype)
+        if self._parallelize_over_first_dimension:
+            return MemoryRequirements(buffers=[(int(self._data_length * itemsize), 0)])
+        return MemoryRequirements(buffers=[(0, int(self._data_length * itemsize))])
+
 
 class CompositeArray(KernelData):
 
@@ -1192,6 +1852,7 @@ class CompositeArray(KernelData):
         self._elements = elements
         self._ctype = ctype
         self._address_space = address_space
+        self._mot_float_dtype = None
 
         if self._address_space == 'private':
             self._composite_array = PrivateMemory(len(self._elements), self._ctype)
@@ -1206,9 +1867,16 @@ class CompositeArray(KernelData):
         return self._ctype
 
     def get_subset(self, problem_indices=None, batch_range=None):
-        return self
+        if problem_indices is None and batch_range is None:
+            return self
+        subset = CompositeArray([element.get_subset(problem_indices, batch_range) for element in self._elements],
+                                self._ctype, address_space=self._address_space)
+        if self._mot_float_dtype is not None:
+            subset.set_mot_float_dtype(self._mot_float_dtype)
+        return subset
 
     def set_mot_float_dtype(self, mot_float_dtype):
+        self._mot_float_dtype = mot_float_dtype
         for element in self._elements:
             element.set_mot_float_dtype(mot_float_dtype)
         self._composite_array.set_mot_float_dtype(mot_float_dtype)
@@ -1266,10 +1934,11 @@ class CompositeArray(KernelData):
             parameters.extend(d.get_kernel_parameters('{}_{}'.format(kernel_param_name, str(ind))))
         return parameters
 
-    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None):
+    def enqueue_host_access(self, cl_environments, is_blocking=True, wait_for=None, problem_ranges=None):
         events = {}
         for d in self._elements:
-            events.update(d.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for))
+            events.update(d.enqueue_host_access(cl_environments, is_blocking=is_blocking, wait_for=wait_for,
+                                                problem_ranges=problem_ranges))
         return events
 
     def enqueue_device_access(self, cl_environments, is_blocking=True, wait_for=None):
@@ -1287,3 +1956,595 @@ class CompositeArray(KernelData):
     def get_nmr_kernel_inputs(self):
         return self._composite_array.get_nmr_kernel_inputs() + \
                sum(element.get_nmr_kernel_inputs() for element in self._elements)
+
+    def get_memory_requirements(self, workgroup_size):
+        requirements = self._composite_array.get_memory_requirements(workgroup_size)
+        for element in self._elements:
+            requirements += element.get_memory_requirements(workgroup_size)
+        return requirements
+
+
+class MemoryRequirements:
+
+    def __init__(self, buffers=None, local_bytes=0, private_bytes=0):
+        """The device memory requirements of one or more kernel data elements.
+
+        Global memory is specified per buffer as the number of bytes per problem instance and the number of bytes
+        shared by all problem instances. Local memory is specified per workgroup, private memory per work item.
+
+        Requirements can be combined using the addition operator.
+
+        Args:
+            buffers (List[Tuple[int, int]]): per global memory buffer the number of bytes per problem instance and the
+                number of bytes independent of the number of problem instances.
+            local_bytes (int): the number of bytes of local memory needed per workgroup
+            private_bytes (int): the number of bytes of private memory needed per work item
+        """
+        self._buffers = list(buffers or [])
+        self._local_bytes = int(local_bytes)
+        self._private_bytes = int(private_bytes)
+
+    @property
+    def buffers(self):
+        return list(self._buffers)
+
+    @property
+    def local_bytes(self):
+        return self._local_bytes
+
+    @property
+    def private_bytes(self):
+        return self._private_bytes
+
+    @property
+    def bytes_per_instance(self):
+        """Get the number of bytes of global memory needed per problem instance, summed over all buffers."""
+        return sum(buffer[0] for buffer in self._buffers)
+
+    @property
+    def shared_bytes(self):
+        """Get the number of bytes of global memory independent of the number of problem instances."""
+        return sum(buffer[1] for buffer in self._buffers)
+
+    def get_global_memory_size(self, nmr_instances):
+        """Get the total number of bytes of global memory needed for the given number of problem instances.
+
+        Args:
+            nmr_instances (int): the number of problem instances
+
+        Returns:
+            int: the number of bytes of global memory, summed over all buffers
+        """
+        return self.bytes_per_instance * nmr_instances + self.shared_bytes
+
+    def get_max_buffer_size(self, nmr_instances):
+        """Get the size of the largest buffer for the given number of problem instances.
+
+        Args:
+            nmr_instances (int): the number of problem instances
+
+        Returns:
+            int: the number of bytes of the largest buffer, or 0 if there are no buffers
+        """
+        return max([per_instance * nmr_instances + shared for per_instance, shared in self._buffers], default=0)
+
+    def __add__(self, other):
+        return MemoryRequirements(self._buffers + other.buffers, self._local_bytes + other.local_bytes,
+                                  self._private_bytes + other.private_bytes)
+
+    def __repr__(self):
+        return 'MemoryRequirements(buffers={}, local_bytes={}, private_bytes={})'.format(
+            self._buffers, self._local_bytes, self._private_bytes)
+
+
+class BufferPool:
+
+    def __init__(self, max_size=256 * 1024 ** 2):
+        """Pool of device buffers, reusing the device allocations of the kernel data.
+
+        The kernel data objects request their device buffers from this pool. When a kernel data object is garbage
+        collected, its buffers are returned to the pool for reuse by another kernel data object requiring
+        a buffer of the same size and flags in the same context. As such, repeated evaluations with the
+        same shapes do not allocate new device memory.
+
+        Buffers using the host pointer (``USE_HOST_PTR``) wrap the memory of their host array and are not pooled.
+
+        Buffers are only reused after the kernel data owning them is garbage collected and after all the commands
+        using them completed. For the latter, the transfers and the kernel launches register their events
+        using :meth:`add_events`. Buffers returned while in use are held aside until their last event completes.
+
+        Args:
+            max_size (int): the maximum number of bytes of unused buffers retained by this pool. If the pool
+                grows beyond this size, we release the least recently returned buffers.
+        """
+        self._max_size = max_size
+        self._buffers = OrderedDict()
+        self._size = 0
+        self._buffer_events = {}
+        self._finalizers = {}
+        self._pending = []
+        # reentrant, since garbage collection within a locked section may return buffers to the pool
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_size(self):
+        """Get the maximum number of bytes retained by this pool.
+
+        Returns:
+            int: the maximum number of bytes of unused buffers held by this pool
+        """
+        return self._max_size
+
+    @property
+    def hits(self):
+        """Get the number of times a buffer request was served from the pool.
+
+        Returns:
+            int: the number of reused buffers
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """Get the number of times a buffer request required a new allocation.
+
+        Returns:
+            int: the number of allocated buffers
+        """
+        return self._misses
+
+    @property
+    def evictions(self):
+        """Get the number of buffers released because the pool exceeded its maximum size.
+
+        Returns:
+            int: the number of evicted buffers
+        """
+        return self._evictions
+
+    def get_size(self):
+        """Get the number of bytes of the unused buffers currently held by this pool.
+
+        Returns:
+            int: the retained size in bytes
+        """
+        return self._size
+
+    def get_buffer(self, owner, cl_context, flags, size):
+        """Get a device buffer of the given size and flags, reusing a pooled buffer if possible.
+
+        The buffer is returned to this pool when the owner is garbage collected and its registered events,
+        see :meth:`add_events`, completed.
+
+        Args:
+            owner (object): the object owning the buffer, typically a kernel data object
+            cl_context (cl.Context): the context for the buffer
+            flags (int): the memory flags of the buffer, can not contain ``USE_HOST_PTR``
+            size (int): the size of the buffer in bytes
+
+        Returns:
+            cl.Buffer: a buffer with undefined contents
+        """
+        key = (cl_context, int(flags), int(size))
+
+        with self._lock:
+            self._reclaim_pending()
+
+            buffers = self._buffers.get(key)
+            if buffers:
+                self._hits += 1
+                self._size -= size
+                buffer = buffers.pop()
+                if not buffers:
+                    del self._buffers[key]
+            else:
+                self._misses += 1
+                buffer = None
+
+        if buffer is None:
+            buffer = cl.Buffer(cl_context, flags, size=size)
+
+        with self._lock:
+            self._buffer_events[buffer] = []
+            self._finalizers[buffer] = weakref.finalize(owner, self._return_buffer, key, buffer)
+        return buffer
+
+    def release(self, buffers):
+        """Return the given buffers to the pool before their owner is garbage collected.
+
+        The owner may not use the buffers anymore afterwards. Buffers not handed out by this pool are ignored.
+
+        Args:
+            buffers (Iterable[cl.Buffer]): the buffers to return to the pool
+        """
+        for buffer in buffers:
+            with self._lock:
+                finalizer = self._finalizers.get(buffer)
+            if finalizer is not None:
+                finalizer()
+
+    def add_events(self, buffers, events):
+        """Register the events of enqueued commands using the given buffers.
+
+        The buffers of this pool are only reused after all their registered events completed. Buffers not handed
+        out by this pool are ignored, as such, this can be called with all the inputs of a kernel.
+
+        Args:
+            buffers (Iterable): the buffers used by the commands, non-buffer items are ignored
+            events (List[cl.Event]): the events of the commands
+        """
+        with self._lock:
+            for buffer in buffers:
+                if isinstance(buffer, cl.Buffer):
+                    buffer_events = self._buffer_events.get(buffer)
+                    if buffer_events is not None:
+                        buffer_events[:] = [event for event in buffer_events if not _is_completed(event)] + events
+
+    def clear(self):
+        """Release all the unused buffers held by this pool and reset the statistics."""
+        with self._lock:
+            self._buffers.clear()
+            self._pending = []
+            self._size = 0
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def _return_buffer(self, key, buffer):
+        """Return the given buffer to the pool, or hold it aside if it is still in use.
+
+        Args:
+            key (tuple): the context, flags and size of the buffer
+            buffer (cl.Buffer): the buffer to return to the pool
+        """
+        with self._lock:
+            self._finalizers.pop(buffer, None)
+            events = self._buffer_events.pop(buffer, [])
+            if all(_is_completed(event) for event in events):
+                self._add_to_pool(key, buffer)
+            else:
+                self._pending.append((key, buffer, events))
+
+    def _reclaim_pending(self):
+        """Add the returned buffers whose commands completed to the pool."""
+        pending = []
+        for key, buffer, events in self._pending:
+            if all(_is_completed(event) for event in events):
+                self._add_to_pool(key, buffer)
+            else:
+                pending.append((key, buffer, events))
+        self._pending = pending
+
+    def _add_to_pool(self, key, buffer):
+        """Add the given buffer to the pool, releasing the least recently returned buffers if the pool is too large.
+
+        Args:
+            key (tuple): the context, flags and size of the buffer
+            buffer (cl.Buffer): the buffer to add to the pool
+        """
+        size = key[2]
+        if size > self._max_size:
+            return
+
+        with self._lock:
+            self._buffers.setdefault(key, []).append(buffer)
+            self._buffers.move_to_end(key)
+            self._size += size
+
+            while self._size > self._max_size:
+                oldest_key, buffers = next(iter(self._buffers.items()))
+                buffers.pop(0)
+                if not buffers:
+                    del self._buffers[oldest_key]
+                self._size -= oldest_key[2]
+                self._evictions += 1
+
+
+class ConversionCache:
+
+    def __init__(self, max_size=512 * 1024 ** 2):
+        """Budget for the data conversions cached by the arrays when changing the ``mot_float_type``.
+
+        When switching between single and double precision, read only arrays keep their data converted for the
+        previous ``mot_float_type`` together with its device buffers, such that switching back does not convert and
+        upload the data again. This cache limits the total size of these conversions over all arrays, counting both
+        the host data and the device buffers. If the total exceeds the maximum size, we release the least recently
+        cached conversions and return their pooled device buffers to the buffer pool.
+
+        Args:
+            max_size (int): the maximum number of bytes of the cached conversions, host and device memory combined.
+        """
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        # reentrant, since garbage collection within a locked section may remove entries
+        self._lock = threading.RLock()
+        self._evictions = 0
+
+    @property
+    def max_size(self):
+        """Get the maximum number of bytes of the cached conversions.
+
+        Returns:
+            int: the maximum size in bytes
+        """
+        return self._max_size
+
+    @property
+    def evictions(self):
+        """Get the number of conversions released because the cache exceeded its maximum size.
+
+        Returns:
+            int: the number of evicted conversions
+        """
+        return self._evictions
+
+    def get_size(self):
+        """Get the number of bytes of the conversions currently cached.
+
+        Returns:
+            int: the cached size in bytes
+        """
+        return self._size
+
+    def add(self, array, dtype, size):
+        """Register a conversion cached by the given array, releasing the least recently cached conversions if needed.
+
+        Args:
+            array (Array): the array caching the conversion
+            dtype (np.dtype): the dtype of the cached conversion
+            size (int): the number of bytes of the conversion, host and device memory combined
+
+        Returns:
+            boolean: if the array may cache the conversion, False if it is larger than the maximum size
+        """
+        if size > self._max_size:
+            return False
+
+        key = (id(array), dtype)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (weakref.ref(array, lambda ref: self._remove(key)), size)
+            self._size += size
+
+            while self._size > self._max_size:
+                self._evict(next(iter(self._entries)))
+        return True
+
+    def remove(self, array, dtype):
+        """Unregister a conversion, for example when the array uses the conversion again.
+
+        Args:
+            array (Array): the array caching the conversion
+            dtype (np.dtype): the dtype of the cached conversion
+        """
+        self._remove((id(array), dtype))
+
+    def clear(self):
+        """Release all the cached conversions and reset the statistics."""
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+            self._evictions = 0
+
+    def _remove(self, key):
+        """Remove the given entry from the bookkeeping, without releasing the conversion.
+
+        Args:
+            key (tuple): the id of the array and the dtype of the conversion
+
+        Returns:
+            tuple: the weak reference to the array and the size of the conversion, or None if not present
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+            return entry
+
+    def _evict(self, key):
+        """Release the conversion of the given entry.
+
+        Args:
+            key (tuple): the id of the array and the dtype of the conversion
+        """
+        array_reference, _ = self._remove(key)
+        array = array_reference()
+        if array is not None:
+            array._release_conversion(key[1])
+        self._evictions += 1
+
+
+def _get_device_buffer(owner, cl_context, flags, size):
+    """Get a device buffer from the configured buffer pool, or allocate a new buffer if pooling is disabled.
+
+    Args:
+        owner (KernelData): the kernel data owning the buffer
+        cl_context (cl.Context): the context for the buffer
+        flags (int): the memory flags of the buffer
+        size (int): the size of the buffer in bytes
+
+    Returns:
+        cl.Buffer: the device buffer
+    """
+    from mot.configuration import get_buffer_pool
+
+    buffer_pool = get_buffer_pool()
+    if buffer_pool is None:
+        return cl.Buffer(cl_context, flags, size=size)
+    return buffer_pool.get_buffer(owner, cl_context, flags, size)
+
+
+def _release_device_buffers(buffers):
+    """Return the given device buffers to the configured buffer pool, if pooling is enabled.
+
+    See :meth:`BufferPool.release`.
+
+    Args:
+        buffers (Iterable[cl.Buffer]): the buffers to release
+    """
+    from mot.configuration import get_buffer_pool
+
+    buffer_pool = get_buffer_pool()
+    if buffer_pool is not None:
+        buffer_pool.release(buffers)
+
+
+def add_buffer_events(kernel_inputs, events):
+    """Register the events of enqueued commands with the configured buffer pool, if pooling is enabled.
+
+    See :meth:`BufferPool.add_events`.
+
+    Args:
+        kernel_inputs (Iterable): the kernel inputs used by the commands, non-buffer items are ignored
+        events (List[cl.Event]): the events of the commands
+    """
+    from mot.configuration import get_buffer_pool
+
+    buffer_pool = get_buffer_pool()
+    if buffer_pool is not None:
+        buffer_pool.add_events(kernel_inputs, events)
+
+
+def _get_context_ranges(problem_ranges, cl_context):
+    """Get the ranges of the problem instances processed by all the environments of the given context.
+
+    Args:
+        problem_ranges (Dict[CLEnvironment: List[Tuple[int, int]]]): per environment the ranges of the problem
+            instances, can be None
+        cl_context (cl.Context): the context for which we want the ranges
+
+    Returns:
+        List[Tuple[int, int]] or None: the ranges of all the environments of the context, None if no ranges are given
+    """
+    if problem_ranges is None:
+        return None
+    return [problem_range for env, ranges in problem_ranges.items() if env.context is cl_context
+            for problem_range in ranges]
+
+
+def _merge_ranges(ranges, nmr_problems):
+    """Sort and merge the given ranges of problem instances, removing the empty ranges.
+
+    Args:
+        ranges (List[Tuple[int, int]]): the ranges, start and end (exclusive)
+        nmr_problems (int): the number of problem instances, the ranges are clipped to this number
+
+    Returns:
+        List[Tuple[int, int]]: the sorted, non-overlapping and non-adjacent ranges
+    """
+    merged = []
+    for start, end in sorted((max(0, int(start)), min(nmr_problems, int(end))) for start, end in ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _is_completed(event):
+    """Check if the command of the given event is completed, or terminated with an error."""
+    return event.command_execution_status <= cl.command_execution_status.COMPLETE
+
+
+def _convert_to_reduced_precision(data, storage, tolerance=None, block_size=2 ** 20):
+    """Convert the given data to the given reduced precision storage type.
+
+    For ``half`` the data is converted as is. For the integer types, the data is scaled linearly from the range of
+    the data to the range of the integer type, such that ``value = stored * scale + offset``.
+
+    The conversion is done in blocks of at most ``block_size`` elements, such that the temporary double precision
+    copies never exceed the size of a single block.
+
+    Args:
+        data (ndarray): the contiguous data to convert
+        storage (str): the storage type, one of ``half``, ``char`` or ``short``
+        tolerance (float): if set, the maximum absolute difference allowed between the data and the stored data
+        block_size (int): the maximum number of elements converted at once
+
+    Returns:
+        tuple: the converted data, the scale and the offset
+
+    Raises:
+        ValueError: if the stored data differs more than the tolerance from the data, or if the data does not fit
+            in the range of a ``half``
+    """
+    data = np.asarray(data)
+    flat_data = data.reshape(-1)
+
+    if storage == 'half':
+        dtype = np.dtype(np.float16)
+        scale, offset = 1, 0
+    else:
+        dtype = np.dtype(ctype_to_dtype(storage))
+        int_min, int_max = np.iinfo(dtype).min, np.iinfo(dtype).max
+
+        data_min, data_max = (float(np.min(data)), float(np.max(data))) if data.size else (0.0, 0.0)
+        scale = np.float32((data_max - data_min) / (int_max - int_min) or 1)
+        offset = np.float32(data_min - int_min * float(scale))
+
+    stored = np.empty(data.shape, dtype=dtype)
+    flat_stored = stored.reshape(-1)
+
+    max_difference = 0
+    for block_start in range(0, flat_data.size, block_size):
+        block = flat_data[block_start:block_start + block_size].astype(np.float64)
+
+        if storage == 'half':
+            stored_block = block.astype(np.float16)
+            restored = stored_block.astype(np.float64)
+
+            if np.any(np.isinf(restored) & np.isfinite(block)):
+                raise ValueError('The data does not fit in the range of a half.')
+        else:
+            stored_block = np.clip(np.round((block - offset) / scale), int_min, int_max).astype(dtype)
+            restored = stored_block * np.float64(scale) + np.float64(offset)
+
+        flat_stored[block_start:block_start + block_size] = stored_block
+        if tolerance is not None:
+            max_difference = max(max_difference, np.max(np.abs(restored - block)))
+
+    if tolerance is not None and max_difference > tolerance:
+        raise ValueError('The data stored as "{}" differs up to {} from the data, which is more than the '
+                         'tolerance of {}.'.format(storage, max_difference, tolerance))
+
+    return stored, scale, offset
+
+
+def _get_itemsize(ctype, mot_float_dtype):
+    """Get the number of bytes of a single item of the given ctype.
+
+    Args:
+        ctype (str): the ctype, can be a vector type and can be ``mot_float_type``
+        mot_float_dtype (dtype): the numpy data type of the ``mot_float_type``, can be None.
+
+    Returns:
+        int: the item size in bytes
+    """
+    mot_float_type = None
+    if mot_float_dtype:
+        mot_float_type = dtype_to_ctype(mot_float_dtype)
+    return np.dtype(ctype_to_dtype(ctype, mot_float_type)).itemsize
+
+
+def _is_lazy_source(data):
+    """Check if the given data is a lazily loaded source, like a memory mapped array.
+
+    Lazily loaded sources are for example memory mapped numpy arrays (``np.memmap`` or ``np.load`` with
+    ``mmap_mode``) or HDF5 datasets. These are only read when the data is needed.
+
+    Args:
+        data (object): the data to check
+
+    Returns:
+        boolean: if the data is a lazily loaded source
+    """
+    if isinstance(data, np.memmap):
+        return True
+    return not isinstance(data, (np.ndarray, numbers.Number)) and all(
+        hasattr(data, attr) for attr in ['shape', 'dtype', '__getitem__'])
@@ -1,3 +1,9 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
 import numpy as np
 from mot.lib.utils import split_in_batches
 
@@ -15,23 +21,61 @@ class LoadBalancer:
     division is an even distribution, but this can be fine-tuned if one device is faster than others.
     """
 
-    def get_division(self, cl_environments, nmr_instances):
+    def get_division(self, cl_environments, nmr_instances, kernel_name=None):
         """Get the proposed division of labour for dividing the given number of instances over the given environments.
 
         Args:
             cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments used in the load balancing.
             nmr_instances (int): the number of work instances to divide
+            kernel_name (str): the name of the kernel for which we divide the work, if known
 
         Returns:
             List[Tuple[int, int]]: list with (batch_start, batch_end) tuples dividing the number of instances.
         """
         raise NotImplementedError()
 
+    def get_chunks(self, cl_environments, nmr_instances):
+        """Get the chunks of work to hand out dynamically, instead of using a fixed division.
+
+        If this returns a list of chunks, every chunk is handed to the environment which first finishes its previous
+        chunks, see :class:`mot.lib.cl_processors.ProcessKernelDynamically`. If this returns None, the work is divided
+        using :meth:`get_division`.
+
+        Args:
+            cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments used in the load balancing.
+            nmr_instances (int): the number of work instances to divide
+
+        Returns:
+            List[Tuple[int, int]] or None: list with (batch_start, batch_end) tuples, or None for a fixed division.
+        """
+        return None
+
+    def requires_timings(self):
+        """Check if this load balancer wants to receive the timings of the kernel executions.
+
+        Returns:
+            boolean: if set, the processors report every kernel execution using :meth:`add_timing`.
+        """
+        return False
+
+    def add_timing(self, cl_environment, kernel_name, nmr_instances, duration):
+        """Add the timing of a kernel execution, only called if :meth:`requires_timings` returns True.
+
+        The timings are taken from the profiling timestamps of the kernel events and are reported when the
+        processor waits on, or starts a new launch after, the completion of the kernels.
+
+        Args:
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment which executed the kernel
+            kernel_name (str): the name of the executed kernel
+            nmr_instances (int): the number of instances processed
+            duration (float): the execution time in seconds
+        """
+
 
 class EvenDistribution(LoadBalancer):
     """Evenly distribute the work over all available environments."""
 
-    def get_division(self, cl_environments, nmr_instances):
+    def get_division(self, cl_environments, nmr_instances, kernel_name=None):
         return list(split_in_batches(nmr_instances, nmr_batches=len(cl_environments)))
 
 
@@ -48,7 +92,7 @@ class FractionalLoad(LoadBalancer):
         fractions = np.array(fractions)
         self._fractions = fractions / np.sum(fractions)
 
-    def get_division(self, cl_environments, nmr_instances):
+    def get_division(self, cl_environments, nmr_instances, kernel_name=None):
         if len(cl_environments) != len(self._fractions):
             raise ValueError('The number of devices does not match the number of specified loads.')
 
@@ -63,3 +107,155 @@ class FractionalLoad(LoadBalancer):
 
         batches.append((offset, offset + elements_left))
         return batches
+
+
+class WorkStealing(LoadBalancer):
+
+    def __init__(self, nmr_chunks_per_device=16, min_chunk_size=64):
+        """Dynamically hand out the work in chunks to the devices which finish first.
+
+        Instead of dividing the work before launching, the work is cut into many chunks. Every device starts with
+        a few chunks and receives the next chunk as soon as it finishes one. As such, a slower device automatically
+        receives less work, which is useful when mixing different devices or when the work per instance varies.
+
+        Args:
+            nmr_chunks_per_device (int): the number of chunks to create per device, more chunks give a finer
+                balancing at the cost of more kernel launches.
+            min_chunk_size (int): the minimum number of instances per chunk
+        """
+        self._nmr_chunks_per_device = nmr_chunks_per_device
+        self._min_chunk_size = min_chunk_size
+
+    def get_division(self, cl_environments, nmr_instances, kernel_name=None):
+        return list(split_in_batches(nmr_instances, nmr_batches=len(cl_environments)))
+
+    def get_chunks(self, cl_environments, nmr_instances):
+        chunk_size = max(self._min_chunk_size,
+                         int(np.ceil(nmr_instances / (self._nmr_chunks_per_device * len(cl_environments)))))
+        return list(split_in_batches(nmr_instances, max_batch_size=chunk_size))
+
+
+class ThroughputBalancing(LoadBalancer):
+
+    def __init__(self, smoothing=0.3, calibration_file=None):
+        """Balance the load according to the measured throughput of every device.
+
+        This measures the number of instances per second every device achieves, per kernel, and divides the work
+        proportional to these throughputs. The throughputs are updated after every kernel execution using an
+        exponential moving average. Devices without a measurement for a kernel are assumed to achieve the
+        average throughput of the measured devices, if no device has been measured, the work is divided evenly.
+
+        The execution times are taken from the profiling timestamps of the kernel events, as such, only the kernels
+        executed on environments with profiling enabled are measured. The :class:`mot.configuration.CLRuntimeInfo`
+        enables profiling on its environments when using this load balancer.
+
+        Args:
+            smoothing (float): the weight of a new measurement in the exponential moving average, between 0 and 1.
+            calibration_file (str): if given, the throughputs are loaded from this JSON file and saved to it
+                by :meth:`save`, such that the calibration persists between runs. An unreadable file is ignored.
+        """
+        self._smoothing = smoothing
+        self._calibration_file = calibration_file
+        self._throughputs = {}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+        if self._calibration_file:
+            self._throughputs = self._load_calibration()
+
+    def get_throughput(self, cl_environment, kernel_name):
+        """Get the measured throughput of the given environment for the given kernel.
+
+        Args:
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment
+            kernel_name (str): the name of the kernel
+
+        Returns:
+            float or None: the number of instances per second, or None if not measured.
+        """
+        return self._throughputs.get(self._get_key(cl_environment, kernel_name))
+
+    def get_division(self, cl_environments, nmr_instances, kernel_name=None):
+        throughputs = [self.get_throughput(env, kernel_name) for env in cl_environments]
+        measured = [throughput for throughput in throughputs if throughput]
+
+        if not measured:
+            return list(split_in_batches(nmr_instances, nmr_batches=len(cl_environments)))
+
+        fractions = [throughput or np.mean(measured) for throughput in throughputs]
+        return FractionalLoad(fractions).get_division(cl_environments, nmr_instances)
+
+    def requires_timings(self):
+        return True
+
+    def add_timing(self, cl_environment, kernel_name, nmr_instances, duration):
+        if duration <= 0 or nmr_instances <= 0:
+            return
+
+        key = self._get_key(cl_environment, kernel_name)
+        throughput = nmr_instances / duration
+
+        with self._lock:
+            if key in self._throughputs:
+                throughput = self._smoothing * throughput + (1 - self._smoothing) * self._throughputs[key]
+            self._throughputs[key] = throughput
+
+    def save(self):
+        """Save the measured throughputs to the calibration file, if set.
+
+        The file is replaced atomically, such that concurrent readers never see a partially written file.
+        Failing to write the file is logged, not raised, since the calibration is only an optimization.
+        """
+        if not self._calibration_file:
+            return
+
+        with self._lock:
+            throughputs = dict(self._throughputs)
+
+        calibration_dir = os.path.dirname(os.path.abspath(self._calibration_file))
+        tmp_path = None
+        try:
+            os.makedirs(calibration_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=calibration_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(throughputs, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._calibration_file)
+        except OSError as exc:
+            self._logger.warning('Could not save the load balancer calibration: {}'.format(exc))
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load_calibration(self):
+        """Load the throughputs from the calibration file.
+
+        Returns:
+            dict: the throughputs per key, empty if the file does not exist or can not be read
+        """
+        if not os.path.isfile(self._calibration_file):
+            return {}
+
+        try:
+            with open(self._calibration_file, 'r') as f:
+                throughputs = json.load(f)
+        except (OSError, ValueError) as exc:
+            self._logger.warning('Could not load the load balancer calibration, starting a new calibration: '
+                                 '{}'.format(exc))
+            return {}
+
+        if not isinstance(throughputs, dict):
+            self._logger.warning('The load balancer calibration file is invalid, starting a new calibration.')
+            return {}
+        return {key: float(value) for key, value in throughputs.items()
+                if isinstance(value, (int, float)) and value > 0}
+
+    @staticmethod
+    def _get_key(cl_environment, kernel_name):
+        """Get the key under which we store the throughput of a device for a kernel.
+
+        The key uses the names of the platform and the device, which are stable between runs.
+        Identical devices share their measurements.
+
+        Returns:
+            str: the key for the throughputs
+        """
+        return '{} / {} / {}'.format(cl_environment.platform.name, cl_environment.device.name, kernel_name)
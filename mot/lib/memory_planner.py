@@ -0,0 +1,222 @@
+"""Planning of the batch and workgroup sizes against the memory limits of the devices.
+
+The kernel data elements report their memory requirements (see
+:meth:`mot.lib.kernel_data.KernelData.get_memory_requirements`). Using these, the functions in this module choose
+the number of problem instances per batch and the workgroup size such that a kernel fits in the global memory
+(``GLOBAL_MEM_SIZE``), in the maximum size of a single buffer (``MAX_MEM_ALLOC_SIZE``) and in the local memory
+(``LOCAL_MEM_SIZE``) of a device. This allows failing early, prior to launching, instead of on an out of resources
+error of the OpenCL runtime.
+
+Example:
+
+.. code-block:: python
+
+    from mot.lib.memory_planner import get_batch_size
+
+    batch_size = get_batch_size(kernel_data, cl_environment, workgroup_size=1)
+
+This is used by :class:`mot.lib.cl_processors.MultiDeviceProcessor` when processing with ``max_chunk_size='auto'``.
+
+Additionally, :func:`plan_constant_memory` selects small, read only, shared arrays for the ``constant`` address space
+if they fit the ``MAX_CONSTANT_BUFFER_SIZE`` and ``MAX_CONSTANT_ARGS`` of the devices.
+"""
+from functools import lru_cache
+
+import pyopencl as cl
+
+from mot.lib.kernel_data import MemoryRequirements, Array
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+def get_memory_requirements(kernel_data, workgroup_size):
+    """Get the combined memory requirements of the given kernel data elements.
+
+    Args:
+        kernel_data (Iterable[mot.lib.kernel_data.KernelData]): the kernel data elements to combine
+        workgroup_size (int): the workgroup size the kernel will use
+
+    Returns:
+        mot.lib.kernel_data.MemoryRequirements: the combined memory requirements
+    """
+    requirements = MemoryRequirements()
+    for data in kernel_data:
+        requirements += data.get_memory_requirements(workgroup_size)
+    return requirements
+
+
+def get_workgroup_size(kernel_data, cl_environment, max_workgroup_size):
+    """Get the largest workgroup size, up to the given maximum, for which the local memory fits on the device.
+
+    The workgroup size is halved until the local memory needed per workgroup fits in the ``LOCAL_MEM_SIZE`` of the
+    device.
+
+    Args:
+        kernel_data (Iterable[mot.lib.kernel_data.KernelData]): the kernel data elements for the kernel
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment of the device
+        max_workgroup_size (int): the maximum workgroup size, typically the preferred size for the kernel
+
+    Returns:
+        int: the workgroup size to use
+
+    Raises:
+        ValueError: if the local memory does not fit the device even for a workgroup size of one
+    """
+    kernel_data = list(kernel_data)
+    local_mem_size = _get_local_mem_size(cl_environment.device)
+
+    workgroup_size = max(int(max_workgroup_size), 1)
+    while workgroup_size > 1 and get_memory_requirements(kernel_data, workgroup_size).local_bytes > local_mem_size:
+        workgroup_size //= 2
+
+    check_local_memory(kernel_data, cl_environment, workgroup_size)
+    return workgroup_size
+
+
+def check_local_memory(kernel_data, cl_environment, workgroup_size):
+    """Check if the local memory needed by the kernel data fits on the device.
+
+    The device is only queried if the kernel data uses local memory.
+
+    Args:
+        kernel_data (Iterable[mot.lib.kernel_data.KernelData]): the kernel data elements for the kernel
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment of the device
+        workgroup_size (int): the workgroup size the kernel will use
+
+    Raises:
+        ValueError: if the local memory needed per workgroup exceeds the ``LOCAL_MEM_SIZE`` of the device
+    """
+    local_bytes = get_memory_requirements(kernel_data, workgroup_size).local_bytes
+    if not local_bytes:
+        return
+
+    local_mem_size = _get_local_mem_size(cl_environment.device)
+    if local_bytes > local_mem_size:
+        raise ValueError('The kernel requires {} bytes of local memory for a workgroup size of {}, while '
+                         'the device "{}" only has {} bytes.'.format(local_bytes, workgroup_size,
+                                                                    cl_environment.device.name, local_mem_size))
+
+
+def get_batch_size(kernel_data, cl_environment, workgroup_size, nmr_batches_in_memory=1, memory_fraction=0.8):
+    """Get the maximum number of problem instances per batch which fits in the global memory of the device.
+
+    The batch size is limited by the global memory (``GLOBAL_MEM_SIZE``), since the data of all batches in memory
+    must fit at the same time, and by the maximum size of a single buffer (``MAX_MEM_ALLOC_SIZE``).
+
+    Args:
+        kernel_data (Iterable[mot.lib.kernel_data.KernelData]): the kernel data elements for the kernel
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment of the device
+        workgroup_size (int): the workgroup size the kernel will use
+        nmr_batches_in_memory (int): the number of batches held in device memory at the same time,
+            for example the number of chunks in flight when processing in chunks.
+        memory_fraction (float): the fraction of the global memory we may use, leaving room for the
+            memory used by the runtime and by other programs.
+
+    Returns:
+        int or None: the maximum number of problem instances per batch, or None if the memory use does not depend
+            on the number of problem instances.
+
+    Raises:
+        ValueError: if not even a single problem instance fits on the device
+    """
+    kernel_data = list(kernel_data)
+    check_local_memory(kernel_data, cl_environment, workgroup_size)
+
+    requirements = get_memory_requirements(kernel_data, workgroup_size)
+    global_mem_size = int(cl_environment.device.get_info(cl.device_info.GLOBAL_MEM_SIZE) * memory_fraction)
+    max_alloc_size = cl_environment.device.get_info(cl.device_info.MAX_MEM_ALLOC_SIZE)
+
+    if requirements.bytes_per_instance == 0:
+        return None
+
+    batch_size = (global_mem_size - requirements.shared_bytes) \
+        // (requirements.bytes_per_instance * nmr_batches_in_memory)
+    for per_instance, shared in requirements.buffers:
+        if per_instance:
+            batch_size = min(batch_size, (max_alloc_size - shared) // per_instance)
+
+    if batch_size < 1:
+        raise ValueError('The kernel data of a single problem instance does not fit in the memory '
+                         'of the device "{}".'.format(cl_environment.device.name))
+    return int(batch_size)
+
+
+def plan_constant_memory(kernel_data, cl_environments):
+    """Select the read only arrays shared by all problem instances to place in constant memory, if they fit the devices.
+
+    Only the arrays allowing constant memory are considered,
+    see :meth:`mot.lib.kernel_data.Array.is_constant_memory_candidate`. Since the kernel source is shared between
+    the devices, this plans against the smallest ``MAX_CONSTANT_BUFFER_SIZE`` and ``MAX_CONSTANT_ARGS`` of the given
+    devices. The smallest arrays are placed first and the combined size of all constant arrays is kept below the
+    maximum buffer size, since some devices share one constant memory bank between all arguments. Arrays which do
+    not fit remain in global memory.
+
+    This does not change the arrays, use :meth:`mot.lib.kernel_data.KernelData.with_constant_memory` to get the
+    kernel data with the selected arrays placed in constant memory.
+
+    Args:
+        kernel_data (Iterable[mot.lib.kernel_data.KernelData]): the kernel data elements for the kernel, the
+            children of these elements are searched as well.
+        cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments of the devices
+
+    Returns:
+        List[mot.lib.kernel_data.Array]: the arrays to place in constant memory
+    """
+    candidates = []
+
+    def find_candidates(data):
+        if isinstance(data, Array) and data.is_constant_memory_candidate():
+            candidates.append(data)
+        for child in data.get_children():
+            find_candidates(child)
+
+    for data in kernel_data:
+        find_candidates(data)
+
+    if not candidates or not cl_environments:
+        return []
+
+    limits = [_get_constant_memory_limits(env.device) for env in cl_environments]
+    max_buffer_size = min(limit[0] for limit in limits)
+    max_nmr_args = min(limit[1] for limit in limits)
+
+    sizes = {id(array): array.get_memory_requirements(1).shared_bytes for array in candidates}
+    selected = []
+    total_size = 0
+    for array in sorted(candidates, key=lambda array: sizes[id(array)])[:max_nmr_args]:
+        if total_size + sizes[id(array)] > max_buffer_size:
+            break
+        selected.append(array)
+        total_size += sizes[id(array)]
+    return selected
+
+
+@lru_cache(maxsize=None)
+def _get_constant_memory_limits(device):
+    """Get the constant memory limits of the given device, cached since querying the device is relatively slow.
+
+    Args:
+        device (cl.Device): the device to query
+
+    Returns:
+        tuple: the ``MAX_CONSTANT_BUFFER_SIZE`` and ``MAX_CONSTANT_ARGS`` of the device
+    """
+    return (device.get_info(cl.device_info.MAX_CONSTANT_BUFFER_SIZE),
+            device.get_info(cl.device_info.MAX_CONSTANT_ARGS))
+
+
+@lru_cache(maxsize=None)
+def _get_local_mem_size(device):
+    """Get the ``LOCAL_MEM_SIZE`` of the given device, cached since querying the device is relatively slow.
+
+    Args:
+        device (cl.Device): the device to query
+
+    Returns:
+        int: the local memory size of the device in bytes
+    """
+    return device.get_info(cl.device_info.LOCAL_MEM_SIZE)
@@ -0,0 +1,265 @@
+"""Device-side profiling of the kernel launches and data transfers, using the timestamps of the OpenCL events.
+
+Where the tracing in :mod:`mot.lib.tracing` measures the host-side time of enqueueing the work, the profiling
+measures the time the device spent on the work itself. To profile, enable profiling in the runtime information:
+
+.. code-block:: python
+
+    from mot.configuration import CLRuntimeInfo
+
+    cl_runtime_info = CLRuntimeInfo(profiling=True)
+    func.evaluate(..., cl_runtime_info=cl_runtime_info)
+
+    print(cl_runtime_info.profiler.format_report())
+
+This creates environments with profiling-enabled queues, recording the events of every kernel launch, map and copy
+in the profiler of the runtime information. Since profiling may slow down the queues, it is disabled by default.
+"""
+import logging
+import threading
+from collections import OrderedDict, deque
+
+import pyopencl as cl
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class DeviceProfiler:
+
+    def __init__(self, max_records=100000):
+        """Collects the profiled events of the commands enqueued on profiling-enabled environments.
+
+        The events are grouped per call, where a call is a launch of a kernel together with its data transfers,
+        see :meth:`start_call`. The timestamps of the completed events are read while recording new events,
+        after which the events themselves are dropped. Requesting a report waits on the completion of the
+        remaining recorded commands.
+
+        Args:
+            max_records (int): the maximum number of timings and calls kept, when exceeded the oldest are dropped
+        """
+        self._max_records = max_records
+        self._nmr_calls = 0
+        self._calls = OrderedDict()
+        self._timings = deque(maxlen=max_records)
+        self._pending = []
+        self._min_pending = 64
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_call(self, name):
+        """Start a new call, all events recorded from the calling thread are assigned to this call.
+
+        Args:
+            name (str): the name of the call, typically the name of the kernel
+
+        Returns:
+            int: the index of the new call
+        """
+        with self._lock:
+            self._local.call_index = self._nmr_calls
+            self._calls[self._nmr_calls] = name
+            self._nmr_calls += 1
+
+            if len(self._calls) > self._max_records:
+                self._calls.popitem(last=False)
+        return self._local.call_index
+
+    def get_current_call(self):
+        """Get the index of the call the events recorded from the calling thread are assigned to.
+
+        Returns:
+            int: the index of the current call of the calling thread, None if no call was started in this thread
+        """
+        return getattr(self._local, 'call_index', None)
+
+    def set_current_call(self, call_index):
+        """Assign the events recorded from the calling thread to an existing call.
+
+        This allows helper threads enqueueing commands to record their events in the call of the launching thread.
+
+        Args:
+            call_index (int): the index of the call, as returned by :meth:`start_call`
+        """
+        self._local.call_index = call_index
+
+    def add_event(self, cl_environment, event, category, name, nmr_bytes=0):
+        """Record the event of an enqueued command.
+
+        Args:
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment the command was enqueued in,
+                the queue of the command must have profiling enabled.
+            event (cl.Event): the event of the command
+            category (str): the category of the command, either 'kernel' or 'transfer'
+            name (str): the name of the command, like the kernel name or 'transfer_to_device'
+            nmr_bytes (int): for transfers, the number of bytes transferred
+        """
+        with self._lock:
+            self._pending.append((self.get_current_call(), cl_environment.device.name,
+                                  category, name, event, nmr_bytes))
+
+            # the completed events are resolved once the pending events doubled, amortizing the cost of the checks
+            if len(self._pending) >= self._min_pending:
+                self._resolve_completed()
+                self._min_pending = max(64, 2 * len(self._pending))
+
+    def clear(self):
+        """Remove all the recorded calls and events."""
+        with self._lock:
+            self._calls = OrderedDict()
+            self._timings.clear()
+            self._pending = []
+
+    def get_events(self):
+        """Get all the recorded events with their device timings.
+
+        This waits on the completion of the recorded commands.
+
+        Returns:
+            List[dict]: per event the call index (``call``), the device name (``device``), the category, the name,
+                the number of bytes (``bytes``), the time between enqueueing and starting the command
+                (``queue_wait``) and the execution time of the command (``duration``). All times are in seconds.
+        """
+        with self._lock:
+            events = [record[4] for record in self._pending]
+
+        if events:
+            cl.wait_for_events(events)
+
+        with self._lock:
+            self._resolve_completed()
+            return list(self._timings)
+
+    def get_report(self):
+        """Get the statistics of all the recorded events, aggregated per device.
+
+        Returns:
+            Dict[str, dict]: per device name the statistics, see :func:`get_device_statistics`.
+        """
+        return _get_statistics_per_device(self.get_events())
+
+    def get_call_reports(self):
+        """Get the statistics of the recorded events, per call and per device.
+
+        Returns:
+            List[dict]: per call the name (``name``) and the statistics per device name (``devices``),
+                see :func:`get_device_statistics`.
+        """
+        with self._lock:
+            calls = OrderedDict(self._calls)
+
+        events_per_call = OrderedDict((ind, []) for ind in calls)
+        for event in self.get_events():
+            if event['call'] in events_per_call:
+                events_per_call[event['call']].append(event)
+
+        return [{'name': calls[ind], 'devices': _get_statistics_per_device(events)}
+                for ind, events in events_per_call.items()]
+
+    def format_report(self, per_call=False):
+        """Format the report as a table.
+
+        Args:
+            per_call (boolean): if set, we add a row per call and device next to the aggregated rows per device
+
+        Returns:
+            str: the report as a table
+        """
+        row_format = '{:<40} {:>12} {:>14} {:>14} {:>10} {:>14}'
+        lines = [row_format.format('device', 'kernel (ms)', 'transfer (ms)', 'queue wait (ms)', 'GB/s', 'bytes')]
+
+        def add_rows(statistics, prefix=''):
+            for device, entry in statistics.items():
+                lines.append(row_format.format(
+                    (prefix + device)[:40], '{:.3f}'.format(entry['kernel_time'] * 1e3),
+                    '{:.3f}'.format(entry['transfer_time'] * 1e3), '{:.3f}'.format(entry['queue_wait'] * 1e3),
+                    '{:.2f}'.format(entry['transfer_bandwidth'] / 1e9), entry['transfer_bytes']))
+
+        add_rows(self.get_report())
+        if per_call:
+            for ind, call in enumerate(self.get_call_reports()):
+                add_rows(call['devices'], prefix='{} {}: '.format(ind, call['name']))
+        return '\n'.join(lines)
+
+    def _resolve_completed(self):
+        """Read the timestamps of the completed pending events and drop these events, the caller holds the lock.
+
+        The events of failed commands are dropped without timings.
+        """
+        pending = []
+        for call_index, device, category, name, event, nmr_bytes in self._pending:
+            status = event.command_execution_status
+            if status == cl.command_execution_status.COMPLETE:
+                self._timings.append({'call': call_index, 'device': device, 'category': category, 'name': name,
+                                      'bytes': nmr_bytes,
+                                      'queue_wait': (event.profile.start - event.profile.queued) * 1e-9,
+                                      'duration': (event.profile.end - event.profile.start) * 1e-9})
+            elif status > cl.command_execution_status.COMPLETE:
+                pending.append((call_index, device, category, name, event, nmr_bytes))
+        self._pending = pending
+
+    def log_report(self, logger=None, level=logging.INFO, per_call=False):
+        """Log the report, as formatted by :meth:`format_report`.
+
+        Args:
+            logger (logging.Logger): the logger to use, defaults to the logger of this module
+            level (int): the log level
+            per_call (boolean): if we also log the statistics per call
+        """
+        logger = logger or logging.getLogger(__name__)
+        for line in self.format_report(per_call=per_call).split('\n'):
+            logger.log(level, line)
+
+
+def get_device_statistics(events):
+    """Aggregate the timings of the given events of a single device.
+
+    Args:
+        events (List[dict]): the events, as returned by :meth:`DeviceProfiler.get_events`
+
+    Returns:
+        dict: the number of kernels and transfers (``nmr_kernels``, ``nmr_transfers``), the total execution time of
+            the kernels and the transfers (``kernel_time``, ``transfer_time``), the total time the commands
+            waited in the queues (``queue_wait``), the total number of bytes transferred (``transfer_bytes``)
+            and the effective transfer bandwidth in bytes per second (``transfer_bandwidth``).
+            All times are in seconds.
+    """
+    kernels = [event for event in events if event['category'] == 'kernel']
+    transfers = [event for event in events if event['category'] == 'transfer']
+
+    transfer_time = sum(event['duration'] for event in transfers)
+    transfer_bytes = sum(event['bytes'] for event in transfers)
+
+    return {'nmr_kernels': len(kernels),
+            'nmr_transfers': len(transfers),
+            'kernel_time': sum(event['duration'] for event in kernels),
+            'transfer_time': transfer_time,
+            'queue_wait': sum(event['queue_wait'] for event in events),
+            'transfer_bytes': transfer_bytes,
+            'transfer_bandwidth': transfer_bytes / transfer_time if transfer_time > 0 else 0}
+
+
+def profile_event(cl_environment, event, category, name, nmr_bytes=0):
+    """Record the given event in the profiler of the environment, if the environment has a profiler.
+
+    Args:
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment the command was enqueued in
+        event (cl.Event): the event of the command
+        category (str): the category of the command, either 'kernel' or 'transfer'
+        name (str): the name of the command
+        nmr_bytes (int): for transfers, the number of bytes transferred
+    """
+    if cl_environment.profiler is not None:
+        cl_environment.profiler.add_event(cl_environment, event, category, name, nmr_bytes=nmr_bytes)
+
+
+def _get_statistics_per_device(events):
+    """Get the statistics of the given events per device name."""
+    events_per_device = OrderedDict()
+    for event in events:
+        events_per_device.setdefault(event['device'], []).append(event)
+    return OrderedDict((device, get_device_statistics(device_events))
+                       for device, device_events in events_per_device.items())
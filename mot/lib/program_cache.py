@@ -0,0 +1,446 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pyopencl as cl
+
+from mot.lib.tracing import trace_event, trace_phase
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+_compile_executor = None
+_compile_executor_lock = threading.Lock()
+
+
+def get_compile_executor():
+    """Get the thread pool used for compiling CL programs in the background.
+
+    The pool is created on first use. Since the OpenCL compilers release the GIL, building programs in threads
+    allows compiling for multiple devices concurrently.
+
+    Returns:
+        concurrent.futures.ThreadPoolExecutor: the executor for compiling programs
+    """
+    global _compile_executor
+    if _compile_executor is None:
+        with _compile_executor_lock:
+            if _compile_executor is None:
+                _compile_executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                                       thread_name_prefix='mot_compile')
+    return _compile_executor
+
+
+def get_source_digest(kernel_source):
+    """Get a stable digest of the given kernel source.
+
+    In contrast to Python's ``hash()``, this digest is not salted and is hence the same over different processes.
+
+    Args:
+        kernel_source (str): the complete source of a CL program
+
+    Returns:
+        str: the hexadecimal SHA-256 digest of the source
+    """
+    return hashlib.sha256(kernel_source.encode('utf-8')).hexdigest()
+
+
+def get_program_digest(kernel_source, cl_environment, compile_flags):
+    """Get a stable digest identifying a compiled program.
+
+    This combines the source with everything that may influence the compiled binary, that is, the platform,
+    the device, the driver version and the compile flags.
+
+    Args:
+        kernel_source (str): the complete source of a CL program
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment we compile the program for
+        compile_flags (Iterable[str]): the compile flags used in building the program
+
+    Returns:
+        str: the hexadecimal SHA-256 digest identifying the compiled program
+    """
+    platform = cl_environment.platform
+    device = cl_environment.device
+
+    checksum = hashlib.sha256()
+    for item in [kernel_source, platform.name, platform.version,
+                 device.name, device.version, device.driver_version,
+                 ' '.join(compile_flags), cl.VERSION_TEXT]:
+        checksum.update(item.encode('utf-8'))
+        checksum.update(b'\0')
+    return checksum.hexdigest()
+
+
+def build_program(kernel_source, cl_environment, compile_flags, binary_cache=None):
+    """Build the given kernel source for the device in the given environment.
+
+    If a binary cache is given, we first try to load the program from the cache. If that fails, we build the
+    program from source and store the resulting binary in the cache.
+
+    Args:
+        kernel_source (str): the complete source of the CL program
+        cl_environment (mot.lib.cl_environments.CLEnvironment): the environment to build the program for
+        compile_flags (Iterable[str]): the compile flags to use
+        binary_cache (ProgramBinaryCache): optional on-disk cache of compiled binaries
+
+    Returns:
+        cl.Program: a built program for the device in the given environment
+    """
+    if binary_cache is not None:
+        with trace_phase('load_program_binary', device=cl_environment.device.name) as metadata:
+            program = binary_cache.load(kernel_source, cl_environment, compile_flags)
+            metadata['binary_cache_hit'] = program is not None
+        if program is not None:
+            return program
+
+    with trace_phase('build_program', device=cl_environment.device.name, source_length=len(kernel_source)):
+        program = cl.Program(cl_environment.context, kernel_source).build(
+            ' '.join(compile_flags), devices=[cl_environment.device])
+
+    if binary_cache is not None:
+        with trace_phase('store_program_binary', device=cl_environment.device.name):
+            binary_cache.store(kernel_source, cl_environment, compile_flags, program)
+
+    return program
+
+
+def get_default_cache_dir():
+    """Get the default directory for the on-disk cache of compiled programs.
+
+    This follows the XDG base directory specification, that is, we use ``$XDG_CACHE_HOME/mot/cl_programs`` if
+    ``XDG_CACHE_HOME`` is set, else ``~/.cache/mot/cl_programs``.
+
+    Returns:
+        str: the default cache directory
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'mot', 'cl_programs')
+
+
+class ProgramBinaryCache:
+
+    def __init__(self, cache_dir=None, max_size=500 * 1024 ** 2):
+        """Persistent on-disk cache of compiled CL program binaries.
+
+        The binaries are content addressed, that is, they are stored under a digest of the kernel source, the
+        device, the driver version and the compile flags (see :func:`get_program_digest`). This allows new
+        processes to skip the compilation of programs built before.
+
+        The cache is bounded in size. When storing a new binary exceeds the maximum size we remove the least recently
+        used binaries until we are below the limit again. Every load updates the modification time of the
+        binary, which we use as the access time.
+
+        Failures in reading or writing the cache are logged and otherwise ignored, the worst case is a recompilation.
+
+        Args:
+            cache_dir (str): the directory in which to store the binaries, defaults to
+                :func:`get_default_cache_dir`
+            max_size (int): the maximum size of the cache, in bytes
+        """
+        self._cache_dir = cache_dir or get_default_cache_dir()
+        self._max_size = max_size
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def cache_dir(self):
+        """Get the directory holding the cached binaries.
+
+        Returns:
+            str: the cache directory
+        """
+        return self._cache_dir
+
+    @property
+    def max_size(self):
+        """Get the maximum size of this cache.
+
+        Returns:
+            int: the maximum size in bytes
+        """
+        return self._max_size
+
+    def load(self, kernel_source, cl_environment, compile_flags):
+        """Load a built program from the cache.
+
+        Args:
+            kernel_source (str): the complete source of the CL program
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment to load the program for
+            compile_flags (Iterable[str]): the compile flags used to build the program
+
+        Returns:
+            cl.Program: the built program, or None if the program was not in the cache or could not be loaded.
+        """
+        path = self._get_path(get_program_digest(kernel_source, cl_environment, compile_flags))
+
+        try:
+            with open(path, 'rb') as f:
+                binary = f.read()
+        except OSError:
+            return None
+
+        try:
+            program = cl.Program(cl_environment.context, [cl_environment.device], [binary]).build(
+                ' '.join(compile_flags), devices=[cl_environment.device])
+        except cl.Error:
+            self._logger.warning('Could not load the cached program binary "{}", removing it.'.format(path))
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return program
+
+    def store(self, kernel_source, cl_environment, compile_flags, program):
+        """Store the binary of the given built program in the cache.
+
+        Args:
+            kernel_source (str): the complete source of the CL program
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment the program was built for
+            compile_flags (Iterable[str]): the compile flags used to build the program
+            program (cl.Program): the built program
+        """
+        devices = program.get_info(cl.program_info.DEVICES)
+        binaries = program.get_info(cl.program_info.BINARIES)
+
+        binary = None
+        for device, device_binary in zip(devices, binaries):
+            if device == cl_environment.device:
+                binary = device_binary
+
+        if not binary:
+            return
+
+        path = self._get_path(get_program_digest(kernel_source, cl_environment, compile_flags))
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(binary)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            self._logger.warning('Could not store the program binary in the cache: {}'.format(exc))
+            return
+
+        self._evict()
+
+    def get_size(self):
+        """Get the current size of the cache.
+
+        Returns:
+            int: the total size of all cached binaries, in bytes
+        """
+        return sum(size for _, size, _ in self._get_entries())
+
+    def clear(self):
+        """Remove all binaries from the cache."""
+        for _, _, path in self._get_entries():
+            self._remove(path)
+
+    def _evict(self):
+        """Remove the least recently used binaries until the cache is within its maximum size."""
+        entries = sorted(self._get_entries())
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total_size <= self._max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def _get_entries(self):
+        """Get the binaries in the cache.
+
+        Returns:
+            List[Tuple[float, int, str]]: per binary the access time, size and path
+        """
+        try:
+            names = os.listdir(self._cache_dir)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if name.endswith('.bin'):
+                path = os.path.join(self._cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _get_path(self, digest):
+        return os.path.join(self._cache_dir, digest + '.bin')
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ProgramCache:
+
+    def __init__(self, max_size=256):
+        """Process wide in-memory cache of built CL programs.
+
+        Programs are keyed by the digest of the source, the context, the device and the compile flags. As such, any
+        two functions generating the same kernel source share the same compiled program.
+
+        This holds at most ``max_size`` programs, if more are added we remove the least recently used program.
+        Concurrent requests for the same program share a single build.
+
+        Args:
+            max_size (int): the maximum number of programs to hold in memory
+        """
+        self._max_size = max_size
+        self._programs = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_size(self):
+        """Get the maximum number of programs held by this cache.
+
+        Returns:
+            int: the maximum number of programs
+        """
+        return self._max_size
+
+    @property
+    def hits(self):
+        """Get the number of times a program was found in this cache.
+
+        Returns:
+            int: the number of cache hits
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """Get the number of times a program had to be loaded or built.
+
+        Returns:
+            int: the number of cache misses
+        """
+        return self._misses
+
+    def get_program(self, kernel_source, cl_environment, compile_flags, binary_cache=None):
+        """Get a built program for the given source, building it if it is not yet in the cache.
+
+        Args:
+            kernel_source (str): the complete source of the CL program
+            cl_environment (mot.lib.cl_environments.CLEnvironment): the environment to build the program for
+            compile_flags (Iterable[str]): the compile flags to use
+            binary_cache (ProgramBinaryCache): optional on-disk cache to consult before building a program
+
+        Returns:
+            cl.Program: a built program for the device in the given environment
+        """
+        return self._get_program_future(kernel_source, cl_environment, compile_flags, binary_cache).result()
+
+    def get_programs(self, kernel_source, cl_environments, compile_flags, binary_cache=None, is_blocking=True):
+        """Get built programs for multiple environments, building the missing programs concurrently.
+
+        Programs not yet in the cache are built in the background using the executor from
+        :func:`get_compile_executor`. If there is only one program to build and this call is blocking, we build it
+        in the calling thread.
+
+        Args:
+            kernel_source (str): the complete source of the CL program
+            cl_environments (List[mot.lib.cl_environments.CLEnvironment]): the environments to build the program for
+            compile_flags (Iterable[str]): the compile flags to use
+            binary_cache (ProgramBinaryCache): optional on-disk cache to consult before building a program
+            is_blocking (boolean): if set, we wait for all the programs to be built and return the programs. If not
+                set, we return immediately with futures for the programs.
+
+        Returns:
+            Dict[CLEnvironment: cl.Program] or Dict[CLEnvironment: concurrent.futures.Future]: per environment
+                the built program, or, if not blocking, per environment a future for the built program.
+        """
+        executor = None
+        if len(cl_environments) > 1 or not is_blocking:
+            executor = get_compile_executor()
+
+        futures = {env: self._get_program_future(kernel_source, env, compile_flags, binary_cache, executor=executor)
+                   for env in cl_environments}
+
+        if not is_blocking:
+            return futures
+        return {env: future.result() for env, future in futures.items()}
+
+    def clear(self):
+        """Remove all programs from this cache and reset the statistics."""
+        with self._lock:
+            self._programs.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def _get_program_future(self, kernel_source, cl_environment, compile_flags, binary_cache, executor=None):
+        """Get a future for the built program.
+
+        If the program is in the cache, the returned future is already completed. If the program is being built
+        by another caller, we return the future of that build. Else, we start building the program, in the
+        given executor or, if no executor is given, in the calling thread.
+
+        Returns:
+            concurrent.futures.Future: the future for the built program
+        """
+        key = (get_source_digest(kernel_source), cl_environment.context, cl_environment.device, tuple(compile_flags))
+
+        with self._lock:
+            if key in self._programs:
+                self._hits += 1
+                self._programs.move_to_end(key)
+                future = Future()
+                future.set_result(self._programs[key])
+                trace_event('program_cache_hit', device=cl_environment.device.name)
+                return future
+            if key in self._pending:
+                self._hits += 1
+                trace_event('program_cache_hit', device=cl_environment.device.name)
+                return self._pending[key]
+
+            self._misses += 1
+            trace_event('program_cache_miss', device=cl_environment.device.name)
+            future = Future()
+            self._pending[key] = future
+
+        def build():
+            try:
+                program = build_program(kernel_source, cl_environment, compile_flags, binary_cache=binary_cache)
+            except BaseException as exc:
+                with self._lock:
+                    del self._pending[key]
+                future.set_exception(exc)
+                return
+
+            with self._lock:
+                del self._pending[key]
+                self._programs[key] = program
+                self._programs.move_to_end(key)
+                while len(self._programs) > self._max_size:
+                    self._programs.popitem(last=False)
+            future.set_result(program)
+
+        if executor is None:
+            build()
+        else:
+            executor.submit(build)
+        return future
+
+    def __len__(self):
+        return len(self._programs)
@@ -0,0 +1,254 @@
+"""Host-side tracing of the phases of evaluating CL functions.
+
+To trace, register a tracer in the configuration, either globally using :func:`mot.configuration.set_tracer`, or
+temporarily using the context manager :func:`tracing`. Example:
+
+.. code-block:: python
+
+    from mot.lib.tracing import tracing
+
+    with tracing() as tracer:
+        minimize(...)
+
+    print(tracer.format_report())
+    tracer.save_chrome_trace('/tmp/trace.json')
+
+The saved trace can be inspected with the trace viewer in the Chrome browser (``chrome://tracing``) or with Perfetto.
+
+All timings are host-side wall times. Since the enqueue functions of OpenCL are asynchronous, the time of a
+transfer or launch phase is the time needed to enqueue the work, the actual work is reflected in the
+``finish`` phase.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class Tracer:
+    """Interface for tracers, receiving the traced phases and events."""
+
+    def record(self, name, start, duration, metadata):
+        """Record a traced phase or event.
+
+        Args:
+            name (str): the name of the phase or event
+            start (float): the start time, in seconds, as given by ``time.perf_counter()``
+            duration (float or None): the duration of the phase in seconds, None for instantaneous events
+            metadata (dict): additional information about the phase, like the number of bytes transferred
+        """
+        raise NotImplementedError()
+
+
+class RecordingTracer(Tracer):
+
+    def __init__(self):
+        """Tracer storing all the traced phases and events in memory.
+
+        This allows creating aggregated reports and exporting the trace in the Chrome trace format.
+        """
+        self._events = []
+        self._lock = threading.Lock()
+
+    def record(self, name, start, duration, metadata):
+        with self._lock:
+            self._events.append((name, start, duration, dict(metadata), os.getpid(), threading.get_ident()))
+
+    def clear(self):
+        """Remove all the recorded events."""
+        with self._lock:
+            self._events = []
+
+    def get_events(self):
+        """Get all the recorded events.
+
+        Returns:
+            List[Tuple[str, float, float, dict]]: per event the name, start time, duration and metadata
+        """
+        with self._lock:
+            return [event[:4] for event in self._events]
+
+    def get_report(self):
+        """Get an aggregated report of the recorded events.
+
+        Returns:
+            Dict[str, dict]: per phase or event name, the number of times it occurred (``count``), the total,
+                mean and maximum duration in seconds (``total_time``, ``mean_time``, ``max_time``) and the sums of
+                the numerical metadata values, like the number of bytes transferred.
+        """
+        report = {}
+        for name, _, duration, metadata in self.get_events():
+            entry = report.setdefault(name, {'count': 0, 'total_time': 0, 'mean_time': 0, 'max_time': 0})
+            entry['count'] += 1
+
+            if duration is not None:
+                entry['total_time'] += duration
+                entry['max_time'] = max(entry['max_time'], duration)
+                entry['mean_time'] = entry['total_time'] / entry['count']
+
+            for key, value in metadata.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+        return report
+
+    def format_report(self):
+        """Format the aggregated report as a table.
+
+        Returns:
+            str: the report as a table with one row per phase or event
+        """
+        report = self.get_report()
+
+        lines = ['{:<30} {:>8} {:>12} {:>12} {:>12} {:>14}'.format(
+            'phase', 'count', 'total (ms)', 'mean (ms)', 'max (ms)', 'bytes')]
+        for name, entry in sorted(report.items(), key=lambda item: -item[1]['total_time']):
+            lines.append('{:<30} {:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>14}'.format(
+                name, entry['count'], entry['total_time'] * 1e3, entry['mean_time'] * 1e3, entry['max_time'] * 1e3,
+                entry.get('bytes', '')))
+        return '\n'.join(lines)
+
+    def get_chrome_trace(self):
+        """Get the recorded events in the Chrome trace event format.
+
+        Returns:
+            dict: the trace, can be serialized to JSON for use in ``chrome://tracing`` or Perfetto.
+        """
+        with self._lock:
+            events = list(self._events)
+
+        trace_events = []
+        for name, start, duration, metadata, pid, tid in events:
+            event = {'name': name, 'cat': 'mot', 'ts': start * 1e6, 'pid': pid, 'tid': tid,
+                     'args': {key: _to_json_value(value) for key, value in metadata.items()}}
+            if duration is None:
+                event.update({'ph': 'i', 's': 't'})
+            else:
+                event.update({'ph': 'X', 'dur': duration * 1e6})
+            trace_events.append(event)
+
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        """Save the recorded events as a Chrome trace JSON file.
+
+        Args:
+            path (str): the path to the output file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.get_chrome_trace(), f)
+
+
+@contextmanager
+def tracing(tracer=None):
+    """Context manager registering a tracer for the duration of the context.
+
+    Args:
+        tracer (Tracer): the tracer to use, if not given we use a new :class:`RecordingTracer`.
+
+    Yields:
+        Tracer: the registered tracer
+    """
+    from mot.configuration import get_tracer, set_tracer
+
+    tracer = tracer or RecordingTracer()
+    previous_tracer = get_tracer()
+    set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous_tracer)
+
+
+def trace_phase(name, **metadata):
+    """Trace the wall time of the code inside this context using the current tracer.
+
+    If no tracer is registered, this returns a shared context that does nothing, such that tracing adds almost no
+    overhead when disabled.
+
+    Args:
+        name (str): the name of the phase
+        **metadata: additional information about this phase
+
+    Returns:
+        context manager: yielding the metadata dictionary, items added to this dictionary within the context are
+            recorded as well
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        return _null_phase
+    return _TracedPhase(tracer, name, metadata)
+
+
+def trace_event(name, **metadata):
+    """Record an instantaneous event, like a cache hit, using the current tracer.
+
+    If no tracer is registered, this does nothing.
+
+    Args:
+        name (str): the name of the event
+        **metadata: additional information about this event
+    """
+    tracer = _get_tracer()
+    if tracer is not None:
+        tracer.record(name, time.perf_counter(), None, metadata)
+
+
+class _TracedPhase:
+
+    __slots__ = ('_tracer', '_name', '_metadata', '_start')
+
+    def __init__(self, tracer, name, metadata):
+        """Context recording the wall time of a phase in the given tracer."""
+        self._tracer = tracer
+        self._name = name
+        self._metadata = metadata
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self._metadata
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tracer.record(self._name, self._start, time.perf_counter() - self._start, self._metadata)
+        return False
+
+
+class _NullPhase:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_null_phase = _NullPhase()
+_tracer_getter = None
+
+
+def _get_tracer():
+    """Get the current tracer from the configuration.
+
+    The configuration module imports this module, we therefore look up the getter on first use and keep it.
+    """
+    global _tracer_getter
+    if _tracer_getter is None:
+        from mot.configuration import get_tracer
+        _tracer_getter = get_tracer
+    return _tracer_getter()
+
+
+def _to_json_value(value):
+    """Convert the given metadata value to a value that can be serialized to JSON."""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
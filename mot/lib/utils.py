@@ -6,7 +6,7 @@ import os
 from collections.abc import Iterable, Mapping
 from collections import OrderedDict
 from contextlib import contextmanager
-from functools import reduce
+from functools import reduce, lru_cache
 import numpy as np
 import pyopencl as cl
 import tatsu
@@ -159,6 +159,7 @@ def ctype_to_dtype(cl_type, mot_float_type='float'):
             ('uint', np.uint32),
             ('long', np.int64),
             ('ulong', np.uint64),
+            ('half', np.float16),
             ('float', np.float32),
             ('double', np.float64),
         ]
@@ -659,13 +660,22 @@ _tatsu_cl_function = r'''
     compound_statement = '{' {[/[^\{\}]*/] [compound_statement]}* '}';
 '''
 
-_extract_cl_functions_parser = tatsu.compile(r'''
-    result = {function}+;
-''' + _tatsu_cl_function)
 
-_split_cl_function_parser = tatsu.compile(r'''
-    result = function;
-''' + _tatsu_cl_function)
+
+@lru_cache(maxsize=None)
+def _get_extract_cl_functions_parser():
+    """Get the parser for separating multiple CL functions, the grammar is compiled on first use."""
+    return tatsu.compile(r'''
+        result = {function}+;
+    ''' + _tatsu_cl_function)
+
+
+@lru_cache(maxsize=None)
+def _get_split_cl_function_parser():
+    """Get the parser for splitting a single CL function, the grammar is compiled on first use."""
+    return tatsu.compile(r'''
+        result = function;
+    ''' + _tatsu_cl_function)
 
 
 def parse_cl_function(cl_code, dependencies=()):
@@ -683,59 +693,78 @@ def parse_cl_function(cl_code, dependencies=()):
     """
     from mot.lib.cl_function import SimpleCLFunction
 
-    def separate_cl_functions(input_str):
-        """Separate all the OpenCL functions.
+    functions = _separate_cl_functions(cl_code)
+    return SimpleCLFunction.from_string(functions[-1], dependencies=list(dependencies or []) + [
+        SimpleCLFunction.from_string(s) for s in functions[:-1]])
 
-        This creates a list of strings, with for each function found the OpenCL code.
 
-        Args:
-            input_str (str): the string containing one or more functions.
+@lru_cache(maxsize=1024)
+def _separate_cl_functions(input_str):
+    """Separate all the OpenCL functions.
 
-        Returns:
-            list: a list of strings, with one string per found CL function.
-        """
-        class Semantics:
+    This creates a list of strings, with for each function found the OpenCL code. The results are memoized
+    on the input string.
+
+    Args:
+        input_str (str): the string containing one or more functions.
 
-            def __init__(self):
-                self._functions = []
+    Returns:
+        tuple: a tuple of strings, with one string per found CL function.
+    """
+    class Semantics:
 
-            def result(self, ast):
-                return self._functions
+        def __init__(self):
+            self._functions = []
 
-            def arglist(self, ast):
-                if ast == '()':
-                    return '()'
-                return '({})'.format(', '.join(ast))
+        def result(self, ast):
+            return tuple(self._functions)
 
-            def function(self, ast):
-                def join(items):
-                    result = ''
-                    for item in items:
-                        if isinstance(item, str):
-                            result += item
-                        else:
-                            result += join(item)
-                    return result
+        def arglist(self, ast):
+            if ast == '()':
+                return '()'
+            return '({})'.format(', '.join(ast))
 
-                self._functions.append(join(ast).strip())
-                return ast
+        def function(self, ast):
+            def join(items):
+                result = ''
+                for item in items:
+                    if isinstance(item, str):
+                        result += item
+                    else:
+                        result += join(item)
+                return result
 
-        return _extract_cl_functions_parser.parse(input_str, semantics=Semantics())
+            self._functions.append(join(ast).strip())
+            return ast
 
-    functions = separate_cl_functions(cl_code)
-    return SimpleCLFunction.from_string(functions[-1], dependencies=list(dependencies or []) + [
-        SimpleCLFunction.from_string(s) for s in functions[:-1]])
+    return _get_extract_cl_functions_parser().parse(input_str, semantics=Semantics())
 
 
 def split_cl_function(cl_str):
     """Split an CL function into a return type, function name, parameters list and the body.
 
+    Parsing is memoized on the exact input string, repeatedly splitting the same function is cheap.
+
     Args:
         cl_str (str): the CL code to parse and plit into components
 
     Returns:
         tuple: string elements for the return type, function name, parameter list and the body
     """
+    is_kernel_func, return_type, function_name, parameter_list, cl_body = _split_cl_function(cl_str)
+    return is_kernel_func, return_type, function_name, list(parameter_list), cl_body
+
+
+@lru_cache(maxsize=1024)
+def _split_cl_function(cl_str):
+    """Memoized implementation of :func:`split_cl_function`.
+
+    Args:
+        cl_str (str): the CL code to parse and plit into components
+
+    Returns:
+        tuple: string elements for the return type, function name, parameter tuple and the body
+    """
     class Semantics:
 
         def __init__(self):
@@ -746,7 +775,8 @@ def split_cl_function(cl_str):
             self._cl_body = ''
 
         def result(self, ast):
-            return self._is_kernel_func, self._return_type, self._function_name, self._parameter_list, self._cl_body
+            return (self._is_kernel_func, self._return_type, self._function_name,
+                    tuple(self._parameter_list), self._cl_body)
 
         def kernel(self, ast):
             self._is_kernel_func = True
@@ -782,5 +812,5 @@ def split_cl_function(cl_str):
             self._cl_body = join(ast).strip()[1:-1]
             return ast
 
-    return _split_cl_function_parser.parse(cl_str, semantics=Semantics())
+    return _get_split_cl_function_parser().parse(cl_str, semantics=Semantics())
 
@@ -52,13 +52,11 @@ class SimpleCLLibraryFromFile(CLLibrary, SimpleCLFunction):
         super().__init__(return_type, cl_function_name, parameter_list, code, **kwargs)
         self._code = code
 
-    def get_cl_code(self):
+    def _get_cl_function_code(self):
         return dedent('''
-            {dependencies}
             #ifndef {inclusion_guard_name}
             #define {inclusion_guard_name}
             {code}
             #endif // {inclusion_guard_name}
-        '''.format(dependencies=indent(self._get_cl_dependency_code(), ' ' * 4 * 3),
-                   inclusion_guard_name='INCLUDE_GUARD_{}'.format(self.get_cl_function_name()),
+        '''.format(inclusion_guard_name='INCLUDE_GUARD_{}'.format(self.get_cl_function_name()),
                    code=indent('\n' + self._code.strip() + '\n', ' ' * 4 * 3)))
@@ -96,6 +96,40 @@ def minimize(func, x0, data=None, method=None, lower_bounds=None, upper_bounds=N
             The optimization result represented as a ``OptimizeResult`` object.
             Important attributes are: ``x`` the solution array.
     """
+    return _minimize(func, x0, data=data, method=method, lower_bounds=lower_bounds, upper_bounds=upper_bounds,
+                     constraints_func=constraints_func, nmr_observations=nmr_observations,
+                     cl_runtime_info=cl_runtime_info, options=options, use_local_reduction=use_local_reduction)
+
+
+def prepare_minimize(func, x0, data=None, method=None, lower_bounds=None, upper_bounds=None, constraints_func=None,
+                     nmr_observations=None, cl_runtime_info=None, options=None, use_local_reduction=True):
+    """Compile the kernels used by :func:`minimize` ahead of time, without running the minimization.
+
+    The compiled programs are stored in the program cache (see :func:`mot.configuration.get_program_cache`), such
+    that a subsequent call to :func:`minimize` with the same settings does not have to compile the kernels anymore.
+    This allows services to pay the compilation costs at startup instead of at the first request.
+
+    The compiled kernels depend on the method, the options, the number of parameters and the types and shapes
+    of the data, but not on the values of ``x0`` or the data. The arguments should therefore be equal in
+    type and shape to the arguments later provided to :func:`minimize`.
+
+    Args:
+        See :func:`minimize`.
+    """
+    _minimize(func, x0, data=data, method=method, lower_bounds=lower_bounds, upper_bounds=upper_bounds,
+              constraints_func=constraints_func, nmr_observations=nmr_observations,
+              cl_runtime_info=cl_runtime_info, options=options, use_local_reduction=use_local_reduction,
+              prepare_only=True)
+
+
+def _minimize(func, x0, data=None, method=None, lower_bounds=None, upper_bounds=None, constraints_func=None,
+              nmr_observations=None, cl_runtime_info=None, options=None, use_local_reduction=True,
+              prepare_only=False):
+    """Implementation of :func:`minimize` and :func:`prepare_minimize`.
+
+    Args:
+        prepare_only (boolean): if set, we only compile the kernels and do not run the minimization.
+    """
     if not method:
         method = 'Powell'
 
@@ -112,19 +146,23 @@ def minimize(func, x0, data=None, method=None, lower_bounds=None, upper_bounds=N
     if method == 'Powell':
         return _minimize_powell(func, x0, cl_runtime_info, lower_bounds, upper_bounds,
                                 use_local_reduction,
-                                constraints_func=constraints_func, data=data, options=options)
+                                constraints_func=constraints_func, data=data, options=options,
+                                prepare_only=prepare_only)
     elif method == 'Nelder-Mead':
         return _minimize_nmsimplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds,
                                    use_local_reduction,
-                                   constraints_func=constraints_func, data=data, options=options)
+                                   constraints_func=constraints_func, data=data, options=options,
+                                   prepare_only=prepare_only)
     elif method == 'Levenberg-Marquardt':
         return _minimize_levenberg_marquardt(func, x0, nmr_observations, cl_runtime_info, lower_bounds, upper_bounds,
                                              use_local_reduction,
-                                             constraints_func=constraints_func, data=data, options=options)
+                                             constraints_func=constraints_func, data=data, options=options,
+                                             prepare_only=prepare_only)
     elif method == 'Subplex':
         return _minimize_subplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds,
                                  use_local_reduction,
-                                 constraints_func=constraints_func, data=data, options=options)
+                                 constraints_func=constraints_func, data=data, options=options,
+                                 prepare_only=prepare_only)
     raise ValueError('Could not find the specified method "{}".'.format(method))
 
 
@@ -245,7 +283,7 @@ def _clean_options(method, provided_options):
 
 
 def _minimize_powell(func, x0, cl_runtime_info, lower_bounds, upper_bounds, use_local_reduction,
-                     constraints_func=None, data=None, options=None):
+                     constraints_func=None, data=None, options=None, prepare_only=False):
     """
     Options:
         patience (int): Used to set the maximum number of iterations to patience*(number_of_parameters+1)
@@ -289,17 +327,12 @@ def _minimize_powell(func, x0, cl_runtime_info, lower_bounds, upper_bounds, use_
                                    'penalty_data': penalty_data}, '_powell_eval_func_data')}
     kernel_data.update(optimizer_func.get_kernel_data())
 
-    return_code = optimizer_func.evaluate(
-        kernel_data, nmr_problems,
-        use_local_reduction=use_local_reduction and all(env.is_gpu for env in cl_runtime_info.cl_environments),
-        cl_runtime_info=cl_runtime_info,)
-
-    return OptimizeResults({'x': kernel_data['model_parameters'].get_data(),
-                            'status': return_code})
+    return _run_optimizer(optimizer_func, kernel_data, nmr_problems, cl_runtime_info, use_local_reduction,
+                          prepare_only=prepare_only)
 
 
 def _minimize_nmsimplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds, use_local_reduction,
-                        constraints_func=None, data=None, options=None):
+                        constraints_func=None, data=None, options=None, prepare_only=False):
     """Use the Nelder-Mead simplex method to calculate the optimimum.
 
     The scales should satisfy the following constraints:
@@ -374,17 +407,12 @@ def _minimize_nmsimplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds, u
                                    'penalty_data': penalty_data}, '_nmsimplex_eval_func_data')}
     kernel_data.update(optimizer_func.get_kernel_data())
 
-    return_code = optimizer_func.evaluate(
-        kernel_data, nmr_problems,
-        use_local_reduction=use_local_reduction and all(env.is_gpu for env in cl_runtime_info.cl_environments),
-        cl_runtime_info=cl_runtime_info)
-
-    return OptimizeResults({'x': kernel_data['model_parameters'].get_data(),
-                            'status': return_code})
+    return _run_optimizer(optimizer_func, kernel_data, nmr_problems, cl_runtime_info, use_local_reduction,
+                          prepare_only=prepare_only)
 
 
 def _minimize_subplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds, use_local_reduction,
-                      constraints_func=None, data=None, options=None):
+                      constraints_func=None, data=None, options=None, prepare_only=False):
     """Variation on the Nelder-Mead Simplex method by Thomas H. Rowan.
 
     This method uses NMSimplex to search subspace regions for the minimum. See Rowan's thesis titled
@@ -468,18 +496,13 @@ def _minimize_subplex(func, x0, cl_runtime_info, lower_bounds, upper_bounds, use
                                    'penalty_data': penalty_data}, '_subplex_eval_func_data')}
     kernel_data.update(optimizer_func.get_kernel_data())
 
-    return_code = optimizer_func.evaluate(
-        kernel_data, nmr_problems,
-        use_local_reduction=use_local_reduction and all(env.is_gpu for env in cl_runtime_info.cl_environments),
-        cl_runtime_info=cl_runtime_info)
-
-    return OptimizeResults({'x': kernel_data['model_parameters'].get_data(),
-                            'status': return_code})
+    return _run_optimizer(optimizer_func, kernel_data, nmr_problems, cl_runtime_info, use_local_reduction,
+                          prepare_only=prepare_only)
 
 
 def _minimize_levenberg_marquardt(func, x0, nmr_observations, cl_runtime_info, lower_bounds, upper_bounds,
                                   use_local_reduction,
-                                  constraints_func=None, data=None, options=None):
+                                  constraints_func=None, data=None, options=None, prepare_only=False):
     options = options or {}
     nmr_problems = x0.shape[0]
     nmr_parameters = x0.shape[1]
@@ -526,6 +549,29 @@ def _minimize_levenberg_marquardt(func, x0, nmr_observations, cl_runtime_info, l
                                   '_lm_eval_func_data')}
     kernel_data.update(optimizer_func.get_kernel_data())
 
+    return _run_optimizer(optimizer_func, kernel_data, nmr_problems, cl_runtime_info, use_local_reduction,
+                          prepare_only=prepare_only)
+
+
+def _run_optimizer(optimizer_func, kernel_data, nmr_problems, cl_runtime_info, use_local_reduction,
+                   prepare_only=False):
+    """Run the given optimization routine, or only compile it.
+
+    Args:
+        optimizer_func (mot.lib.cl_function.CLFunction): the optimization routine
+        kernel_data (dict): the kernel data for the optimization routine
+        nmr_problems (int): the number of problems to optimize
+        cl_runtime_info (mot.configuration.CLRuntimeInfo): the CL runtime information
+        use_local_reduction (boolean): if we use local reduction on GPU devices
+        prepare_only (boolean): if set, we only compile the optimization routine
+
+    Returns:
+        mot.optimize.base.OptimizeResults: the optimization results, or None if we only compiled the routine.
+    """
+    if prepare_only:
+        optimizer_func.prepare(kernel_data, nmr_problems, cl_runtime_info=cl_runtime_info)
+        return None
+
     return_code = optimizer_func.evaluate(
         kernel_data, nmr_problems,
         use_local_reduction=use_local_reduction and all(env.is_gpu for env in cl_runtime_info.cl_environments),
@@ -50,7 +50,7 @@ class AdaptiveMetropolisWithinGibbs(AbstractRWMSampler):
     def _get_mcmc_method_kernel_data_elements(self):
         kernel_data = super()._get_mcmc_method_kernel_data_elements()
         kernel_data.update({
-            'acceptance_counter': Array(self._acceptance_counter, mode='rw')
+            'acceptance_counter': Array(self._acceptance_counter, mode='rw', use_host_ptr=self._state_use_host_ptr)
         })
         return kernel_data
 
@@ -61,7 +61,7 @@ class AdaptiveMetropolisWithinGibbs(AbstractRWMSampler):
             }
         '''
 
-    def _get_proposal_update_function(self, nmr_samples, thinning, return_output):
+    def _get_proposal_update_function(self):
         kernel_source = '''
             void _updateProposalState(_mcmc_method_data* method_data, ulong current_iteration,
                                       global mot_float_type* current_position){
@@ -2,6 +2,7 @@ import logging
 from contextlib import contextmanager
 
 from mot.lib.cl_function import SimpleCLFunction, SimpleCLCodeObject
+from mot.lib.cl_processors import DeviceAccess, HostAccess
 from mot.configuration import CLRuntimeInfo
 from mot.library_functions import Rand123
 from mot.lib.utils import split_in_batches
@@ -18,7 +19,8 @@ __email__ = "robbert@xkls.nl"
 
 class AbstractSampler:
 
-    def __init__(self, ll_func, log_prior_func, x0, data=None, cl_runtime_info=None, **kwargs):
+    def __init__(self, ll_func, log_prior_func, x0, data=None, cl_runtime_info=None, device_resident_state=False,
+                 **kwargs):
         """Abstract base class for sample routines.
 
         Sampling routines implementing this interface should be stateful objects that, for the given likelihood
@@ -40,6 +42,12 @@ class AbstractSampler:
             x0 (ndarray): the starting positions for the sampler. Should be a two dimensional matrix
                 with for every modeling instance (first dimension) and every parameter (second dimension) a value.
             data (mot.lib.kernel_data.KernelData): the user provided data for the ``void* data`` pointer.
+            cl_runtime_info (mot.configuration.CLRuntimeInfo): the runtime information
+            device_resident_state (boolean): if set, the sampler state (the chain positions, log likelihoods,
+                log priors, random number generator state and method data) is kept on the device in between the
+                sample batches, instead of being transferred to the host and back for every batch. The state is
+                copied back to the host at the end of every call to :meth:`sample`, or on request using
+                :meth:`synchronize_state`.
         """
         self._cl_runtime_info = cl_runtime_info or CLRuntimeInfo()
         self._logger = logging.getLogger(__name__)
@@ -52,6 +60,14 @@ class AbstractSampler:
         self._nmr_problems = self._x0.shape[0]
         self._nmr_params = self._x0.shape[1]
         self._sampling_index = 0
+        self._compute_func = None
+        self._device_resident_state = device_resident_state
+
+        # device resident state needs device side buffers, with host pointers the runtime may sync through the host
+        self._state_use_host_ptr = not device_resident_state
+        self._state_kernel_data = None
+        self._state_on_device = False
+        self._state_problem_ranges = None
 
         float_type = self._cl_runtime_info.mot_float_dtype
         self._current_chain_position = np.require(np.copy(self._x0), dtype=float_type)
@@ -66,22 +82,19 @@ class AbstractSampler:
     def _get_mcmc_method_kernel_data(self):
         """Get the kernel data specific for the implemented method.
 
-        This will be provided as a void pointer to the implementing MCMC method.
+        This will be provided as a void pointer to the implementing MCMC method. The writable arrays in the method
+        data are part of the sampler state and should be created with ``use_host_ptr=self._state_use_host_ptr``.
 
         Returns:
             mot.lib.kernel_data.KernelData: the kernel data object
         """
         raise NotImplementedError()
 
-    def _get_state_update_cl_func(self, nmr_samples, thinning, return_output):
+    def _get_state_update_cl_func(self):
         """Get the function that can advance the sampler state.
 
-        This function is called by the MCMC sampler to draw and return a new sample.
-
-        Args:
-            nmr_samples (int): the number of samples we will draw
-            thinning (int): the thinning factor we want to use
-            return_output (boolean): if the kernel should return output
+        This function is called by the MCMC sampler to draw and return a new sample. Since the compute kernel is
+        compiled only once per sampler, this function should not depend on the number of samples or the thinning.
 
         Returns:
             str: a CL function with signature:
@@ -103,8 +116,44 @@ class AbstractSampler:
         Args:
             cl_runtime_info (mot.configuration.CLRuntimeInfo): the new runtime information
         """
+        self.synchronize_state()
+        self._state_kernel_data = None
+        self._state_on_device = False
+        self._state_problem_ranges = None
         self._cl_runtime_info = cl_runtime_info
 
+    def synchronize_state(self):
+        """Copy the sampler state from the device to the host.
+
+        This is only needed if the sampler keeps its state on the device (``device_resident_state``) and you need the
+        current state in between batches. At the end of every call to :meth:`sample` the state is synchronized
+        automatically.
+        """
+        if self._state_on_device:
+            host_access = HostAccess(list(self._state_kernel_data.values()), self._cl_runtime_info.cl_environments,
+                                     problem_ranges=self._state_problem_ranges)
+            host_access.process()
+            host_access.finish()
+
+    def prepare(self, is_blocking=True):
+        """Compile the sample kernel ahead of time, without sampling.
+
+        The sample kernel does not depend on the number of samples, the burn-in or the thinning, such that after
+        preparing, calls to :meth:`sample` do not have to compile anymore.
+
+        Args:
+            is_blocking (boolean): if set, we return after the kernel is compiled. If not set, the kernel is
+                compiled in the background.
+
+        Returns:
+            None or Dict[CLEnvironment: concurrent.futures.Future]: if not blocking, per CL environment a future
+                for the built program.
+        """
+        if self._compute_func is None:
+            self._compute_func = self._get_compute_func()
+        return self._compute_func.prepare(self._get_kernel_data(1, 1, True), self._nmr_problems,
+                                          cl_runtime_info=self._cl_runtime_info, is_blocking=is_blocking)
+
     def sample(self, nmr_samples, burnin=0, thinning=1):
         """Take additional samples from the given likelihood and prior, using this sampler.
 
@@ -128,14 +177,18 @@ class AbstractSampler:
         max_samples_per_batch = max(1000 // thinning, 100)
 
         with self._logging(nmr_samples, burnin, thinning):
-            if burnin > 0:
-                for batch_start, batch_end in split_in_batches(burnin, max_batch_size=max_samples_per_batch):
-                    self._sample(batch_end - batch_start, return_output=False)
-            if nmr_samples > 0:
-                outputs = []
-                for batch_start, batch_end in split_in_batches(nmr_samples, max_batch_size=max_samples_per_batch):
-                    outputs.append(self._sample(batch_end - batch_start, thinning=thinning))
-                return SimpleSampleOutput(*[np.concatenate([o[ind] for o in outputs], axis=-1) for ind in range(3)])
+            try:
+                if burnin > 0:
+                    for batch_start, batch_end in split_in_batches(burnin, max_batch_size=max_samples_per_batch):
+                        self._sample(batch_end - batch_start, return_output=False)
+                if nmr_samples > 0:
+                    outputs = []
+                    for batch_start, batch_end in split_in_batches(nmr_samples, max_batch_size=max_samples_per_batch):
+                        outputs.append(self._sample(batch_end - batch_start, thinning=thinning))
+                    return SimpleSampleOutput(*[np.concatenate([o[ind] for o in outputs], axis=-1)
+                                                for ind in range(3)])
+            finally:
+                self.synchronize_state()
 
     def _sample(self, nmr_samples, thinning=1, return_output=True):
         """Sample the given number of samples with the given thinning.
@@ -151,17 +204,53 @@ class AbstractSampler:
         Returns:
             None or tuple: if ``return_output`` is True three ndarrays as (samples, log_likelihoods, log_priors)
         """
+        if self._compute_func is None:
+            self._compute_func = self._get_compute_func()
+
+        use_local_reduction = all(env.is_gpu for env in self._cl_runtime_info.cl_environments)
         kernel_data = self._get_kernel_data(nmr_samples, thinning, return_output)
-        sample_func = self._get_compute_func(nmr_samples, thinning, return_output)
-        sample_func.evaluate(kernel_data, self._nmr_problems,
-                             use_local_reduction=all(env.is_gpu for env in self._cl_runtime_info.cl_environments),
-                             cl_runtime_info=self._cl_runtime_info)
+
+        if self._device_resident_state:
+            self._evaluate_device_resident(kernel_data, use_local_reduction)
+        else:
+            self._compute_func.evaluate(kernel_data, self._nmr_problems, use_local_reduction=use_local_reduction,
+                                        cl_runtime_info=self._cl_runtime_info)
         self._sampling_index += nmr_samples * thinning
         if return_output:
             return (kernel_data['samples'].get_data(),
                     kernel_data['log_likelihoods'].get_data(),
                     kernel_data['log_priors'].get_data())
 
+    def _evaluate_device_resident(self, kernel_data, use_local_reduction):
+        """Evaluate the compute function while keeping the sampler state on the device.
+
+        The sampler state is only transferred to the device if it is not yet there. The other inputs are transferred
+        at every call and only the outputs are transferred back to the host.
+
+        Args:
+            kernel_data (dict[str: mot.lib.utils.KernelData]): the kernel data from :meth:`_get_kernel_data`
+            use_local_reduction (boolean): if we use local reduction in the compute function
+        """
+        cl_environments = self._cl_runtime_info.cl_environments
+
+        bound_kernel = self._compute_func.bind(kernel_data, self._nmr_problems,
+                                               use_local_reduction=use_local_reduction,
+                                               cl_runtime_info=self._cl_runtime_info, do_data_transfers=False)
+
+        if not self._state_on_device:
+            DeviceAccess(list(self._state_kernel_data.values()), cl_environments).process()
+            self._state_on_device = True
+        DeviceAccess([data for name, data in bound_kernel.kernel_data.items() if name not in self._state_kernel_data],
+                     cl_environments).process()
+
+        bound_kernel.launch()
+        self._state_problem_ranges = bound_kernel.get_problem_ranges()
+
+        host_access = HostAccess([kernel_data[name] for name in ['samples', 'log_likelihoods', 'log_priors']],
+                                 cl_environments, problem_ranges=self._state_problem_ranges)
+        host_access.process()
+        host_access.finish()
+
     def _initialize_likelihood_prior(self, positions, log_likelihoods, log_priors):
         """Initialize the likelihood and the prior using the given positions.
 
@@ -211,17 +300,20 @@ class AbstractSampler:
         * method_data: the data specific to the MCMC method
         * nmr_iterations: the number of iterations to sample
         * iteration_offset: the current sample index, that is, the offset to the given number of iterations
+        * nmr_samples: the number of samples to store, zero if ``return_output`` is False
+        * thinning: the thinning factor
         * rng_state: the random number generator state
         * current_chain_position: the current position of the sampled chain
         * current_log_likelihood: the log likelihood of the current position on the chain
         * current_log_prior: the log prior of the current position on the chain
-
-        Additionally, if ``return_output`` is True, we add to that the arrays:
-
         * samples: for the samples
         * log_likelihoods: for storing the log likelihoods
         * log_priors: for storing the priors
 
+        The sizes are provided as kernel arguments and the output arrays pass their offset between the problem
+        instances as kernel argument, such that the kernel source does not depend on the number of samples or the
+        thinning. If ``return_output`` is False, the output arrays are placeholders of one element per problem.
+
         Args:
             nmr_samples (int): the number of samples we will draw
             thinning (int): the thinning factor we want to use
@@ -232,30 +324,59 @@ class AbstractSampler:
         """
         kernel_data = {
             'data': self._data,
-            'method_data': self._get_mcmc_method_kernel_data(),
-            'nmr_iterations': Scalar(nmr_samples * thinning, ctype='ulong'),
-            'iteration_offset': Scalar(self._sampling_index, ctype='ulong'),
-            'rng_state': Array(self._rng_state, 'uint', mode='rw'),
-            'current_chain_position': Array(self._current_chain_position, 'mot_float_type', mode='rw'),
-            'current_log_likelihood': Array(self._current_log_likelihood, 'mot_float_type', mode='rw'),
-            'current_log_prior': Array(self._current_log_prior, 'mot_float_type', mode='rw'),
+            'nmr_iterations': Scalar(nmr_samples * thinning, ctype='ulong', inline=False),
+            'iteration_offset': Scalar(self._sampling_index, ctype='ulong', inline=False),
+            'nmr_samples': Scalar(nmr_samples if return_output else 0, ctype='ulong', inline=False),
+            'thinning': Scalar(thinning, ctype='ulong', inline=False),
         }
+        kernel_data.update(self._get_state_kernel_data())
 
         if return_output:
-            kernel_data.update({
-                'samples': Zeros((self._nmr_problems, self._nmr_params, nmr_samples), ctype='mot_float_type'),
-                'log_likelihoods': Zeros((self._nmr_problems, nmr_samples), ctype='mot_float_type'),
-                'log_priors': Zeros((self._nmr_problems, nmr_samples), ctype='mot_float_type'),
-            })
+            output_shapes = {'samples': (self._nmr_problems, self._nmr_params, nmr_samples),
+                             'log_likelihoods': (self._nmr_problems, nmr_samples),
+                             'log_priors': (self._nmr_problems, nmr_samples)}
+        else:
+            output_shapes = {name: (self._nmr_problems,) for name in ['samples', 'log_likelihoods', 'log_priors']}
+
+        # the kernel writes every output element, as such, the outputs can be pooled write only device buffers
+        for name, shape in output_shapes.items():
+            kernel_data[name] = Zeros(shape, ctype='mot_float_type', mode='w', use_host_ptr=False,
+                                      runtime_stride=True)
         return kernel_data
 
-    def _get_compute_func(self, nmr_samples, thinning, return_output):
+    def _get_state_kernel_data(self):
+        """Get the kernel data holding the state of the sampler.
+
+        This sets the items ``method_data``, ``rng_state``, ``current_chain_position``, ``current_log_likelihood``
+        and ``current_log_prior``, see :meth:`_get_kernel_data`. If the sampler keeps its state on the device,
+        the same kernel data objects, and hence the same device buffers, are returned for every batch.
+
+        Returns:
+            dict[str: mot.lib.utils.KernelData]: the kernel data of the sampler state
+        """
+        if self._state_kernel_data is not None:
+            return self._state_kernel_data
+
+        state_kernel_data = {
+            'method_data': self._get_mcmc_method_kernel_data(),
+            'rng_state': Array(self._rng_state, 'uint', mode='rw', use_host_ptr=self._state_use_host_ptr),
+            'current_chain_position': Array(self._current_chain_position, 'mot_float_type', mode='rw',
+                                            use_host_ptr=self._state_use_host_ptr),
+            'current_log_likelihood': Array(self._current_log_likelihood, 'mot_float_type', mode='rw',
+                                            use_host_ptr=self._state_use_host_ptr),
+            'current_log_prior': Array(self._current_log_prior, 'mot_float_type', mode='rw',
+                                       use_host_ptr=self._state_use_host_ptr),
+        }
+        if self._device_resident_state:
+            self._state_kernel_data = state_kernel_data
+            self._state_on_device = False
+        return state_kernel_data
+
+    def _get_compute_func(self):
         """Get the MCMC algorithm as a computable function.
 
-        Args:
-            nmr_samples (int): the number of samples we will draw
-            thinning (int): the thinning factor we want to use
-            return_output (boolean): if the kernel should return output
+        The number of iterations, the number of samples to store and the thinning are kernel arguments, such that
+        this function only needs to be compiled once per sampler.
 
         Returns:
             mot.lib.cl_function.CLFunction: the compute function
@@ -267,9 +388,11 @@ class AbstractSampler:
                          global mot_float_type* current_log_prior,
                          ulong iteration_offset,
                          ulong nmr_iterations,
-                         ''' + ('''global mot_float_type* samples,
-                                   global mot_float_type* log_likelihoods,
-                                   global mot_float_type* log_priors,''' if return_output else '') + '''
+                         ulong nmr_samples,
+                         ulong thinning,
+                         global mot_float_type* samples,
+                         global mot_float_type* log_likelihoods,
+                         global mot_float_type* log_priors,
                          void* method_data,
                          void* data){
 
@@ -279,23 +402,19 @@ class AbstractSampler:
                 void* rng_data = (void*)&rand123_rng_data;
 
                 for(ulong i = 0; i < nmr_iterations; i++){
-        '''
-        if return_output:
-            cl_func += '''
-                    if(is_first_work_item){
-                        if(i % ''' + str(thinning) + ''' == 0){
-                            log_likelihoods[i / ''' + str(thinning) + '''] = *current_log_likelihood;
-                            log_priors[i / ''' + str(thinning) + '''] = *current_log_prior;
+                    if(nmr_samples > 0 && is_first_work_item){
+                        if(i % thinning == 0){
+                            log_likelihoods[i / thinning] = *current_log_likelihood;
+                            log_priors[i / thinning] = *current_log_prior;
 
                             for(uint j = 0; j < ''' + str(self._nmr_params) + '''; j++){
-                                samples[(ulong)(i / ''' + str(thinning) + ''') // remove the interval
-                                        + j * ''' + str(nmr_samples) + '''  // parameter index
+                                samples[(ulong)(i / thinning) // remove the interval
+                                                + j * nmr_samples  // parameter index
                                 ] = current_chain_position[j];
                             }
                         }
                     }
-        '''
-        cl_func += '''
+
                     _advanceSampler(method_data, data, i + iteration_offset, rng_data,
                                     current_chain_position, current_log_likelihood, current_log_prior);
                 }
@@ -309,7 +428,7 @@ class AbstractSampler:
             cl_func,
             dependencies=[Rand123(), self._get_log_prior_cl_func(),
                           self._get_log_likelihood_cl_func(),
-                          SimpleCLCodeObject(self._get_state_update_cl_func(nmr_samples, thinning, return_output))])
+                          SimpleCLCodeObject(self._get_state_update_cl_func())])
 
     def _get_log_prior_cl_func(self):
         """Get the CL log prior compute function.
@@ -412,10 +531,11 @@ class AbstractRWMSampler(AbstractSampler):
 
     def _get_mcmc_method_kernel_data_elements(self):
         """Get the mcmc method kernel data elements. Used by :meth:`_get_mcmc_method_kernel_data`."""
-        return {'proposal_stds': Array(self._proposal_stds, 'mot_float_type', mode='rw'),
+        return {'proposal_stds': Array(self._proposal_stds, 'mot_float_type', mode='rw',
+                                       use_host_ptr=self._state_use_host_ptr),
                 'x_tmp': LocalMemory('mot_float_type', nmr_items=1 + self._nmr_params)}
 
-    def _get_proposal_update_function(self, nmr_samples, thinning, return_output):
+    def _get_proposal_update_function(self):
         """Get the proposal update function.
 
         Returns:
@@ -448,8 +568,8 @@ class AbstractRWMSampler(AbstractSampler):
             void _sampleAccepted(_mcmc_method_data* method_data, ulong current_iteration, uint parameter_ind){}
         '''
 
-    def _get_state_update_cl_func(self, nmr_samples, thinning, return_output):
-        kernel_source = self._get_proposal_update_function(nmr_samples, thinning, return_output)
+    def _get_state_update_cl_func(self):
+        kernel_source = self._get_proposal_update_function()
         kernel_source += self._at_acceptance_callback_c_func()
         kernel_source += self._finalize_proposal_func.get_cl_code()
 
@@ -67,14 +67,17 @@ class SingleComponentAdaptiveMetropolis(AbstractRWMSampler):
     def _get_mcmc_method_kernel_data_elements(self):
         kernel_data = super()._get_mcmc_method_kernel_data_elements()
         kernel_data.update({
-            'parameter_means': Array(self._parameter_means, 'mot_float_type', mode='rw'),
-            'parameter_variances': Array(self._parameter_variances, 'mot_float_type', mode='rw'),
-            'parameter_variance_update_m2s': Array(self._parameter_variance_update_m2s, 'mot_float_type', mode='rw'),
+            'parameter_means': Array(self._parameter_means, 'mot_float_type', mode='rw',
+                                     use_host_ptr=self._state_use_host_ptr),
+            'parameter_variances': Array(self._parameter_variances, 'mot_float_type', mode='rw',
+                                         use_host_ptr=self._state_use_host_ptr),
+            'parameter_variance_update_m2s': Array(self._parameter_variance_update_m2s, 'mot_float_type', mode='rw',
+                                                   use_host_ptr=self._state_use_host_ptr),
             'epsilons': Array(self._epsilon, 'float', mode='r', parallelize_over_first_dimension=False)
         })
         return kernel_data
 
-    def _get_proposal_update_function(self, nmr_samples, thinning, return_output):
+    def _get_proposal_update_function(self):
         kernel_source = '''
             /** Online variance algorithm by Welford:
              *      B. P. Welford (1962)."Note on a method for calculating corrected sums of squares
@@ -89,14 +89,16 @@ class ThoughtfulWalk(AbstractSampler):
 
     def _get_mcmc_method_kernel_data(self):
         return Struct({
-            'x1_position': Array(self._x1, 'mot_float_type', mode='rw'),
-            'x1_log_likelihood': Array(self._x1_log_likelihood, 'mot_float_type', mode='rw'),
-            'x1_log_prior': Array(self._x1_log_prior, 'mot_float_type', mode='rw'),
+            'x1_position': Array(self._x1, 'mot_float_type', mode='rw', use_host_ptr=self._state_use_host_ptr),
+            'x1_log_likelihood': Array(self._x1_log_likelihood, 'mot_float_type', mode='rw',
+                                       use_host_ptr=self._state_use_host_ptr),
+            'x1_log_prior': Array(self._x1_log_prior, 'mot_float_type', mode='rw',
+                                  use_host_ptr=self._state_use_host_ptr),
             'scratch_mft': LocalMemory('mot_float_type', self._nmr_params + 2),
             'scratch_int': LocalMemory('int', self._nmr_params + 4),
         }, '_twalk_data')
 
-    def _get_state_update_cl_func(self, nmr_samples, thinning, return_output):
+    def _get_state_update_cl_func(self):
         func = parse_cl_function('''
             void _twalk_advance_chain(
                     void* method_data,
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+import pyopencl as cl
+
+from mot.lib.cl_environments import CLEnvironmentFactory
+from mot.lib.cl_function import SimpleCLFunction
+from mot.lib.kernel_data import Array
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_CLEnvironment(unittest.TestCase):
+
+    def test_queue_pool(self):
+        env = CLEnvironmentFactory.smart_device_selection()[0]
+
+        self.assertIs(env.queue, env.get_queue(0))
+        self.assertIs(env.get_queue(env.nmr_queues), env.queue)
+        self.assertIsNot(env.get_queue(1), env.queue)
+        self.assertEqual(env.get_queue(1, out_of_order=True) is env.get_queue(1), not env.supports_out_of_order)
+
+        queue_env = env.get_queue_environment(2, out_of_order=True)
+        self.assertIs(queue_env.queue, env.get_queue(2, out_of_order=True))
+        self.assertIs(queue_env.context, env.context)
+
+    def test_non_blocking_launches(self):
+        func = SimpleCLFunction.from_string('double twice(global double* x){ return 2 * *x; }')
+        bound_kernel = func.bind({'x': Array(np.arange(10.))}, 10)
+
+        for ind in range(3):
+            bound_kernel.kernel_data['x'].get_data()[:] = ind
+            _, events = bound_kernel.launch(is_blocking=False, return_events=True)
+            cl.wait_for_events(list(events.values()))
+            np.testing.assert_allclose(bound_kernel.kernel_data['__return_values'].get_data(), 2 * ind)
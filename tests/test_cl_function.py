@@ -0,0 +1,174 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from mot.configuration import CLRuntimeInfo, get_program_cache
+from mot.lib import cl_function
+from mot.lib.cl_function import SimpleCLFunction, SimpleCLFunctionParameter, link_cl_code
+from mot.lib.kernel_data import Array, Scalar, Zeros
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_SimpleCLFunctionParameter(unittest.TestCase):
+
+    def test_declarations(self):
+        param = SimpleCLFunctionParameter('local const mot_float_type* const x')
+        self.assertEqual(param.address_space, 'local')
+        self.assertEqual(param.get_declaration(), 'local const mot_float_type* const  x')
+        self.assertEqual(param.basic_ctype, 'mot_float_type')
+        self.assertEqual(param.nmr_pointers, 1)
+        self.assertEqual(param.name, 'x')
+
+        param = SimpleCLFunctionParameter('private float4 v[3][2]')
+        self.assertEqual(param.ctype, 'float4')
+        self.assertEqual(param.array_sizes, [3, 2])
+
+    def test_fallback_parser(self):
+        param = SimpleCLFunctionParameter('unsigned int a')
+        self.assertEqual(param.name, 'a')
+
+
+class test_link_cl_code(unittest.TestCase):
+
+    def test_unique_functions_in_order(self):
+        a = SimpleCLFunction.from_string('double a(double x){ return x; }')
+        b = SimpleCLFunction.from_string('double b(double x){ return a(x); }', dependencies=[a])
+        c = SimpleCLFunction.from_string('double c(double x){ return a(x); }',
+                                         dependencies=[SimpleCLFunction.from_string('double a(double x){ return x; }')])
+        d = SimpleCLFunction.from_string('double d(double x){ return b(x) + c(x); }', dependencies=[b, c])
+
+        code = link_cl_code([d])
+        self.assertEqual(code.count('#ifndef'), 4)
+        self.assertTrue(code.index('double a(') < code.index('double b(') < code.index('double c(')
+                        < code.index('double d('))
+        self.assertIs(d.get_cl_code(), d.get_cl_code())
+
+    def test_overridden_get_cl_code(self):
+        class CustomFunction(SimpleCLFunction):
+            def get_cl_code(self):
+                return '/* custom */\n' + super().get_cl_code()
+
+        a = CustomFunction('double', 'a', ['double x'], 'return x;')
+        b = SimpleCLFunction.from_string('double b(double x){ return a(x); }', dependencies=[a])
+
+        code = b.get_cl_code()
+        self.assertIn('/* custom */', code)
+        self.assertTrue(code.index('double a(') < code.index('double b('))
+
+    def test_linked_once(self):
+        a = SimpleCLFunction.from_string('double a(double x){ return x; }')
+        b = SimpleCLFunction.from_string('double b(double x){ return a(x); }', dependencies=[a])
+
+        with mock.patch('mot.lib.cl_function._get_linked_objects',
+                        wraps=cl_function._get_linked_objects) as get_linked_objects:
+            code = b.get_cl_code()
+            self.assertIs(b.get_cl_code(), code)
+            self.assertEqual(get_linked_objects.call_count, 1)
+        self.assertTrue(code.index('double a(') < code.index('double b('))
+
+
+class test_BoundKernel(unittest.TestCase):
+
+    def test_repeated_launch(self):
+        func = SimpleCLFunction.from_string('double twice(global double* x){ return 2 * *x; }')
+        bound_kernel = func.bind({'x': Array(np.arange(10.))}, 10)
+
+        for ind in range(3):
+            bound_kernel.kernel_data['x'].get_data()[:] = ind
+            np.testing.assert_allclose(bound_kernel.launch(), 2 * ind)
+
+    def test_changed_scalar(self):
+        func = SimpleCLFunction.from_string('double scale(global double* x, double factor){ return factor * *x; }')
+        factor = Scalar(2, ctype='double', inline=False)
+        bound_kernel = func.bind({'x': Array(np.arange(10.)), 'factor': factor}, 10)
+
+        np.testing.assert_allclose(bound_kernel.launch(), 2 * np.arange(10.))
+        factor.set_value(3)
+        np.testing.assert_allclose(bound_kernel.launch(), 3 * np.arange(10.))
+
+    def test_changed_precision(self):
+        func = SimpleCLFunction.from_string('double twice(global mot_float_type* x){ return 2 * *x; }')
+        x = Array(np.arange(10.), 'mot_float_type', mode='r')
+        bound_kernel = func.bind({'x': x}, 10, cl_runtime_info=CLRuntimeInfo(double_precision=True))
+        np.testing.assert_allclose(bound_kernel.launch(), 2 * np.arange(10.))
+
+        func.evaluate({'x': x}, 10, cl_runtime_info=CLRuntimeInfo(double_precision=False))
+        np.testing.assert_allclose(bound_kernel.launch(), 2 * np.arange(10.))
+
+
+class test_evaluate_async(unittest.TestCase):
+
+    def setUp(self):
+        self._func = SimpleCLFunction.from_string('''
+            double sum(global double* x, global double* y){
+                *y = x[1];
+                return x[0] + x[1];
+            }
+        ''')
+        self._x = np.random.rand(100, 2)
+
+    def test_future(self):
+        inputs = [{'x': Array(self._x + ind, mode='r'), 'y': Zeros((100,), 'double')} for ind in range(3)]
+        futures = [self._func.evaluate_async(el, 100) for el in inputs]
+
+        for ind, future in enumerate(futures):
+            np.testing.assert_allclose(future.result(timeout=60), (self._x + ind).sum(axis=1))
+            np.testing.assert_allclose(inputs[ind]['y'].get_data(), self._x[:, 1] + ind)
+
+    def test_asyncio(self):
+        async def evaluate_all():
+            return await asyncio.gather(*[self._func.evaluate_asyncio({'x': Array(self._x + ind, mode='r'),
+                                                                       'y': Zeros((100,), 'double')}, 100)
+                                          for ind in range(3)])
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(evaluate_all())
+        finally:
+            loop.close()
+
+        for ind, result in enumerate(results):
+            np.testing.assert_allclose(result, (self._x + ind).sum(axis=1))
+
+
+class test_prepare(unittest.TestCase):
+
+    def test_prepare(self):
+        func = SimpleCLFunction.from_string('''
+            double prepared_sum(global double* x){
+                return x[0] + x[1];
+            }
+        ''')
+        x = np.random.rand(100, 2)
+        nmr_environments = len(CLRuntimeInfo().cl_environments)
+
+        get_program_cache().clear()
+        func.prepare({'x': Array(x, mode='r')}, 100)
+        self.assertEqual(get_program_cache().misses, nmr_environments)
+
+        np.testing.assert_allclose(func.evaluate({'x': Array(x, mode='r')}, 100), x.sum(axis=1))
+        self.assertEqual(get_program_cache().misses, nmr_environments)
+
+    def test_non_blocking_prepare(self):
+        func = SimpleCLFunction.from_string('''
+            double prepared_product(global double* x){
+                return x[0] * x[1];
+            }
+        ''')
+        x = np.random.rand(100, 2)
+
+        get_program_cache().clear()
+        futures = func.prepare({'x': Array(x, mode='r')}, 100, is_blocking=False)
+        for future in futures.values():
+            future.result(timeout=60)
+        nmr_misses = get_program_cache().misses
+
+        np.testing.assert_allclose(func.evaluate({'x': Array(x, mode='r')}, 100), x.prod(axis=1))
+        self.assertEqual(get_program_cache().misses, nmr_misses)
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from mot.lib.cl_function import SimpleCLFunction
+from mot.lib.kernel_data import Array, Zeros
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_ProcessKernelInChunks(unittest.TestCase):
+
+    def test_chunked_evaluate(self):
+        func = SimpleCLFunction.from_string('''
+            double sum(global double* x, global double* y){
+                *y = x[1];
+                return x[0] + x[1];
+            }
+        ''')
+        x = np.random.rand(1000, 2)
+        inputs = {'x': Array(x, mode='r'), 'y': Zeros((1000,), 'double')}
+
+        np.testing.assert_allclose(func.evaluate(inputs, 1000, max_chunk_size=128), x.sum(axis=1))
+        np.testing.assert_allclose(inputs['y'].get_data(), x[:, 1])
+
+    def test_shared_writable_data(self):
+        func = SimpleCLFunction.from_string('''
+            void count(global double* x, global uint* counter){
+                atomic_inc(counter);
+            }
+        ''')
+        inputs = {'x': Array(np.random.rand(1000, 2), mode='r'),
+                  'counter': Zeros((1,), 'uint', parallelize_over_first_dimension=False)}
+
+        with self.assertRaises(ValueError):
+            func.evaluate(inputs, 1000, max_chunk_size=128)
+
+    def test_writable_interleaved_data(self):
+        func = SimpleCLFunction.from_string('''
+            void add(float* x, float* y){
+                for(uint i = 0; i < 3; i++){
+                    y[i] += x[i];
+                }
+            }
+        ''')
+        x = np.random.rand(1000, 3).astype(np.float32)
+
+        with self.assertRaises(ValueError):
+            func.evaluate({'x': Array(x, 'float', mode='r', interleaved=True),
+                           'y': Array(np.ones((1000, 3), dtype=np.float32), 'float', interleaved=True)},
+                          1000, max_chunk_size=128)
+
+        y = Array(np.ones((1000, 3), dtype=np.float32), 'float')
+        func.evaluate({'x': Array(x, 'float', mode='r', interleaved=True), 'y': y}, 1000, max_chunk_size=128)
+        np.testing.assert_allclose(y.get_data(), x + 1)
@@ -10,9 +10,15 @@ Tests for `mot` module.
 
 import unittest
 import numpy as np
+import pyopencl as cl
 
-from mot import minimize
+from mot import minimize, prepare_minimize
+from mot.configuration import CLRuntimeInfo, get_buffer_pool, get_program_cache, set_buffer_pool
+from mot.cl_routines import compute_fused
+from mot.lib.cl_environments import CLEnvironment, CLEnvironmentFactory
 from mot.lib.cl_function import SimpleCLFunction
+from mot.lib.kernel_data import BufferPool
+from mot.sample import MetropolisWithinGibbs
 
 
 class CLRoutineTestCase(unittest.TestCase):
@@ -91,6 +97,144 @@ class TestLSQNonLinExample(CLRoutineTestCase):
                 with self.subTest(f"method={method},ind={ind}"):
                     self.assertAlmostEqual(v[0, ind], 0.2578, places=3, msg=method)
 
+    def test_prepare(self):
+        for method in self.methods:
+            with self.subTest(f"method={method}"):
+                get_program_cache().clear()
+                prepare_minimize(self._objective_func, np.array([[0.3, 0.4]]), method=method,
+                                 nmr_observations=self._nmr_observations)
+                nmr_misses = get_program_cache().misses
+                self.assertGreater(nmr_misses, 0)
+
+                output = minimize(self._objective_func, np.array([[0.3, 0.4]]), method=method,
+                                  nmr_observations=self._nmr_observations)
+                self.assertEqual(get_program_cache().misses, nmr_misses)
+                self.assertAlmostEqual(output['x'][0, 0], 0.2578, places=3, msg=method)
+
+
+class TestSample(CLRoutineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._ll_func = SimpleCLFunction.from_string('''
+            double gaussian_ll(local const mot_float_type* const x, void* data){
+                return -(x[0] * x[0] + x[1] * x[1]) / 2;
+            }
+        ''')
+        self._log_prior_func = SimpleCLFunction.from_string('''
+            mot_float_type flat_prior(local const mot_float_type* const x, void* data){
+                return 0;
+            }
+        ''')
+        self._x0 = np.random.rand(10, 2)
+
+    def _get_sampler(self, **kwargs):
+        np.random.seed(0)  # the random number generator state of the sampler is drawn using numpy
+        return MetropolisWithinGibbs(self._ll_func, self._log_prior_func, self._x0, np.ones_like(self._x0), **kwargs)
+
+    def test_device_resident_state(self):
+        host_sampler = self._get_sampler()
+        device_sampler = self._get_sampler(device_resident_state=True)
+
+        for _ in range(3):
+            host_output = host_sampler.sample(20, burnin=5, thinning=2)
+            device_output = device_sampler.sample(20, burnin=5, thinning=2)
+
+            np.testing.assert_allclose(device_output.get_samples(), host_output.get_samples(), rtol=1e-5)
+            np.testing.assert_allclose(device_output.get_log_likelihoods(), host_output.get_log_likelihoods(),
+                                       rtol=1e-5)
+            np.testing.assert_allclose(device_output.get_log_priors(), host_output.get_log_priors(), rtol=1e-5)
+
+        host_sampler._sample(10, return_output=False)
+        device_sampler._sample(10, return_output=False)
+        device_sampler.synchronize_state()
+
+        np.testing.assert_allclose(device_sampler._current_chain_position, host_sampler._current_chain_position,
+                                   rtol=1e-5)
+        np.testing.assert_allclose(device_sampler._current_log_likelihood, host_sampler._current_log_likelihood,
+                                   rtol=1e-5)
+        np.testing.assert_array_equal(device_sampler._rng_state, host_sampler._rng_state)
+
+    def test_multiple_contexts(self):
+        env = CLEnvironmentFactory.smart_device_selection()[0]
+        cl_environments = [CLEnvironment(env.platform, cl.Context([env.device]), env.device) for _ in range(2)]
+
+        reference_sampler = self._get_sampler()
+        reference_output = reference_sampler.sample(20, burnin=5, thinning=2)
+        for device_resident_state in [False, True]:
+            sampler = self._get_sampler(cl_runtime_info=CLRuntimeInfo(cl_environments=cl_environments),
+                                        device_resident_state=device_resident_state)
+            output = sampler.sample(20, burnin=5, thinning=2)
+
+            np.testing.assert_allclose(output.get_samples(), reference_output.get_samples(), rtol=1e-5)
+            np.testing.assert_allclose(output.get_log_likelihoods(), reference_output.get_log_likelihoods(),
+                                       rtol=1e-5)
+            np.testing.assert_allclose(sampler._current_chain_position, reference_sampler._current_chain_position,
+                                       rtol=1e-5)
+
+    def test_compile_once(self):
+        get_program_cache().clear()
+
+        sampler = self._get_sampler()
+        batched_samples = [sampler.sample(10, thinning=2).get_samples(),
+                           sampler.sample(10, thinning=2).get_samples()]
+        sampler.sample(7, burnin=3, thinning=3)
+        sampler.sample(1)
+
+        self.assertEqual(get_program_cache().misses, len(sampler._cl_runtime_info.cl_environments))
+
+        reference_samples = self._get_sampler().sample(20, thinning=2).get_samples()
+        np.testing.assert_allclose(np.concatenate(batched_samples, axis=-1), reference_samples, rtol=1e-5)
+        self.assertEqual(get_program_cache().misses, len(sampler._cl_runtime_info.cl_environments))
+
+    def test_pooled_outputs(self):
+        pool = BufferPool()
+        previous_pool = get_buffer_pool()
+        set_buffer_pool(pool)
+        try:
+            sampler = self._get_sampler()
+            outputs = [sampler.sample(10, thinning=2) for _ in range(3)]
+        finally:
+            set_buffer_pool(previous_pool)
+
+        self.assertGreater(pool.hits, 0)
+        reference = self._get_sampler()
+        for output in outputs:
+            np.testing.assert_allclose(output.get_samples(), reference.sample(10, thinning=2).get_samples(),
+                                       rtol=1e-5)
+
+    def test_prepare(self):
+        get_program_cache().clear()
+
+        sampler = self._get_sampler()
+        sampler.prepare()
+        self.assertEqual(get_program_cache().misses, len(sampler._cl_runtime_info.cl_environments))
+
+        samples = sampler.sample(10, burnin=5, thinning=2).get_samples()
+        self.assertEqual(get_program_cache().misses, len(sampler._cl_runtime_info.cl_environments))
+        np.testing.assert_allclose(samples, self._get_sampler().sample(10, burnin=5, thinning=2).get_samples(),
+                                   rtol=1e-5)
+
+
+class TestComputeFused(CLRoutineTestCase):
+
+    def test_compute_fused(self):
+        objective_func = SimpleCLFunction.from_string('''
+            double square(local const mot_float_type* const x, void* data, local mot_float_type* objective_list){
+                return x[0] * x[0];
+            }
+        ''')
+        ll_func = SimpleCLFunction.from_string('''
+            double negate(local const mot_float_type* const x, void* data){
+                return -x[1];
+            }
+        ''')
+        parameters = np.random.rand(100, 2)
+
+        squares, negations = compute_fused([objective_func, ll_func], parameters)
+        np.testing.assert_allclose(squares, parameters[:, 0] ** 2, rtol=1e-5)
+        np.testing.assert_allclose(negations, -parameters[:, 1], rtol=1e-5)
+
 
 if __name__ == '__main__':
     unittest.main()
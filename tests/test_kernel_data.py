@@ -0,0 +1,446 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pyopencl as cl
+
+from mot.configuration import CLRuntimeInfo, get_buffer_pool, set_buffer_pool, get_conversion_cache, \
+    set_conversion_cache
+from mot.lib.cl_environments import CLEnvironment, CLEnvironmentFactory
+from mot.lib.cl_function import SimpleCLFunction
+from mot.lib.kernel_data import Array, BufferPool, ConversionCache, Zeros, LocalMemory, Scalar, Struct, \
+    _convert_to_reduced_precision
+from mot.lib.load_balancers import EvenDistribution, WorkStealing
+from mot.lib.memory_planner import plan_constant_memory, get_batch_size, get_workgroup_size, check_local_memory
+from tests.utils import get_scale_function
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_BufferPool(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def test_reuse(self):
+        pool = BufferPool()
+        context = self._cl_environment.context
+
+        owner = Zeros((10,), 'float')
+        buffer = pool.get_buffer(owner, context, cl.mem_flags.READ_WRITE, 40)
+        del owner
+        gc.collect()
+        self.assertEqual(pool.get_size(), 40)
+
+        other_size = pool.get_buffer(Zeros((10,), 'float'), context, cl.mem_flags.READ_WRITE, 80)
+        reused = pool.get_buffer(Zeros((10,), 'float'), context, cl.mem_flags.READ_WRITE, 40)
+        self.assertIs(reused, buffer)
+        self.assertIsNot(other_size, buffer)
+        self.assertEqual((pool.hits, pool.misses), (1, 2))
+
+    def test_max_size(self):
+        pool = BufferPool(max_size=100)
+        context = self._cl_environment.context
+
+        owners = [Zeros((10,), 'float') for _ in range(3)]
+        for owner in owners:
+            pool.get_buffer(owner, context, cl.mem_flags.READ_WRITE, 40)
+        del owners, owner
+        gc.collect()
+
+        self.assertEqual(pool.get_size(), 80)
+        self.assertEqual(pool.evictions, 1)
+
+    def test_in_use(self):
+        pool = BufferPool()
+        context = self._cl_environment.context
+
+        owner = Zeros((10,), 'float')
+        buffer = pool.get_buffer(owner, context, cl.mem_flags.READ_WRITE, 40)
+        event = cl.UserEvent(context)
+        pool.add_events([buffer, np.float32(1)], [event])
+        del owner
+        gc.collect()
+        self.assertEqual(pool.get_size(), 0)
+
+        other_owner = Zeros((10,), 'float')
+        self.assertIsNot(pool.get_buffer(other_owner, context, cl.mem_flags.READ_WRITE, 40), buffer)
+
+        event.set_status(cl.command_execution_status.COMPLETE)
+        last_owner = Zeros((10,), 'float')
+        self.assertIs(pool.get_buffer(last_owner, context, cl.mem_flags.READ_WRITE, 40), buffer)
+
+    def test_kernel_data(self):
+        pool = BufferPool()
+        previous_pool = get_buffer_pool()
+        set_buffer_pool(pool)
+        try:
+            for _ in range(3):
+                zeros = Zeros((10,), 'float', host_accessible=False)
+                zeros.get_kernel_inputs(self._cl_environment, 1)
+                array = Array(np.zeros(10, dtype=np.float32), use_host_ptr=False)
+                array.get_kernel_inputs(self._cl_environment, 1)
+                self._cl_environment.queue.finish()
+                del zeros, array
+                gc.collect()
+        finally:
+            set_buffer_pool(previous_pool)
+
+        self.assertEqual((pool.hits, pool.misses), (4, 2))
+
+
+class test_Array(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def test_memmap(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'data.npy')
+            np.save(path, np.arange(30, dtype=np.float64).reshape(10, 3))
+
+            array = Array(np.load(path, mmap_mode='r'), 'mot_float_type', mode='r')
+            array.set_mot_float_dtype(np.float32)
+            subset = array.get_subset(batch_range=(2, 5))
+            self.assertIsInstance(subset._get_unloaded_data(), np.memmap)
+
+            func = SimpleCLFunction.from_string('''
+                double sum(global mot_float_type* x){
+                    return x[0] + x[1] + x[2];
+                }
+            ''')
+            np.testing.assert_allclose(func.evaluate({'x': subset}, 3), [21, 30, 39])
+            self.assertEqual(subset.get_data().dtype, np.float32)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_memmap_precision_change(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'data.npy')
+            np.save(path, np.arange(30, dtype=np.float64).reshape(10, 3))
+
+            array = Array(np.load(path, mmap_mode='r'), 'mot_float_type', mode='r')
+            array.set_mot_float_dtype(np.float32)
+            self.assertEqual(array.get_data().dtype, np.float32)
+            self.assertIsNone(array._backup_data_reference)
+
+            array.set_mot_float_dtype(np.float64)
+            self.assertEqual(array.get_data().dtype, np.float64)
+            np.testing.assert_allclose(array.get_data(), np.arange(30).reshape(10, 3))
+            self.assertIsNone(array._backup_data_reference)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_interleaved(self):
+        func = SimpleCLFunction.from_string('''
+            void add(float* x, float* y){
+                for(uint i = 0; i < 3; i++){
+                    y[i] += x[i];
+                }
+            }
+        ''')
+        x = np.random.rand(10, 3).astype(np.float32)
+        y = Array(np.ones((10, 3), dtype=np.float32), 'float', interleaved=True)
+        func.evaluate({'x': Array(x, 'float', mode='r', interleaved=True), 'y': y}, 10)
+        np.testing.assert_allclose(y.get_data(), x + 1)
+
+        struct_func = SimpleCLFunction.from_string('''
+            void add(mot_data_struct* data){
+                for(uint i = 0; i < 3; i++){
+                    data->y[i] += data->x[i];
+                }
+            }
+        ''')
+        y = Array(np.ones((10, 3), dtype=np.float32), 'float', interleaved=True)
+        struct_func.evaluate({'data': Struct({'x': Array(x, 'float', mode='r', interleaved=True), 'y': y},
+                                             'mot_data_struct')}, 10)
+        np.testing.assert_allclose(y.get_data(), x + 1)
+
+    def test_reduced_precision_storage(self):
+        func = SimpleCLFunction.from_string('''
+            float sum(mot_data_struct* data){
+                float sum = 0;
+                for(uint i = 0; i < 4; i++){
+                    sum += data->observations[i];
+                }
+                return sum;
+            }
+        ''')
+        observations = np.random.rand(10, 4) * 1000
+
+        for storage, tolerance in [('half', 0.5), ('short', 0.01), ('char', 2.5)]:
+            data = Array(observations, 'float', mode='r', storage=storage, storage_tolerance=tolerance)
+            self.assertEqual(data.get_memory_requirements(1).bytes_per_instance,
+                             4 * np.dtype({'half': np.float16, 'short': np.int16, 'char': np.int8}[storage]).itemsize)
+
+            result = func.evaluate({'data': Struct({'observations': data}, 'mot_data_struct')}, 10)
+            np.testing.assert_allclose(result, np.sum(observations, axis=1), atol=4 * tolerance)
+
+        self.assertRaises(ValueError, Array, observations, 'float', mode='r', storage='char', storage_tolerance=0.01)
+        self.assertRaises(ValueError, Array, observations, 'float', mode='rw', storage='half')
+
+    def test_reduced_precision_blocks(self):
+        observations = (np.random.rand(10, 4) * 1000).astype(np.float32)
+
+        for storage in ['half', 'short', 'char']:
+            stored, scale, offset = _convert_to_reduced_precision(observations, storage)
+            blocked, blocked_scale, blocked_offset = _convert_to_reduced_precision(observations, storage, block_size=7)
+
+            self.assertEqual(blocked.shape, observations.shape)
+            np.testing.assert_array_equal(blocked, stored)
+            self.assertEqual((blocked_scale, blocked_offset), (scale, offset))
+
+        self.assertRaises(ValueError, _convert_to_reduced_precision, observations, 'char', 0.01, 7)
+
+    def test_gathered_subset(self):
+        func = SimpleCLFunction.from_string('''
+            void scale(float* x, global float* y){
+                *y = 2 * x[1];
+            }
+        ''')
+        x = Array(np.random.rand(10, 2).astype(np.float32), 'float', mode='r')
+        y = Array(np.zeros(10, dtype=np.float32), 'float')
+        indices = [7, 1, 4]
+
+        x_subset = x.get_subset(problem_indices=indices)
+        y_subset = y.get_subset(problem_indices=indices)
+        np.testing.assert_array_equal(x_subset.get_data(), x.get_data()[indices])
+
+        func.evaluate({'x': x_subset, 'y': y_subset}, len(indices))
+        np.testing.assert_allclose(y.get_data()[indices], 2 * x.get_data()[indices, 1])
+        np.testing.assert_array_equal(np.delete(y.get_data(), indices), 0)
+        np.testing.assert_allclose(y_subset.get_subset(batch_range=(1, 3)).get_data(), y.get_data()[indices[1:]])
+
+        mot_float_func = SimpleCLFunction.from_string('''
+            void scale(mot_float_type* x, global mot_float_type* y){
+                *y = 2 * x[1];
+            }
+        ''')
+        for double_precision, dtype in [(False, np.float32), (True, np.float64)]:
+            with self.subTest(double_precision=double_precision):
+                x = Array(np.random.rand(10, 2), 'mot_float_type', mode='r')
+                y = Array(np.zeros(10), 'mot_float_type')
+
+                mot_float_func.evaluate({'x': x.get_subset(problem_indices=indices),
+                                         'y': y.get_subset(problem_indices=indices)}, len(indices),
+                                        cl_runtime_info=CLRuntimeInfo(double_precision=double_precision))
+                self.assertEqual(y.get_data().dtype, dtype)
+                np.testing.assert_allclose(y.get_data()[indices], 2 * x.get_data()[indices, 1], rtol=1e-5)
+                np.testing.assert_array_equal(np.delete(y.get_data(), indices), 0)
+
+    def test_gathered_memmap_subset(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'data.npy')
+            np.save(path, np.arange(30, dtype=np.float64).reshape(10, 3))
+
+            array = Array(np.load(path, mmap_mode='r'), 'mot_float_type', mode='r')
+            array.set_mot_float_dtype(np.float32)
+            array.get_data()
+            subset = array.get_subset(problem_indices=[7, 1, 4])
+
+            # changing the precision releases the loaded data of the memory mapped array owning the subset
+            subset.set_mot_float_dtype(np.float64)
+            self.assertEqual(subset.get_memory_requirements(1).shared_bytes, 30 * 8)
+
+            func = SimpleCLFunction.from_string('''
+                double sum(global mot_float_type* x){
+                    return x[0] + x[1] + x[2];
+                }
+            ''')
+            np.testing.assert_allclose(func.evaluate({'x': subset}, 3,
+                                                     cl_runtime_info=CLRuntimeInfo(double_precision=True)),
+                                       [66, 12, 39])
+            self.assertEqual(subset.get_data().dtype, np.float64)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_cached_conversions(self):
+        data = Array(np.random.rand(10, 3), 'mot_float_type', mode='r')
+
+        data.set_mot_float_dtype(np.float32)
+        single = data.get_data()
+        buffer = data.get_kernel_inputs(self._cl_environment, 1)[0]
+        self.assertEqual(single.dtype, np.float32)
+
+        data.set_mot_float_dtype(np.float64)
+        self.assertEqual(data.get_data().dtype, np.float64)
+
+        data.set_mot_float_dtype(np.float32)
+        self.assertIs(data.get_data(), single)
+        self.assertIs(data.get_kernel_inputs(self._cl_environment, 1)[0], buffer)
+
+    def test_conversion_cache_budget(self):
+        previous_pool, previous_cache = get_buffer_pool(), get_conversion_cache()
+        pool = BufferPool()
+        conversion_cache = ConversionCache(max_size=300)
+        set_buffer_pool(pool)
+        set_conversion_cache(conversion_cache)
+        try:
+            arrays = [Array(np.random.rand(10, 3), 'mot_float_type', mode='r', use_host_ptr=False) for _ in range(2)]
+            for array in arrays:
+                array.set_mot_float_dtype(np.float32)
+                array.get_kernel_inputs(self._cl_environment, 1)
+                array.set_mot_float_dtype(np.float64)
+
+            # every single precision conversion takes 120 bytes of host data and 120 bytes of device buffers
+            self.assertEqual(conversion_cache.get_size(), 240)
+            self.assertEqual(conversion_cache.evictions, 1)
+            self.assertEqual(pool.get_size(), 120)
+
+            conversion_cache.clear()
+            self.assertEqual(conversion_cache.get_size(), 0)
+            self.assertEqual(pool.get_size(), 240)
+
+            arrays[1].set_mot_float_dtype(np.float32)
+            self.assertEqual(arrays[1].get_data().dtype, np.float32)
+        finally:
+            set_buffer_pool(previous_pool)
+            set_conversion_cache(previous_cache)
+
+    def test_runtime_stride(self):
+        func = SimpleCLFunction.from_string('''
+            void fill(global float* y, ulong length){
+                for(ulong i = 0; i < length; i++){
+                    y[i] = i;
+                }
+            }
+        ''')
+        for length in [2, 5]:
+            y = Zeros((10, length), 'float', mode='w', use_host_ptr=False, runtime_stride=True)
+            self.assertNotIn(str(length), y.get_function_call_input('y', 'y', 'gid', 'global'))
+            func.evaluate({'y': y, 'length': Scalar(length, ctype='ulong', inline=False)}, 10)
+            np.testing.assert_allclose(y.get_data(), np.tile(np.arange(length), (10, 1)))
+
+        with self.assertRaises(ValueError):
+            Array(np.zeros((10, 3)), interleaved=True, runtime_stride=True)
+
+    def test_multiple_contexts(self):
+        cl_environments = [CLEnvironment(self._cl_environment.platform, cl.Context([self._cl_environment.device]),
+                                         self._cl_environment.device) for _ in range(2)]
+        func = get_scale_function()
+        x = np.arange(1000, dtype=np.float32)
+        for load_balancer in [EvenDistribution(), WorkStealing(nmr_chunks_per_device=4, min_chunk_size=10)]:
+            for use_host_ptr in [True, False]:
+                y = Array(np.zeros(1000, dtype=np.float32), 'float', mode='w', use_host_ptr=use_host_ptr)
+                func.evaluate({'x': Array(x, 'float', mode='r'), 'y': y}, 1000,
+                              cl_runtime_info=CLRuntimeInfo(cl_environments=cl_environments,
+                                                            load_balancer=load_balancer))
+                np.testing.assert_allclose(y.get_data(), 2 * x)
+
+        # interleaved arrays do not store the problem instances contiguously and can not be partially transferred
+        interleaved_func = SimpleCLFunction.from_string('''
+            void scale(global float* x, float* y){
+                y[0] = 2 * *x;
+            }
+        ''')
+        y = Array(np.zeros((1000, 1), dtype=np.float32), 'float', interleaved=True)
+        with self.assertRaises(ValueError):
+            interleaved_func.evaluate({'x': Array(x, 'float', mode='r'), 'y': y}, 1000,
+                                      cl_runtime_info=CLRuntimeInfo(cl_environments=cl_environments))
+
+
+class test_MemoryPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def test_memory_requirements(self):
+        data = Struct({'x': Array(np.zeros((10, 3)), 'mot_float_type'),
+                       'y': Array(np.zeros(5, dtype=np.int32), parallelize_over_first_dimension=False),
+                       'z': Zeros((10, 2), 'float', host_accessible=False),
+                       'local': LocalMemory('double')}, 'data')
+        data.set_mot_float_dtype(np.float32)
+
+        requirements = data.get_memory_requirements(8)
+        self.assertEqual(requirements.bytes_per_instance, 3 * 4 + 2 * 4)
+        self.assertEqual(requirements.shared_bytes, 5 * 4)
+        self.assertEqual(requirements.local_bytes, 8 * 8)
+        self.assertEqual(requirements.get_global_memory_size(10), 220)
+
+    def test_plan(self):
+        local_mem_size = self._cl_environment.device.get_info(cl.device_info.LOCAL_MEM_SIZE)
+        kernel_data = [LocalMemory('char', lambda workgroup_size: workgroup_size * local_mem_size // 4)]
+        self.assertEqual(get_workgroup_size(kernel_data, self._cl_environment, 16), 4)
+        self.assertRaises(ValueError, get_workgroup_size,
+                          [LocalMemory('char', local_mem_size + 1)], self._cl_environment, 16)
+
+        max_alloc_size = self._cl_environment.device.get_info(cl.device_info.MAX_MEM_ALLOC_SIZE)
+        global_mem_size = self._cl_environment.device.get_info(cl.device_info.GLOBAL_MEM_SIZE)
+        batch_size = get_batch_size([Zeros((10, 1000), 'double', host_accessible=False)], self._cl_environment, 1)
+        self.assertLessEqual(batch_size * 8000, min(max_alloc_size, global_mem_size))
+        self.assertGreater((batch_size + 1) * 8000, min(max_alloc_size, 0.8 * global_mem_size))
+
+    def test_check_local_memory(self):
+        local_mem_size = self._cl_environment.device.get_info(cl.device_info.LOCAL_MEM_SIZE)
+        self.assertRaises(ValueError, check_local_memory,
+                          [LocalMemory('char', local_mem_size + 1)], self._cl_environment, 1)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'data.npy')
+            np.save(path, np.arange(30, dtype=np.float64).reshape(10, 3))
+
+            # the memory requirements of lazily loaded sources are computed without reading the data
+            array = Array(np.load(path, mmap_mode='r'), 'mot_float_type', mode='r')
+            array.set_mot_float_dtype(np.float32)
+            check_local_memory([array], self._cl_environment, 1)
+            self.assertEqual(array.get_memory_requirements(1).bytes_per_instance, 3 * 4)
+            self.assertIsNone(array._data)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_auto_chunk_size(self):
+        func = get_scale_function()
+        x = np.arange(10, dtype=np.float32)
+        y = Zeros((10,), 'float')
+        func.evaluate({'x': Array(x, 'float'), 'y': y}, 10, max_chunk_size='auto')
+        np.testing.assert_allclose(y.get_data(), 2 * x)
+
+    def test_constant_memory(self):
+        func = SimpleCLFunction.from_string('''
+            void scale(global float* x, float* factors, global float* y){
+                *y = factors[1] * *x;
+            }
+        ''')
+        x = np.arange(10, dtype=np.float32)
+        factors = Array(np.array([1, 3], dtype=np.float32), 'float', mode='r', parallelize_over_first_dimension=False,
+                        allow_constant_memory=True)
+        self.assertEqual(plan_constant_memory([factors], [self._cl_environment]), [factors])
+        self.assertTrue(factors.with_constant_memory([factors]).in_constant_memory)
+
+        y = Zeros((10,), 'float')
+        func.evaluate({'x': Array(x, 'float'), 'factors': factors, 'y': y}, 10,
+                      cl_runtime_info=CLRuntimeInfo(cl_environments=[self._cl_environment]))
+        self.assertFalse(factors.in_constant_memory)
+        np.testing.assert_allclose(y.get_data(), 3 * x)
+
+        not_allowed = Array(np.array([1, 3], dtype=np.float32), 'float', mode='r',
+                            parallelize_over_first_dimension=False)
+        self.assertEqual(plan_constant_memory([not_allowed], [self._cl_environment]), [])
+
+        max_constant_size = self._cl_environment.device.get_info(cl.device_info.MAX_CONSTANT_BUFFER_SIZE)
+        too_large = Array(np.zeros(max_constant_size // 4 + 1, dtype=np.float32), 'float', mode='r',
+                          parallelize_over_first_dimension=False, allow_constant_memory=True)
+        self.assertEqual(plan_constant_memory([too_large], [self._cl_environment]), [])
+
+    def test_constant_memory_struct(self):
+        factors = Array(np.array([1, 3], dtype=np.float32), 'float', mode='r', parallelize_over_first_dimension=False,
+                        allow_constant_memory=True)
+        data = Struct({'factors': factors, 'x': Array(np.zeros((10, 2)), 'float')}, 'data')
+
+        placed = data.with_constant_memory([factors])
+        self.assertIsNot(placed, data)
+        self.assertTrue(placed['factors'].in_constant_memory)
+        self.assertFalse(factors.in_constant_memory)
+        self.assertIs(placed['x'], data['x'])
+        self.assertIs(data.with_constant_memory([]), data)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mot.configuration import CLRuntimeInfo
+from mot.lib.cl_environments import CLEnvironment, CLEnvironmentFactory
+from mot.lib.kernel_data import Array, Zeros
+from mot.lib.load_balancers import EvenDistribution, ThroughputBalancing, WorkStealing
+from tests.utils import get_scale_function
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_WorkStealing(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environments = CLEnvironmentFactory.smart_device_selection()[:1]
+
+    def test_chunks(self):
+        self.assertIsNone(EvenDistribution().get_chunks(self._cl_environments * 2, 1000))
+
+        chunks = WorkStealing(nmr_chunks_per_device=4, min_chunk_size=10).get_chunks(self._cl_environments * 2, 1000)
+        self.assertEqual(len(chunks), 8)
+        self.assertEqual(chunks[0], (0, 125))
+        self.assertEqual(chunks[-1][1], 1000)
+
+        chunks = WorkStealing(nmr_chunks_per_device=4, min_chunk_size=100).get_chunks(self._cl_environments, 150)
+        self.assertEqual(chunks, [(0, 100), (100, 150)])
+
+    def test_evaluate(self):
+        func = get_scale_function()
+        x = np.arange(1000, dtype=np.float32)
+        y = Zeros((1000,), 'float')
+
+        # two environments for the same device, such that the chunks are dispatched over two environments
+        env = self._cl_environments[0]
+        cl_environments = [CLEnvironment(env.platform, env.context, env.device) for _ in range(2)]
+        load_balancer = WorkStealing(nmr_chunks_per_device=8, min_chunk_size=10)
+        cl_runtime_info = CLRuntimeInfo(cl_environments=cl_environments, load_balancer=load_balancer)
+        func.evaluate({'x': Array(x, 'float'), 'y': y}, 1000, cl_runtime_info=cl_runtime_info)
+        np.testing.assert_allclose(y.get_data(), 2 * x)
+
+        bound = func.bind({'x': Array(x + 1, 'float'), 'y': y}, 1000, cl_runtime_info=cl_runtime_info)
+        for _ in range(2):
+            bound.launch()
+
+            # every environment starts with two chunks in flight, the remaining chunks go to the first to finish
+            problem_ranges = bound.get_problem_ranges()
+            self.assertEqual(set(problem_ranges), set(cl_environments))
+            for env_ranges in problem_ranges.values():
+                self.assertGreaterEqual(len(env_ranges), 2)
+            self.assertEqual(sorted(chunk for env_ranges in problem_ranges.values() for chunk in env_ranges),
+                             load_balancer.get_chunks(cl_environments, 1000))
+        np.testing.assert_allclose(y.get_data(), 2 * (x + 1))
+
+
+class test_ThroughputBalancing(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def test_division(self):
+        balancer = ThroughputBalancing(smoothing=0.5)
+        cl_environments = [self._cl_environment, self._cl_environment]
+        self.assertEqual(balancer.get_division(cl_environments, 100, kernel_name='kernel'), [(0, 50), (50, 100)])
+
+        balancer.add_timing(self._cl_environment, 'kernel', 100, 1)
+        balancer.add_timing(self._cl_environment, 'kernel', 300, 1)
+        self.assertEqual(balancer.get_throughput(self._cl_environment, 'kernel'), 200)
+        self.assertIsNone(balancer.get_throughput(self._cl_environment, 'other_kernel'))
+
+    def test_calibration_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            calibration_file = os.path.join(tmp_dir, 'calibration.json')
+            balancer = ThroughputBalancing(calibration_file=calibration_file)
+            balancer.add_timing(self._cl_environment, 'kernel', 100, 2)
+            self.assertFalse(os.path.exists(calibration_file))
+
+            balancer.save()
+            self.assertEqual(os.listdir(tmp_dir), ['calibration.json'])
+            self.assertEqual(ThroughputBalancing(calibration_file=calibration_file).get_throughput(
+                self._cl_environment, 'kernel'), 50)
+
+            with open(calibration_file, 'w') as f:
+                f.write('{"torn": ')
+            with self.assertLogs('mot.lib.load_balancers', level='WARNING'):
+                balancer = ThroughputBalancing(calibration_file=calibration_file)
+            self.assertIsNone(balancer.get_throughput(self._cl_environment, 'kernel'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_evaluate(self):
+        func = get_scale_function()
+        x = np.arange(100, dtype=np.float32)
+        y = Zeros((100,), 'float')
+
+        balancer = ThroughputBalancing()
+        cl_runtime_info = CLRuntimeInfo(cl_environments=[self._cl_environment], load_balancer=balancer)
+        self.assertTrue(cl_runtime_info.cl_environments[0].profiling)
+
+        func.evaluate({'x': Array(x, 'float'), 'y': y}, 100, cl_runtime_info=cl_runtime_info)
+        np.testing.assert_allclose(y.get_data(), 2 * x)
+
+        # the timings are reported when the evaluation waits on the completion of the kernels
+        self.assertGreater(balancer.get_throughput(self._cl_environment, 'kernel_scale'), 0)
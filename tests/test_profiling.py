@@ -0,0 +1,80 @@
+import logging
+import unittest
+
+import numpy as np
+
+from mot.configuration import CLRuntimeInfo
+from mot.lib.cl_environments import CLEnvironment
+from mot.lib.kernel_data import Array, Zeros
+from mot.lib.profiling import DeviceProfiler, get_device_statistics
+from tests.utils import get_scale_function
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_DeviceProfiler(unittest.TestCase):
+
+    def test_statistics(self):
+        events = [{'category': 'kernel', 'bytes': 0, 'queue_wait': 0.5, 'duration': 2},
+                  {'category': 'transfer', 'bytes': 100, 'queue_wait': 0, 'duration': 0.5},
+                  {'category': 'transfer', 'bytes': 300, 'queue_wait': 0, 'duration': 1.5}]
+        statistics = get_device_statistics(events)
+
+        self.assertEqual(statistics['nmr_kernels'], 1)
+        self.assertEqual(statistics['nmr_transfers'], 2)
+        self.assertEqual(statistics['kernel_time'], 2)
+        self.assertEqual(statistics['transfer_time'], 2)
+        self.assertEqual(statistics['queue_wait'], 0.5)
+        self.assertEqual(statistics['transfer_bandwidth'], 200)
+
+    def test_disabled(self):
+        self.assertIsNone(CLRuntimeInfo().profiler)
+        self.assertEqual(DeviceProfiler().get_report(), {})
+
+    def test_evaluate(self):
+        func = get_scale_function()
+        x = np.arange(100, dtype=np.float32)
+        y = Zeros((100,), 'float')
+
+        cl_runtime_info = CLRuntimeInfo(profiling=True)
+        self.assertTrue(all(env.profiling for env in cl_runtime_info.cl_environments))
+
+        for _ in range(2):
+            func.evaluate({'x': Array(x, 'float'), 'y': y}, 100, cl_runtime_info=cl_runtime_info)
+        np.testing.assert_allclose(y.get_data(), 2 * x)
+
+        profiler = cl_runtime_info.profiler
+        report = profiler.get_report()
+        self.assertGreaterEqual(sum(entry['nmr_kernels'] for entry in report.values()), 2)
+        self.assertGreaterEqual(sum(entry['kernel_time'] for entry in report.values()), 0)
+
+        call_reports = profiler.get_call_reports()
+        self.assertEqual([call['name'] for call in call_reports], ['kernel_scale', 'kernel_scale'])
+
+        self.assertIn('GB/s', profiler.format_report(per_call=True))
+        with self.assertLogs('mot.lib.profiling', level=logging.INFO):
+            profiler.log_report()
+
+        profiler.clear()
+        self.assertEqual(profiler.get_events(), [])
+
+    def test_bounded_records(self):
+        func = get_scale_function()
+        x = Array(np.arange(100, dtype=np.float32), 'float')
+        y = Zeros((100,), 'float')
+
+        profiler = DeviceProfiler(max_records=5)
+        cl_runtime_info = CLRuntimeInfo(cl_environments=[
+            CLEnvironment(env.platform, env.context, env.device, profiler=profiler)
+            for env in CLRuntimeInfo().cl_environments])
+
+        for _ in range(10):
+            func.evaluate({'x': x, 'y': y}, 100, cl_runtime_info=cl_runtime_info)
+
+        self.assertLessEqual(len(profiler.get_events()), 5)
+        self.assertLessEqual(len(profiler.get_call_reports()), 5)
+        self.assertEqual(profiler._pending, [])
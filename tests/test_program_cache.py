@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mot.lib.cl_environments import CLEnvironmentFactory
+from mot.configuration import get_program_binary_cache
+from mot.lib.program_cache import ProgramBinaryCache, ProgramCache, build_program, get_default_cache_dir, \
+    get_program_digest, get_source_digest
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+_kernel_source = '''
+    kernel void fill(global float* x){
+        x[get_global_id(0)] = 1;
+    }
+'''
+
+
+class test_ProgramBinaryCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = tempfile.mkdtemp()
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    def test_digests(self):
+        self.assertEqual(get_source_digest(_kernel_source), get_source_digest(_kernel_source))
+        self.assertNotEqual(get_program_digest(_kernel_source, self._cl_environment, ['-cl-mad-enable']),
+                            get_program_digest(_kernel_source, self._cl_environment, []))
+
+    def test_default_cache_dir(self):
+        self.assertIsNone(get_program_binary_cache())
+
+        old_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self._cache_dir
+        try:
+            self.assertEqual(get_default_cache_dir(), os.path.join(self._cache_dir, 'mot', 'cl_programs'))
+            self.assertEqual(ProgramBinaryCache().cache_dir, get_default_cache_dir())
+        finally:
+            if old_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = old_cache_home
+
+    def test_round_trip(self):
+        cache = ProgramBinaryCache(self._cache_dir)
+        self.assertIsNone(cache.load(_kernel_source, self._cl_environment, []))
+
+        build_program(_kernel_source, self._cl_environment, [], binary_cache=cache)
+        self.assertGreater(cache.get_size(), 0)
+
+        program = cache.load(_kernel_source, self._cl_environment, [])
+        self.assertIsNotNone(program)
+        self.assertEqual(program.fill.function_name, 'fill')
+
+    def test_eviction(self):
+        cache = ProgramBinaryCache(self._cache_dir, max_size=0)
+        build_program(_kernel_source, self._cl_environment, [], binary_cache=cache)
+        self.assertEqual(cache.get_size(), 0)
+
+    def test_corrupt_binary(self):
+        cache = ProgramBinaryCache(self._cache_dir)
+        path = os.path.join(self._cache_dir, get_program_digest(_kernel_source, self._cl_environment, []) + '.bin')
+        with open(path, 'wb') as f:
+            f.write(b'not a binary')
+
+        self.assertIsNone(cache.load(_kernel_source, self._cl_environment, []))
+        self.assertFalse(os.path.exists(path))
+
+
+class test_ProgramCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cl_environment = CLEnvironmentFactory.smart_device_selection()[0]
+
+    def test_shared_program(self):
+        cache = ProgramCache()
+        program = cache.get_program(_kernel_source, self._cl_environment, [])
+        self.assertIs(cache.get_program(_kernel_source, self._cl_environment, []), program)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_eviction(self):
+        cache = ProgramCache(max_size=1)
+        program = cache.get_program(_kernel_source, self._cl_environment, [])
+        cache.get_program(_kernel_source, self._cl_environment, ['-cl-mad-enable'])
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.get_program(_kernel_source, self._cl_environment, []), program)
+        self.assertEqual(cache.misses, 3)
+
+    def test_get_programs(self):
+        cache = ProgramCache()
+        futures = cache.get_programs(_kernel_source, [self._cl_environment], [], is_blocking=False)
+        program = futures[self._cl_environment].result()
+
+        programs = cache.get_programs(_kernel_source, [self._cl_environment], [])
+        self.assertIs(programs[self._cl_environment], program)
+        self.assertEqual(cache.misses, 1)
@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mot.configuration import get_tracer
+from mot.lib.kernel_data import Array, Zeros
+from mot.lib.tracing import RecordingTracer, tracing, trace_event, trace_phase
+from tests.utils import get_scale_function
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+class test_RecordingTracer(unittest.TestCase):
+
+    def test_no_tracer(self):
+        self.assertIsNone(get_tracer())
+        with trace_phase('phase') as metadata:
+            metadata['bytes'] = 10
+        trace_event('event')
+        self.assertIs(trace_phase('phase'), trace_phase('other_phase', bytes=10))
+
+    def test_exception(self):
+        with tracing() as tracer:
+            with self.assertRaises(ValueError):
+                with trace_phase('phase') as metadata:
+                    metadata['bytes'] = 10
+                    raise ValueError()
+        self.assertEqual(tracer.get_report()['phase']['bytes'], 10)
+
+    def test_report(self):
+        with tracing() as tracer:
+            for _ in range(2):
+                with trace_phase('phase', bytes=10):
+                    pass
+            trace_event('event')
+        self.assertIsNone(get_tracer())
+
+        report = tracer.get_report()
+        self.assertEqual(report['phase']['count'], 2)
+        self.assertEqual(report['phase']['bytes'], 20)
+        self.assertEqual(report['event']['count'], 1)
+        self.assertIn('phase', tracer.format_report())
+
+    def test_chrome_trace(self):
+        tracer = RecordingTracer()
+        with tracing(tracer):
+            with trace_phase('phase', device=object()):
+                pass
+            trace_event('event')
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'trace.json')
+            tracer.save_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual([e['ph'] for e in trace['traceEvents']], ['X', 'i'])
+
+    def test_evaluate(self):
+        func = get_scale_function()
+        x = np.arange(10, dtype=np.float32)
+        y = Zeros((10,), 'float')
+
+        with tracing() as tracer:
+            func.evaluate({'x': Array(x, 'float'), 'y': y}, 10)
+
+        report = tracer.get_report()
+        for phase in ['evaluate', 'convert_inputs', 'get_programs', 'launch', 'finish']:
+            self.assertIn(phase, report)
+        self.assertGreaterEqual(report['create_buffer']['bytes'], 2 * x.nbytes)
+        np.testing.assert_allclose(y.get_data(), 2 * x)
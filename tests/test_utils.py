@@ -4,7 +4,7 @@ import numpy as np
 import pyopencl as cl
 
 from mot.lib.utils import device_type_from_string, device_supports_double, is_scalar, \
-    all_elements_equal, get_single_value, topological_sort
+    all_elements_equal, get_single_value, topological_sort, split_cl_function
 
 __author__ = 'Robbert Harms'
 __date__ = "2017-03-28"
@@ -123,3 +123,16 @@ class test_topological_sort(unittest.TestCase):
     def test_empty_input(self):
         data = {}
         self.assertFalse(topological_sort(data))
+
+
+class test_split_cl_function(unittest.TestCase):
+
+    def test_memoized_results_are_copies(self):
+        func = 'double f(global float* x, int i){ return x[i]; }'
+        is_kernel, return_type, name, parameters, body = split_cl_function(func)
+        self.assertFalse(is_kernel)
+        self.assertEqual((return_type, name), ('double', 'f'))
+        self.assertEqual(parameters, ['global float* x', 'int i'])
+
+        parameters.append('int j')
+        self.assertEqual(split_cl_function(func)[3], ['global float* x', 'int i'])
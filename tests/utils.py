@@ -0,0 +1,23 @@
+"""Utilities shared by the tests."""
+from mot.lib.cl_function import SimpleCLFunction
+
+__author__ = 'Robbert Harms'
+__date__ = '2026-10-16'
+__maintainer__ = 'Robbert Harms'
+__email__ = 'robbert@xkls.nl'
+__licence__ = 'LGPL v3'
+
+
+def get_scale_function():
+    """Get a CL function writing twice its input to its output, for testing the processing of a simple kernel.
+
+    The function takes the parameters ``global float* x`` and ``global float* y``, one element per problem instance.
+
+    Returns:
+        mot.lib.cl_function.SimpleCLFunction: the CL function
+    """
+    return SimpleCLFunction.from_string('''
+        void scale(global float* x, global float* y){
+            *y = 2 * *x;
+        }
+    ''')